@@ -0,0 +1,314 @@
+"""
+End-to-end streaming benchmark: sensor loop -> UDP -> decode -> render.
+
+Runs the unmodified rc_main_nb.main() loop against the simulated sensor
+(sim/) on a background thread, receives its datagrams over loopback on the
+main thread and pushes every frame through the host paths of the viewers:
+
+    net        sendto() start on the brick -> datagram received on the host
+    receive    recvfrom_into() of a ready datagram
+    decode     FrameDecoder.decode()                     (both viewers)
+    smooth     FrameRing.push() + mean()                 (viewer.py)
+               in-place EMA                              (viewer3.py)
+    colormap   clip/normalise + cv2.resize/applyColorMap (both viewers,
+               numpy LUT fallback when OpenCV is missing)
+
+Each loop variant (LOOP_SLEEP_MS) is run for `--duration` seconds and
+reported as delivered frames/s, sensor-side misses, network drop rate,
+per-stage latency percentiles in microseconds and CPU time per frame.
+Results are written as JSON; pass a previous file to --compare to print
+the relative change of the headline numbers.
+
+    python bench_stream.py --duration 10 --out bench_stream.json
+    python bench_stream.py --compare bench_stream.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import select
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+import sim
+
+BENCH_PORT = 5105
+NEAR_MM, FAR_MM = 100, 2000
+DISPLAY_SIZE = 600
+SMOOTH_ALPHA = 0.3
+
+VARIANTS = {
+    # name: LOOP_SLEEP_MS, None = one ranging period (1000 // TOF_FREQ_HZ)
+    "sleep_period": None,
+    "poll_10ms": 10,
+}
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def percentiles(samples_us):
+    if not samples_us:
+        return None
+    a = np.asarray(samples_us, dtype=np.float64)
+    p50, p90, p99 = np.percentile(a, (50, 90, 99))
+    return {"n": int(a.size), "mean": round(float(a.mean()), 1), "p50": round(float(p50), 1),
+            "p90": round(float(p90), 1), "p99": round(float(p99), 1), "max": round(float(a.max()), 1)}
+
+
+class DeviceProbe:
+    """Wraps the packer / socket / sensor classes rc_main_nb uses to time them."""
+
+    def __init__(self, mod):
+        self.pack_us = []
+        self.send_us = []
+        self.send_failed = 0
+        self.pack_start = {}        # seq -> perf_counter at pack start
+        self.send_start = {}        # seq -> perf_counter before sendto
+        self.tof = None
+        self.cpu_s = 0.0
+        probe = self
+
+        base_packer = mod.FramePacker
+        base_sensor = mod.VL53L5CXMP
+        base_socket = socket.socket
+
+        class TimedPacker(base_packer):
+            def pack(self, distance_mm, tick_ms, res=None):
+                t0 = time.perf_counter()
+                seq = self.seq
+                buf = super().pack(distance_mm, tick_ms, res)
+                probe.pack_us.append((time.perf_counter() - t0) * 1e6)
+                probe.pack_start[seq] = t0
+                probe._last_seq = seq
+                return buf
+
+        class TimedSensor(base_sensor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                probe.tof = self
+
+        class TimedSocket(base_socket):
+            def sendto(self, data, *args):
+                t0 = time.perf_counter()
+                probe.send_start[probe._last_seq] = t0
+                try:
+                    return super().sendto(data, *args)
+                except OSError:
+                    probe.send_failed += 1
+                    raise
+                finally:
+                    probe.send_us.append((time.perf_counter() - t0) * 1e6)
+
+        self._last_seq = 0
+        mod.FramePacker = TimedPacker
+        mod.VL53L5CXMP = TimedSensor
+        self._restore = (mod, base_packer, base_sensor, base_socket)
+        socket.socket = TimedSocket
+
+    def restore(self):
+        mod, packer, sensor, sock = self._restore
+        mod.FramePacker = packer
+        mod.VL53L5CXMP = sensor
+        socket.socket = sock
+
+
+def run_device(mod, duration, probe, ready):
+    async def bounded():
+        try:
+            await asyncio.wait_for(mod.main(), duration)
+        except asyncio.TimeoutError:
+            pass
+
+    ready.set()
+    t0 = time.thread_time()
+    asyncio.run(bounded())
+    probe.cpu_s = time.thread_time() - t0
+
+
+def colormap(grid):
+    clipped = np.clip(grid, NEAR_MM, FAR_MM)
+    norm = ((FAR_MM - clipped) / (FAR_MM - NEAR_MM) * 255).astype(np.uint8)
+    if cv2 is not None:
+        img = cv2.resize(norm, (DISPLAY_SIZE, DISPLAY_SIZE), interpolation=cv2.INTER_NEAREST)
+        return cv2.applyColorMap(img, cv2.COLORMAP_JET)
+    # same work shape without OpenCV: nearest upscale + 256 entry LUT
+    scale = DISPLAY_SIZE // norm.shape[0]
+    img = norm.repeat(scale, 0).repeat(scale, 1)
+    return _LUT[img]
+
+
+_LUT = np.stack([np.arange(256), 255 - np.abs(np.arange(256) * 2 - 255), 255 - np.arange(256)],
+                axis=1).astype(np.uint8)
+
+
+def run_variant(name, loop_sleep_ms, duration, freq_hz):
+    from tof_decode import FrameDecoder
+    from tof_ring import FrameRing
+    import rc_main_nb as mod
+
+    mod.PORT = BENCH_PORT
+    mod.TOF_FREQ_HZ = freq_hz
+    mod.LOOP_SLEEP_MS = loop_sleep_ms if loop_sleep_ms is not None else 1000 // freq_hz
+    mod.ADAPTIVE_PROFILE = False    # keep the configured rate for the whole run
+
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    rx.bind(("0.0.0.0", BENCH_PORT))
+    rx.setblocking(False)
+
+    probe = DeviceProbe(mod)
+    ready = threading.Event()
+    device = threading.Thread(target=run_device, args=(mod, duration, probe, ready), daemon=True)
+
+    decoder = FrameDecoder(max_age_ms=None)
+    ring = FrameRing(5)
+    ema = np.full((8, 8), FAR_MM, dtype=np.float32)
+    buf = bytearray(2048)
+    stages = {k: [] for k in ("net", "receive", "decode", "smooth_ring", "smooth_ema", "colormap", "end_to_end")}
+    delivered = 0
+
+    device.start()
+    ready.wait()
+    cpu0 = time.process_time()
+    host_cpu0 = time.thread_time()
+    wall0 = time.perf_counter()
+    while device.is_alive() or wall0 + duration + 0.5 > time.perf_counter():
+        if not select.select([rx], [], [], 0.2)[0]:
+            if not device.is_alive():
+                break
+            continue
+        t0 = time.perf_counter()
+        n, addr = rx.recvfrom_into(buf)
+        t1 = time.perf_counter()
+        stages["receive"].append((t1 - t0) * 1e6)
+        frame = decoder.decode(bytes(buf[:n]), addr, t1)
+        t2 = time.perf_counter()
+        if frame is None:
+            continue
+        stages["decode"].append((t2 - t1) * 1e6)
+        ring.push(frame)
+        smooth = ring.mean()
+        t3 = time.perf_counter()
+        np.multiply(ema, 1 - SMOOTH_ALPHA, out=ema)
+        ema += SMOOTH_ALPHA * frame.distance
+        t4 = time.perf_counter()
+        colormap(smooth)
+        t5 = time.perf_counter()
+        stages["smooth_ring"].append((t3 - t2) * 1e6)
+        stages["smooth_ema"].append((t4 - t3) * 1e6)
+        stages["colormap"].append((t5 - t4) * 1e6)
+        delivered += 1
+
+        sent = probe.send_start.pop(frame.seq, None)
+        packed = probe.pack_start.pop(frame.seq, None)
+        if sent is not None:
+            stages["net"].append((t1 - sent) * 1e6)
+        if packed is not None:
+            stages["end_to_end"].append((t5 - packed) * 1e6)
+    wall = time.perf_counter() - wall0
+    host_cpu = time.thread_time() - host_cpu0
+    cpu = time.process_time() - cpu0
+    device.join()
+    probe.restore()
+    rx.close()
+
+    st = decoder.stats()
+    tof = probe.tof
+    produced = (tof.frames_read + tof.frames_missed) if tof else 0
+    return {
+        "loop_sleep_ms": mod.LOOP_SLEEP_MS,
+        "ranging_freq_hz": freq_hz,
+        "duration_s": round(wall, 3),
+        "frames_produced": produced,
+        "frames_read": tof.frames_read if tof else 0,
+        "frames_missed_by_loop": tof.frames_missed if tof else 0,
+        "frames_delivered": delivered,
+        "fps_delivered": round(delivered / wall, 2) if wall else 0.0,
+        "send_failures": probe.send_failed,
+        "net_drop_rate": round(st.loss_rate(), 4),
+        "end_to_end_drop_rate": round(1 - delivered / produced, 4) if produced else 0.0,
+        "link": st.as_dict(),
+        "cpu_us_per_frame": {
+            "process": round(cpu / delivered * 1e6, 1) if delivered else None,
+            "device_loop": round(probe.cpu_s / max(1, tof.frames_read if tof else 0) * 1e6, 1),
+            "host": round(host_cpu / delivered * 1e6, 1) if delivered else None,
+        },
+        "latency_us": {
+            "pack": percentiles(probe.pack_us),
+            "send": percentiles(probe.send_us),
+            **{k: percentiles(v) for k, v in stages.items()},
+        },
+    }
+
+
+def compare(old, new):
+    keys = ("fps_delivered", "end_to_end_drop_rate", "net_drop_rate")
+    for name, res in new["variants"].items():
+        prev = old.get("variants", {}).get(name)
+        if prev is None:
+            continue
+        print("[%s]" % name)
+        for key in keys:
+            print("  %-24s %10s -> %-10s" % (key, prev.get(key), res.get(key)))
+        for stage, cur in res["latency_us"].items():
+            before = prev.get("latency_us", {}).get(stage)
+            if cur and before and before["p50"]:
+                change = (cur["p50"] - before["p50"]) / before["p50"] * 100
+                print("  %-24s p50 %8.1f -> %8.1f us (%+.0f%%)" % (stage, before["p50"], cur["p50"], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ToF streaming benchmark (simulated sensor, loopback)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per variant")
+    parser.add_argument("--freq", type=int, default=20, help="ranging frequency in Hz")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--scene", default="sweep")
+    parser.add_argument("--read-cost-ms", type=float, default=3.0,
+                        help="simulated get_ranging_data() I2C time")
+    parser.add_argument("--send-fail-rate", type=float, default=0.0)
+    parser.add_argument("--out", default="bench_stream.json")
+    parser.add_argument("--compare", default=None, help="previous JSON result to compare against")
+    args = parser.parse_args()
+
+    sim.install(scene=args.scene, read_cost_ms=args.read_cost_ms,
+                send_fail_rate=args.send_fail_rate, noise_mm=4)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    results = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": getattr(cv2, "__version__", None),
+            "args": vars(args),
+        },
+        "variants": {},
+    }
+    for name in args.variants:
+        print("running %s for %.0f s..." % (name, args.duration))
+        res = run_variant(name, VARIANTS[name], args.duration, args.freq)
+        results["variants"][name] = res
+        print("  %.1f frames/s delivered, %d missed by loop, net drop %.2f%%, e2e p50 %s us" % (
+            res["fps_delivered"], res["frames_missed_by_loop"], res["net_drop_rate"] * 100,
+            (res["latency_us"]["end_to_end"] or {}).get("p50")))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results written to %s" % args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Non-blocking logging for hot loops on the bricks.
+
+ulogger formats and writes synchronously, and a TO_FILE handler means a
+flash write inside the ranging / servo loop. BufferedLogger only drops
+(level, ticks_ms, fmt, args) into a preallocated RAM ring; formatting and
+the real ulogger call happen in run(), a low priority uasyncio task. It
+formats the pending lines in small batches, yielding in between, and
+hands all of them to ulogger as one message (one flash write per pass,
+at the highest level of the batch, each line tagged with its own level).
+
+    log = BufferedLogger(logger)                # any ulogger.Logger
+    asyncio.create_task(log.run())
+    log.info("[SERVO] Set angle to %d", angle)  # no formatting here
+
+Messages are rate limited per format string: the same `fmt` is kept at
+most once per `every_ms` (default RATE_MS), the skipped ones are counted
+and reported with the next line that gets through. When the ring is full
+new messages are dropped and counted, the loop never waits for the log.
+"""
+
+import time
+
+import uasyncio as asyncio
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+RING_SIZE = 32
+RATE_MS = 1000              # same message at most once a second
+FLUSH_MS = 500
+FLUSH_BATCH = 4             # lines formatted per step before yielding
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+
+
+class BufferedLogger:
+    """ulogger.Logger front end, see the module docstring."""
+
+    def __init__(self, logger, level=INFO, size=RING_SIZE, every_ms=RATE_MS, flush_ms=FLUSH_MS):
+        self.logger = logger
+        self.level = level
+        self.every_ms = every_ms
+        self.flush_ms = flush_ms
+        self.dropped = 0                # ring full
+        self._levels = bytearray(size)
+        self._ticks = [0] * size
+        self._fmts = [None] * size
+        self._args = [None] * size
+        self._head = 0
+        self._count = 0
+        self._last = {}                 # fmt -> [ticks_ms of last kept, skipped since]
+        self._skipped = [0] * size
+        self._wake = asyncio.ThreadSafeFlag()
+
+    def log(self, level, fmt, *args):
+        if level < self.level:
+            return
+        now = time.ticks_ms()
+        skipped = 0
+        if level < ERROR and self.every_ms:
+            last = self._last.get(fmt)
+            if last is None:
+                self._last[fmt] = [now, 0]
+            elif time.ticks_diff(now, last[0]) < self.every_ms:
+                last[1] += 1
+                return
+            else:
+                skipped = last[1]
+                last[0] = now
+                last[1] = 0
+        size = len(self._levels)
+        if self._count == size:
+            self.dropped += 1
+            return
+        i = (self._head + self._count) % size
+        self._levels[i] = level
+        self._ticks[i] = now
+        self._fmts[i] = fmt
+        self._args[i] = args
+        self._skipped[i] = skipped
+        self._count += 1
+        if level >= ERROR:
+            self._wake.set()
+
+    def debug(self, fmt, *args):
+        self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        self.log(INFO, fmt, *args)
+
+    def warn(self, fmt, *args):
+        self.log(WARN, fmt, *args)
+
+    warning = warn
+
+    def error(self, fmt, *args):
+        self.log(ERROR, fmt, *args)
+
+    # -------------------- FLUSH TASK --------------------
+
+    def _format_one(self):
+        """Takes the oldest message off the ring, returns (level, line)."""
+        i = self._head
+        level = self._levels[i]
+        fmt = self._fmts[i]
+        args = self._args[i]
+        skipped = self._skipped[i]
+        self._fmts[i] = None
+        self._args[i] = None
+        self._head = (i + 1) % len(self._levels)
+        self._count -= 1
+
+        try:
+            msg = fmt % args if args else fmt
+        except (TypeError, ValueError):
+            msg = "%s %r" % (fmt, args)
+        if skipped:
+            msg = "%s (+%d similar)" % (msg, skipped)
+        return level, "%s %s" % (LEVEL_NAMES.get(level, "DEBUG"), msg)
+
+    def _write(self, level, lines):
+        # one ulogger call = one write for the whole batch
+        msg = "\n".join(lines)
+        logger = self.logger
+        if level >= ERROR:
+            logger.error(msg)
+        elif level >= WARN:
+            logger.warn(msg)
+        elif level >= INFO:
+            logger.info(msg)
+        else:
+            logger.debug(msg)
+
+    def _dropped_line(self, lines):
+        if self.dropped:
+            lines.append("WARN [LOG] %d messages dropped, ring full" % self.dropped)
+            self.dropped = 0
+            return WARN
+        return DEBUG
+
+    def flush(self):
+        """Writes everything out now (shutdown, before a reset)."""
+        lines = []
+        top = DEBUG
+        while self._count:
+            level, line = self._format_one()
+            lines.append(line)
+            top = max(top, level)
+        top = max(top, self._dropped_line(lines))
+        if lines:
+            self._write(top, lines)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for_ms(self._wake.wait(), self.flush_ms)
+            except asyncio.TimeoutError:
+                pass
+            lines = []
+            top = DEBUG
+            while self._count and len(lines) < len(self._levels):
+                for _ in range(FLUSH_BATCH):
+                    if not self._count:
+                        break
+                    level, line = self._format_one()
+                    lines.append(line)
+                    top = max(top, level)
+                # let the hot loops run between batches
+                await asyncio.sleep_ms(0)
+            top = max(top, self._dropped_line(lines))
+            if lines:
+                self._write(top, lines)
@@ -0,0 +1,36 @@
+"""
+Allocation free timing counters for the brick loops (MicroPython).
+
+    t = TimingStats()
+    t0 = time.ticks_us()
+    ...
+    t.add(time.ticks_diff(time.ticks_us(), t0))
+    print("read", t)        # read n=120 min=812 avg=845 max=1020 us
+"""
+
+
+class TimingStats:
+    """count / min / avg / max of microsecond samples."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def add(self, us):
+        if self.count == 0 or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += 1
+        self.total += us
+
+    def avg(self):
+        return self.total // self.count if self.count else 0
+
+    def __str__(self):
+        return "n=%d min=%d avg=%d max=%d us" % (self.count, self.min, self.avg(), self.max)
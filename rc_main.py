@@ -10,23 +10,28 @@ if '.frozen' in sys.path:
     sys.path.append('.frozen')
 
 import socket
-import struct
-from struct import pack_into
 import network
 
 from machine import SoftI2C, Pin
 from vl53l5cx.mp import VL53L5CXMP
-from vl53l5cx import RESOLUTION_8X8, DATA_DISTANCE_MM, TARGET_ORDER_CLOSEST
+from vl53l5cx import RESOLUTION_8X8, TARGET_ORDER_CLOSEST
 
 import rc_module
+from tof_proto import FramePacker, FIELD_DISTANCE, FIELD_STATUS, ranging_outputs
+from log_buffer import BufferedLogger
 
 BROADCAST_IP = "192.168.4.255"
 PORT = 5005
 TOF_RESOLUTION = RESOLUTION_8X8
+FIELDS = FIELD_DISTANCE | FIELD_STATUS   # extra ranging fields, see tof_proto.py
 
 async def main():
     
+    # flash writes of the TO_FILE handler happen here, off the ranging loop
+    asyncio.create_task(log.run())
+
     if rc_module.rc_slave_init() is False:
+        log.flush()
         return
     
     # WiFi AP
@@ -40,7 +45,7 @@ async def main():
     tof.resolution = TOF_RESOLUTION
     tof.ranging_freq = 10
     tof.target_order = TARGET_ORDER_CLOSEST
-    tof.start_ranging({DATA_DISTANCE_MM})
+    tof.start_ranging(ranging_outputs(FIELDS))
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setblocking(False)
@@ -49,8 +54,8 @@ async def main():
     broadcast_addr = (BROADCAST_IP, PORT)
 
     dist = [0] * TOF_RESOLUTION
-    buf = bytearray(TOF_RESOLUTION<<1)
-    pack_fmt = f"<{TOF_RESOLUTION}H"
+    packer = FramePacker(TOF_RESOLUTION, FIELDS)
+    buf = None      # nothing to send before the first frame
 
     while True:
         
@@ -59,14 +64,17 @@ async def main():
             d_mm = res.distance_mm
             for i in range(TOF_RESOLUTION):
                 dist[i] = d_mm[i]
-            pack_into(pack_fmt, buf, 0, *dist)
+            # resent with the same seq until the next frame, host drops repeats
+            buf = packer.pack(dist, time.ticks_ms(), res)
             
             
         
         try:
-            sock.sendto(buf, broadcast_addr)
-        except OSError:
-            pass
+            if buf is not None:
+                sock.sendto(buf, broadcast_addr)
+        except OSError as e:
+            # rate limited, a full TX queue must not turn into flash writes
+            log.warn("[NET] sendto failed: %s", e)
 
         await asyncio.sleep_ms(50)
 
@@ -115,7 +123,8 @@ if __name__ == "__main__":
                   'SOFT_RESET')
     }
 
-    logger.info("[MAIN]{}".format(rc2str.get(rst_c, str(rst_c))))
+    log = BufferedLogger(logger)
+    log.info("[MAIN]%s", rc2str.get(rst_c, str(rst_c)))
 
     
     asyncio.run(main())
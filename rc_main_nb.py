@@ -6,13 +6,22 @@ import uasyncio as asyncio
 import socket
 import network
 
-from machine import SoftI2C, Pin
-from struct import pack_into
+from machine import Pin
 
 from vl53l5cx.mp import VL53L5CXMP
-from vl53l5cx import RESOLUTION_8X8, DATA_DISTANCE_MM, TARGET_ORDER_CLOSEST
+from vl53l5cx import RESOLUTION_8X8, TARGET_ORDER_CLOSEST
 
 import rc_module
+from tof_proto import (
+    FramePacker, CONTROL_PORT, TELEMETRY_PORT, ranging_outputs,
+    FIELD_DISTANCE, FIELD_STATUS, FIELD_SIGMA, FIELD_SIGNAL, FIELD_TARGETS,
+)
+from tof_profile import ProfileController, open_control_socket, poll_control
+from tof_batch import FrameBatcher, BATCH_LATENCY, BATCH_THROUGHPUT
+from tof_telemetry import Telemetry, ROLE_TOF
+from tof_transport import FrameTransport, TRANSPORT_BROADCAST, TRANSPORT_SUBSCRIBE, TRANSPORT_MULTICAST
+from tof_boot import BootTimer, init_tof
+from tof_summary import Summarizer
 
 
 
@@ -22,6 +31,42 @@ PORT = 5005
 ZONE_COUNT = 64                  # 8x8
 TOF_RESOLUTION = RESOLUTION_8X8
 TOF_FREQ_HZ = 20             # ranging frequency
+LOOP_SLEEP_MS = None            # loop yield, None = one ranging period (see bench_stream.py)
+
+# VL53L5CX bus: hardware I2C at 1 MHz when it sees the sensor, else
+# SoftI2C at 400 kHz (tof_boot.py); None = always SoftI2C
+I2C_SDA = 3
+I2C_SCL = 2
+I2C_HW_ID = 0
+
+# Sent next to the distances, bit packed (tof_proto.py): FIELD_STATUS (4 bit),
+# FIELD_SIGMA, FIELD_SIGNAL (8 bit), FIELD_TARGETS (4 bit)
+FIELDS = FIELD_DISTANCE | FIELD_STATUS
+
+# Broadcast, or unicast / multicast to hosts that subscribed over CONTROL_PORT
+# (broadcast stays the fallback while nobody is subscribed, plus a 1 Hz
+# beacon while someone is), see tof_transport.py. Broadcast until the
+# viewers subscribe themselves, only tof_control.Subscription does so far
+TRANSPORT = TRANSPORT_BROADCAST
+
+# Several frames per datagram: None (off), BATCH_LATENCY or BATCH_THROUGHPUT
+BATCH_MODE = None
+
+# Edge summaries instead of frames (tof_summary.py): closest distance and
+# occupancy per sector, sent on change or heartbeat only; full frames on
+# demand with `tof_control.py <ip> frames N`
+SUMMARY_MODE = False
+SUMMARY_REGIONS = 4              # column strips, left to right
+SUMMARY_THRESHOLD_MM = 800       # occupied below this, or one per region
+SUMMARY_HEARTBEAT_MS = 1000
+
+# The rate always backs off on congestion (tof_profile.py), the host can
+# pin a profile over CONTROL_PORT either way (tof_control.py)
+ADAPTIVE_PROFILE = False         # True: also switch to 4x4@60 when close, back to the configured profile
+CONTROL_EVERY_MS = 200
+
+# Loop timings / counters to TELEMETRY_PORT (tof_monitor.py), None = off
+TELEMETRY_EVERY_MS = 5000
 
 
 
@@ -33,7 +78,9 @@ class Clock():  # simple time logger
         return "%d" % (time.time() - self.start)
 
 
-async def main():
+async def main(boot=None):
+
+    boot = boot or BootTimer()
 
     # RC init
     if rc_module.rc_slave_init() is False:
@@ -47,46 +94,108 @@ async def main():
         security=network.AUTH_WPA2_PSK
     )
 
-    # NOTE: Blocking here (one time init)
-    i2c = SoftI2C(
-        sda=Pin(3),
-        scl=Pin(2),
-        freq=400_000
-    )
-
-    tof = VL53L5CXMP(i2c)
-    tof.init()
+    # NOTE: Blocking here (one time firmware upload), the AP comes up meanwhile
+    tof = init_tof(VL53L5CXMP, I2C_SDA, I2C_SCL, boot, I2C_HW_ID)
     tof.resolution = TOF_RESOLUTION
     tof.ranging_freq = TOF_FREQ_HZ
     tof.target_order = TARGET_ORDER_CLOSEST
-    tof.start_ranging({DATA_DISTANCE_MM})
+    outputs = ranging_outputs(FIELDS)
+    tof.start_ranging(outputs)
 
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setblocking(False)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     broadcast_addr = (BROADCAST_IP, PORT)
-
-    # 64 zones * uint16 = 128 bytes
-    buf = bytearray(ZONE_COUNT * 2)
-    pack_fmt = f"<{ZONE_COUNT}H"
+    transport = FrameTransport(sock, broadcast_addr, TRANSPORT)
+
+    # 12 byte header + 64 zones * uint16 = 140 bytes, + 32 with FIELD_STATUS
+    packer = FramePacker(ZONE_COUNT, FIELDS)
+    batcher = FrameBatcher(*BATCH_MODE) if BATCH_MODE else None
+    # 12 byte header + 3 + 1 per region, FIELD_STATUS filters invalid zones
+    summary = None
+    if SUMMARY_MODE:
+        summary = Summarizer(ZONE_COUNT, SUMMARY_REGIONS, SUMMARY_THRESHOLD_MM, SUMMARY_HEARTBEAT_MS)
+    with_status = FIELDS & FIELD_STATUS
+
+    profile = ProfileController(tof, outputs, (ZONE_COUNT, TOF_FREQ_HZ), ADAPTIVE_PROFILE)
+    control = open_control_socket(CONTROL_PORT)
+    control_due = time.ticks_ms()
+
+    tel = Telemetry(ROLE_TOF, TELEMETRY_EVERY_MS or 5000)
+    t_read, t_pack, t_send, t_period = (tel.timer(n) for n in ("read", "pack", "send", "period"))
+    c_frames, c_fail, c_not_ready = (tel.counter(n) for n in ("frames", "send_fail", "not_ready"))
+    c_summaries, c_profile = tel.counter("summaries"), tel.counter("profile_changes")
+    telemetry_addr = (BROADCAST_IP, TELEMETRY_PORT)
+    last_us = time.ticks_us()
 
     while True:
 
+        t0 = time.ticks_us()
+        t_period.add(time.ticks_diff(t0, last_us))  # real loop period vs the sleep
+        last_us = t0
+
+        buf = None
         if tof.check_data_ready():
             res = tof.get_ranging_data()
-
-            pack_into(pack_fmt, buf, 0, *res.distance_mm)
-
+            t1 = time.ticks_us()
+            t_read.add(time.ticks_diff(t1, t0))
+            c_frames.n += 1
+
+            profile.observe(res.distance_mm)
+
+            now = time.ticks_ms()
+            if summary is None or summary.full_frames:
+                buf = packer.pack(res.distance_mm, now, res)
+                if summary is not None:
+                    summary.frame_sent()
+                if batcher is not None:
+                    buf = batcher.add(buf, now)
+            else:
+                # None unless something changed or the heartbeat is due
+                buf = summary.update(res.distance_mm, res.target_status if with_status else None, now)
+                if buf is not None:
+                    c_summaries.n += 1
+            t_pack.add(time.ticks_diff(time.ticks_us(), t1))
+        else:
+            c_not_ready.n += 1
+        if buf is None and batcher is not None:
+            buf = batcher.poll(time.ticks_ms())
+
+        if buf is not None:
+            t1 = time.ticks_us()
+            ok = transport.send(buf)
+            c_fail.n += transport.failed
+            profile.send_result(ok)
+            t_send.add(time.ticks_diff(time.ticks_us(), t1))
+            if not boot.done:
+                boot.first_frame()
+
+        now = time.ticks_ms()
+        if time.ticks_diff(now, control_due) >= 0:
+            control_due = time.ticks_add(now, CONTROL_EVERY_MS)
+            poll_control(control, profile, transport, summary=summary)
+            transport.expire(now)
+        if profile.update():
+            # queued batch frames keep their own header, only new ones change
+            packer.resize(profile.zones)
+            if summary is not None:
+                summary.resize(profile.zones)
+            c_profile.n += 1
+            print("[PROFILE]", profile)
+
+        if TELEMETRY_EVERY_MS and tel.due(now):
+            tel.collect()
             try:
-                sock.sendto(buf, broadcast_addr)
+                sock.sendto(tel.pack(now), telemetry_addr)
             except OSError:
                 pass
 
-        await asyncio.sleep_ms(1000 // TOF_FREQ_HZ) # basically the only yield (asincio.sleep)
+        await asyncio.sleep_ms(LOOP_SLEEP_MS or 1000 // profile.freq) # basically the only yield (asincio.sleep)
 
 if __name__ == "__main__":
 
+    boot = BootTimer()
     rst_c = machine.reset_cause()
 
     log_clock = Clock() # time logger
@@ -123,7 +232,7 @@ if __name__ == "__main__":
     )
 
     try:
-        asyncio.run(main())
+        asyncio.run(main(boot))
     except KeyboardInterrupt:
         print("Interrupted")
     finally:
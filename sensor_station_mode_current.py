@@ -6,13 +6,23 @@ import uasyncio as asyncio
 import socket
 import network
 
-from machine import SoftI2C, Pin
-from struct import pack_into
+from machine import Pin
 
 from vl53l5cx.mp import VL53L5CXMP
-from vl53l5cx import RESOLUTION_8X8, DATA_DISTANCE_MM, TARGET_ORDER_CLOSEST
+from vl53l5cx import RESOLUTION_8X8, TARGET_ORDER_CLOSEST
 
 import rc_module
+from tof_proto import (
+    FramePacker, CONTROL_PORT, TELEMETRY_PORT, ranging_outputs,
+    FIELD_DISTANCE, FIELD_STATUS, FIELD_SIGMA, FIELD_SIGNAL, FIELD_TARGETS,
+)
+from tof_delta import DeltaPacker
+from tof_ready import DataReady, MODE_IRQ, MODE_POLL
+from tof_profile import ProfileController, open_control_socket, poll_control
+from tof_telemetry import Telemetry, ROLE_TOF
+from tof_transport import FrameTransport, TRANSPORT_BROADCAST, TRANSPORT_SUBSCRIBE, TRANSPORT_MULTICAST
+from tof_boot import BootTimer, boot_station
+from tof_wifi import WifiSupervisor, FrameBacklog, BACKLOG_FRAMES
 
 
 # -------------------- CONSTANTS --------------------
@@ -20,46 +30,55 @@ import rc_module
 BROADCAST_IP = "192.168.100.255"
 PORT = 5005
 
+# Broadcast, or unicast / multicast to hosts that subscribed over CONTROL_PORT
+# (broadcast stays the fallback while nobody is subscribed, plus a 1 Hz
+# beacon while someone is), see tof_transport.py. Broadcast until the
+# viewers subscribe themselves, only tof_control.Subscription does so far
+TRANSPORT = TRANSPORT_BROADCAST
+
 ZONE_COUNT = 64                  # 8x8
 TOF_RESOLUTION = RESOLUTION_8X8
 TOF_FREQ_HZ = 20                 # stable & realistic
 
+# Sent next to the distances, bit packed (tof_proto.py): FIELD_STATUS (4 bit),
+# FIELD_SIGMA, FIELD_SIGNAL (8 bit), FIELD_TARGETS (4 bit)
+FIELDS = FIELD_DISTANCE | FIELD_STATUS
+
+# Keyframe + delta encoding, cuts airtime when the scene is mostly static
+DELTA_ENCODING = False
+KEYFRAME_INTERVAL = 20           # full frame every N frames (1 s at 20 Hz)
+DEADBAND_MM = 10                 # zone changes up to this are not sent
+
+# Data-ready: MODE_IRQ sleeps until the sensor INT pin fires,
+# MODE_POLL asks check_data_ready() over I2C every POLL_MS.
+# Polling until the INT wiring is confirmed on the brick (then MODE_IRQ, pin 4)
+DATA_READY_MODE = MODE_POLL
+TOF_INT_PIN = None               # VL53L5CX INT, None if not wired (forces polling)
+POLL_MS = 10
+READY_REPORT_EVERY = 200         # frames between latency reports
+
+# The rate always backs off on congestion (tof_profile.py), the host can
+# pin a profile over CONTROL_PORT either way (tof_control.py)
+ADAPTIVE_PROFILE = False         # True: also switch to 4x4@60 when close, back to the configured profile
+CONTROL_EVERY_MS = 200
+
+# Loop timings / counters to TELEMETRY_PORT (tof_monitor.py), None = off
+TELEMETRY_EVERY_MS = 5000
+
+# VL53L5CX bus: hardware I2C at 1 MHz when it sees the sensor, else
+# SoftI2C at 400 kHz (tof_boot.py); None = always SoftI2C
+I2C_SDA = 3
+I2C_SCL = 2
+I2C_HW_ID = 0
+
 WIFI_SSID = "HUAWEI-A94j-2G"
 WIFI_PASS = "uc5RR3k3"
+WIFI_TIMEOUT_MS = 30_000         # at boot, then ranging starts anyway and WifiSupervisor keeps trying
+BACKLOG = BACKLOG_FRAMES         # frames kept in RAM during an outage, sent after the reconnect
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
 
 
-def connect_wifi(timeout=30):
-    """
-    Connect to WiFi in station mode.
-    Returns the IP address if successful, None otherwise.
-    """
-    print("Activating WiFi...")
-    
-    
-    if not wlan.isconnected():
-        print(f"Connecting to {WIFI_SSID}...")
-        wlan.disconnect()
-        wlan.connect(WIFI_SSID, WIFI_PASS)
-
-        wait = timeout
-        while not wlan.isconnected() and wait > 0:
-            print(f"Waiting for connection... {wait}")
-            time.sleep(1)
-            wait -= 1
-
-    if wlan.isconnected():
-        ip = wlan.ifconfig()[0]
-        print(f"WiFi connected! IP: {ip}")
-        # extra delay to ensure DHCP routing is ready
-        time.sleep(1)
-        return ip
-    else:
-        print("Failed to connect to WiFi.")
-        return None
-
-
 
 # -------------------- LOGGER CLOCK --------------------
 
@@ -73,30 +92,26 @@ class Clock():
 
 # -------------------- MAIN ASYNC TASK --------------------
 
-async def main():
+async def main(boot):
 
     # RC init
-    print("here")
+    boot.begin("rc_init")
     if rc_module.rc_slave_init() is False:
         return
-    print("there")
+    boot.end("rc_init")
     
-    # -------------------- TOF SENSOR INIT --------------------
-    # NOTE: Blocking here is OK (one-time init)
-    i2c = SoftI2C(
-        sda=Pin(3),
-        scl=Pin(2),
-        freq=400_000
-    )
-    print("TOF obj")
-    tof = VL53L5CXMP(i2c)
-    print("TOF init")
-    tof.init()
-    print("TOF init done")
+    # -------------------- WIFI + TOF SENSOR INIT --------------------
+    # Association runs in the WiFi driver while tof.init() uploads the
+    # sensor firmware, the boot takes the longer of the two, not the sum
+    ip, tof = await boot_station(wlan, WIFI_SSID, WIFI_PASS, VL53L5CXMP, I2C_SDA, I2C_SCL, boot,
+                                 I2C_HW_ID, WIFI_TIMEOUT_MS)
+    if ip is None:
+        print("[WIFI] no link yet, ranging anyway, frames go to the backlog")
     tof.resolution = TOF_RESOLUTION
     tof.ranging_freq = TOF_FREQ_HZ
     tof.target_order = TARGET_ORDER_CLOSEST
-    tof.start_ranging({DATA_DISTANCE_MM})
+    outputs = ranging_outputs(FIELDS)
+    tof.start_ranging(outputs)
 
     # -------------------- UDP SOCKET --------------------
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -104,30 +119,112 @@ async def main():
     sock.bind(("0.0.0.0",0))
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     broadcast_addr = (BROADCAST_IP, PORT)
+    transport = FrameTransport(sock, broadcast_addr, TRANSPORT)
 
     # -------------------- BUFFERS --------------------
-    # 64 zones * uint16 = 128 bytes
-    buf = bytearray(ZONE_COUNT * 2)
-    pack_fmt = f"<{ZONE_COUNT}H"
+    # 12 byte header + 64 zones * uint16 = 140 bytes (+ extra FIELDS), deltas are smaller
+    if DELTA_ENCODING:
+        packer = DeltaPacker(ZONE_COUNT, KEYFRAME_INTERVAL, DEADBAND_MM, FIELDS)
+    else:
+        packer = FramePacker(ZONE_COUNT, FIELDS)
+    backlog = FrameBacklog(BACKLOG, len(packer.buf))
+
+    # -------------------- WIFI SUPERVISOR --------------------
+    # Reconnects with backoff in the background; a delta stream restarts
+    # with a keyframe so the host does not wait for the next one
+    wifi = WifiSupervisor(wlan, WIFI_SSID, WIFI_PASS,
+                          on_up=packer.force_keyframe if DELTA_ENCODING else None)
+    asyncio.create_task(wifi.run())
+
+    # -------------------- DATA READY --------------------
+    ready = DataReady(tof, DATA_READY_MODE, TOF_INT_PIN, TOF_FREQ_HZ, POLL_MS)
+    print("Data ready mode:", ready.mode)
+
+    # -------------------- PROFILE CONTROL --------------------
+    profile = ProfileController(tof, outputs, (ZONE_COUNT, TOF_FREQ_HZ), ADAPTIVE_PROFILE)
+    control = open_control_socket(CONTROL_PORT)
+    control_due = time.ticks_ms()
+
+    # -------------------- TELEMETRY --------------------
+    tel = Telemetry(ROLE_TOF, TELEMETRY_EVERY_MS or 5000)
+    t_read, t_pack, t_send, t_period = (tel.timer(n) for n in ("read", "pack", "send", "period"))
+    c_frames, c_fail = tel.counter("frames"), tel.counter("send_fail")
+    c_link_down, c_backlog_dropped = tel.counter("link_down"), tel.counter("backlog_dropped")
+    c_profile = tel.counter("profile_changes")
+    g_link, g_rssi, g_backlog = (tel.gauge(n) for n in ("link", "rssi", "backlog"))
+    outages = 0
+    telemetry_addr = (BROADCAST_IP, TELEMETRY_PORT)
+    last_us = time.ticks_us()
+
+    def send_backlog(data):
+        # backlog frames count like the direct sends
+        ok = transport.send(data)
+        c_fail.n += transport.failed
+        profile.send_result(ok)
+        return ok
 
     # -------------------- MAIN LOOP --------------------
     while True:
 
-        # ===== CRITICAL SECTION (NO await here) =====
-        if tof.check_data_ready():
-            res = tof.get_ranging_data()
+        # Sleeps until the next frame (INT IRQ or polling fallback)
+        await ready.wait()
 
-            # Pack directly into preallocated buffer
-            pack_into(pack_fmt, buf, 0, *res.distance_mm)
+        # ===== CRITICAL SECTION (NO await here) =====
+        t0 = time.ticks_us()
+        t_period.add(time.ticks_diff(t0, last_us))
+        last_us = t0
+        res = tof.get_ranging_data()
+        t1 = time.ticks_us()
+        c_frames.n += 1
+
+        # Pack directly into preallocated buffer (header + distances + FIELDS)
+        buf = packer.pack(res.distance_mm, time.ticks_ms(), res)
+        t2 = time.ticks_us()
+
+        # Send only when new data is available
+        # Network buffer full / WiFi busy shows up as ok=False
+        if wifi.up and not backlog.count:
+            profile.send_result(transport.send(buf))
+            c_fail.n += transport.failed
+        else:
+            # link down, or still draining the outage: keep the seq order
+            backlog.store(buf)
+            if wifi.up:
+                backlog.flush(send_backlog)
+        ready.sent()
+        t_send.add(time.ticks_diff(time.ticks_us(), t2))
+        t_pack.add(time.ticks_diff(t2, t1))
+        t_read.add(time.ticks_diff(t1, t0))
+        # ===== END CRITICAL SECTION =====
 
-            # Send only when new data is available
+        if not boot.done and wifi.up:
+            boot.first_frame()
+        profile.observe(res.distance_mm)
+        now = time.ticks_ms()
+        if time.ticks_diff(now, control_due) >= 0:
+            control_due = time.ticks_add(now, CONTROL_EVERY_MS)
+            poll_control(control, profile, transport)
+            transport.expire(now)
+        if profile.update():
+            # DeltaPacker.resize() also forces a keyframe
+            packer.resize(profile.zones)
+            ready.set_freq(profile.freq)
+            c_profile.n += 1
+            print("[PROFILE]", profile)
+
+        if TELEMETRY_EVERY_MS and tel.due(now):
+            g_link.n, g_rssi.n, g_backlog.n = wifi.state, wifi.rssi, backlog.count
+            c_link_down.n, outages = wifi.outages - outages, wifi.outages
+            c_backlog_dropped.n, backlog.dropped = backlog.dropped, 0
+            tel.collect()
             try:
-                sock.sendto(buf, broadcast_addr)
+                sock.sendto(tel.pack(now), telemetry_addr)
             except OSError:
-                # Network buffer full / WiFi busy
                 pass
-        # ===== END CRITICAL SECTION =====
-        await asyncio.sleep_ms(10)
+
+        if ready.latency.count >= READY_REPORT_EVERY:
+            print(ready.report())
+            ready.latency.reset()
         
 
         # Yield safely (gives time to WiFi + asyncio)
@@ -138,6 +235,7 @@ async def main():
 
 if __name__ == "__main__":
 
+    boot = BootTimer()
     rst_c = machine.reset_cause()
 
     log_clock = Clock()
@@ -172,13 +270,9 @@ if __name__ == "__main__":
             rc2str.get(rst_c, str(rst_c))
         )
     )
-    ip = connect_wifi()
-    if ip is None:
-        raise RuntimeError("Cannot continue without WiFi")
-    
     print("Starting main program...")
     try:
-        asyncio.run(main())
+        asyncio.run(main(boot))
     except KeyboardInterrupt:
         print("Interrupted")
     finally:
@@ -6,11 +6,27 @@ import time
 import ujson
 from machine import Pin, PWM
 import rc_module
+from servo_proto import (
+    CommandParser, AckPacker, is_binary, OP_SET, OP_WAYPOINTS, OP_MOVE,
+    FLAG_ACK, FLAG_DUTY, FLAG_APPEND, STATUS_OK, STATUS_BAD_CHANNEL,
+    STATUS_BAD_PACKET, STATUS_QUEUE_FULL, MAX_PACKET,
+)
+from servo_traj import TrajectoryPlayer
+from udp_async import readable
+from log_buffer import BufferedLogger
+from tof_proto import TELEMETRY_PORT
+from tof_telemetry import Telemetry, ROLE_SERVO
 
 SERVO_PIN = 3 
+SERVO_PINS = (SERVO_PIN,)   # binary protocol channel -> pin
 UDP_PORT = 5005
 AP_SSID = "Cyberbrick_AP"
 AP_KEY = "12345678"
+MAX_DRAIN = 16      # datagrams read per wake-up before yielding
+TELEMETRY_ADDR = ("192.168.4.255", TELEMETRY_PORT)   # tof_monitor.py, None = off
+TELEMETRY_EVERY_MS = 5000
+SESSION_IDLE_MS = 1500  # quiet this long = the next seq starts a new session
+MAX_REORDER = 256       # older by more than this = the client restarted its seq
 
 DUTY_MIN = 26   # 0 deg
 DUTY_MAX = 128  # 180 deg
@@ -22,6 +38,17 @@ def angle_to_duty(angle):
     duty = DUTY_MIN + (angle * (DUTY_MAX - DUTY_MIN) / 180)
     return int(duty)
 
+def tenths_to_duty(tenths):
+    """Same as angle_to_duty() for an angle in tenths of a degree, integer math."""
+    if tenths > 1800: tenths = 1800
+    return DUTY_MIN + tenths * (DUTY_MAX - DUTY_MIN) // 1800
+
+def duty_to_tenths(duty):
+    """Inverse of tenths_to_duty(), the position a raw FLAG_DUTY value puts the servo at."""
+    if duty <= DUTY_MIN: return 0
+    if duty >= DUTY_MAX: return 1800
+    return (duty - DUTY_MIN) * 1800 // (DUTY_MAX - DUTY_MIN)
+
 def prime_factors(n):
 
     factors = []
@@ -41,18 +68,77 @@ def prime_factors(n):
         factors.append(temp)
     return factors
 
+def stage_command(pending, parser, player):
+    """
+    OP_SET: stores the next duty per channel in `pending`, overwriting older
+    values (latest wins) and cancelling the channel's trajectory.
+    OP_WAYPOINTS / OP_MOVE: hands the segments to the trajectory player.
+    Returns (staged, status).
+    """
+    op = parser.op
+    if op != OP_SET and op != OP_WAYPOINTS and op != OP_MOVE:
+        return 0, STATUS_BAD_PACKET
+    duty = parser.flags & FLAG_DUTY
+    now = time.ticks_ms()
+    staged = 0
+    status = STATUS_OK
+    for i in range(parser.count):
+        ch = parser.channels[i]
+        if ch >= len(pending):
+            status = STATUS_BAD_CHANNEL
+            continue
+        v = parser.values[i]
+        if op == OP_SET:
+            pending[ch] = v if duty else tenths_to_duty(v)
+            # trajectories start from here, also after a raw duty
+            player.cancel(ch, duty_to_tenths(v) if duty else v)
+        else:
+            pending[ch] = -1
+            traj = player.channels[ch]
+            if op == OP_MOVE:
+                traj.move(v, parser.args[i], parser.args2[i], now)
+            else:
+                # later waypoints of the same channel in this packet always append
+                append = parser.flags & FLAG_APPEND
+                for j in range(i):
+                    if parser.channels[j] == ch:
+                        append = True
+                if not traj.add_waypoint(v, parser.args[i], now, append):
+                    status = STATUS_QUEUE_FULL
+                    continue
+        staged += 1
+    return staged, status
+
+def is_older(seq, last):
+    """seq was sent before last (16 bit wrap aware), within MAX_REORDER."""
+    return ((last - seq) & 0xFFFF) - 1 < MAX_REORDER
+
 # --- ASYNCHRONOUS TASKS ---
 
+async def telemetry_task(sock, tel):
+    """Sends the listener's counters / timings every TELEMETRY_EVERY_MS."""
+    while True:
+        await uasyncio.sleep_ms(TELEMETRY_EVERY_MS)
+        tel.collect()
+        try:
+            sock.sendto(tel.pack(time.ticks_ms()), TELEMETRY_ADDR)
+        except OSError:
+            pass
+
 async def servo_udp_task():
-    logger = ulogger.Logger()
-    logger.info(f"[SERVO] Listener started on Pin {SERVO_PIN}")
+    # Formatting + writes happen in a low priority task, not per command
+    logger = BufferedLogger(ulogger.Logger())
+    uasyncio.create_task(logger.run())
+    logger.info("[SERVO] Listener started on Pin %d", SERVO_PIN)
     
     # Setup 
     try:
-        servo = PWM(Pin(SERVO_PIN), freq=50)
-        servo.duty(angle_to_duty(90))  # Center the servo 
+        servos = [PWM(Pin(pin), freq=50) for pin in SERVO_PINS]
+        for s in servos:
+            s.duty(angle_to_duty(90))  # Center the servo 
     except Exception as e:
-        logger.error(f"[SERVO] PWM Fail: {e}")
+        logger.error("[SERVO] PWM Fail: %s", e)
+        logger.flush()
         return
 
     # Setup Socket
@@ -60,21 +146,88 @@ async def servo_udp_task():
     sock.bind(('0.0.0.0', UDP_PORT))
     sock.setblocking(False)  
     
+    # Binary protocol state, allocated once
+    parser = CommandParser()
+    acker = AckPacker()
+
+    # Waypoints / moves are interpolated locally at the PWM rate
+    player = TrajectoryPlayer(servos, tenths_to_duty, start=900)
+    uasyncio.create_task(player.run())
+
+    # Counters / timings, allocation free
+    tel = Telemetry(ROLE_SERVO, TELEMETRY_EVERY_MS)
+    t_drain, t_apply = tel.timer("drain"), tel.timer("apply")
+    c_packets, c_stale = tel.counter("packets"), tel.counter("stale")
+    c_acks, c_fail = tel.counter("acks"), tel.counter("send_fail")
+    if TELEMETRY_ADDR:
+        uasyncio.create_task(telemetry_task(sock, tel))
+
+    pending = [-1] * len(servos)   # next duty per channel, -1 = nothing new
+    last_seq = None                 # newest binary seq applied ...
+    last_addr = None                # ... and who sent it
+    last_rx_ms = 0                  # ... and when
+    ack_addr = None                 # newest ack request of the current drain
+    ack_seq = 0
+    ack_staged = 0
+    ack_status = STATUS_OK
+    batch = 0                       # binary commands staged since the last ack
+    stale = 0                       # reordered / duplicate commands dropped
 
     while True:
-        try:
-            # recvfrom - receive data and sender address from socket
-            data, addr = sock.recvfrom(64)
-            msg = data.decode().strip()
-            
+        # Sleep until a datagram is pending, no fixed poll interval
+        await readable(sock)
+        t0 = time.ticks_us()
+
+        # Drain everything that queued up, stage only the newest per channel
+        for _ in range(MAX_DRAIN):
+            try:
+                data, addr = sock.recvfrom(MAX_PACKET)
+            except OSError as e:
+                if e.args[0] != 11:  # errno 11 is EAGAIN/EWOULDBLOCK
+                    logger.error("[SOCKET] Error: %s", e)
+                break
+            c_packets.n += 1
+
+            if is_binary(data):
+                # seq + several (channel, angle) pairs, optional binary ack
+                if parser.parse(data, len(data)) < 0:
+                    logger.warn("[RX] Malformed servo packet (%d bytes)", len(data))
+                    continue
+                now = time.ticks_ms()
+                if (addr == last_addr and is_older(parser.seq, last_seq)
+                        and time.ticks_diff(now, last_rx_ms) < SESSION_IDLE_MS):
+                    # reordered on the way or a re-send, a newer position is already set
+                    stale += 1
+                    c_stale.n += 1
+                    if parser.flags & FLAG_ACK and ack_addr is None:
+                        # the ack may be what got lost, the newest seq covers it
+                        ack_addr, ack_seq, ack_staged, ack_status = addr, last_seq, 0, STATUS_OK
+                    continue
+                last_seq, last_addr, last_rx_ms = parser.seq, addr, now
+                staged, status = stage_command(pending, parser, player)
+                if parser.flags & FLAG_ACK:
+                    if ack_addr is not None and ack_addr != addr:
+                        # two hosts in one drain, settle the first one
+                        try:
+                            sock.sendto(acker.pack(ack_seq, ack_staged, batch - 1 + stale, ack_status), ack_addr)
+                            c_acks.n += 1
+                        except OSError:
+                            c_fail.n += 1
+                        batch = stale = 0
+                    ack_addr, ack_seq, ack_staged, ack_status = addr, parser.seq, staged, status
+                batch += 1
+                continue
+
             angle = None
             try:
+                msg = data.decode().strip()
                 angle = int(msg)
                 
                 # 1. Control Servo
                 if 0 <= angle <= 180:
-                    servo.duty(angle_to_duty(angle))
-                    logger.info(f"[SERVO] Set angle to {angle}")
+                    pending[0] = angle_to_duty(angle)
+                    player.cancel(0, angle * 10)
+                    logger.info("[SERVO] Set angle to %d", angle)
                 
                 # 2. Calculate and Send Prime Factors Back
                 factors = prime_factors(angle)
@@ -84,21 +237,38 @@ async def servo_udp_task():
                 response_json = ujson.dumps(response_data)
                 
                 # Send the response back to the sender's address (addr)
-                sock.sendto(response_json.encode(), addr)
-                logger.info(f"[PRIME] Sent factors for {angle}: {factors}")
+                try:
+                    sock.sendto(response_json.encode(), addr)
+                    logger.info("[PRIME] Sent factors for %d: %s", angle, factors)
+                except OSError:
+                    # ENOMEM / EAGAIN, the listener must keep running
+                    c_fail.n += 1
                 
+            except UnicodeError:
+                # neither a binary command nor text, the listener keeps running
+                logger.warn("[RX] Received %d undecodable bytes", len(data))
             except ValueError:
-                logger.warn(f"[RX] Received non-integer data: {msg}")
+                logger.warn("[RX] Received non-integer data: %s", msg)
                 pass
-                
-        except OSError as e:
-            if e.args[0] == 11:  # errno 11 is EAGAIN/EWOULDBLOCK
-                pass
-            else:
-                logger.error(f"[SOCKET] Error: {e}")
-                
-        # Yield to allow other tasks to run
-        await uasyncio.sleep_ms(20)
+
+        # Apply the newest position of every channel once
+        t1 = time.ticks_us()
+        for ch in range(len(servos)):
+            if pending[ch] >= 0:
+                servos[ch].duty(pending[ch])
+                pending[ch] = -1
+        t_apply.add(time.ticks_diff(time.ticks_us(), t1))
+
+        # One cumulative ack covers every command coalesced into it
+        if ack_addr is not None:
+            try:
+                sock.sendto(acker.pack(ack_seq, ack_staged, batch - 1 + stale, ack_status), ack_addr)
+                c_acks.n += 1
+            except OSError:
+                c_fail.n += 1
+            ack_addr = None
+        batch = stale = 0
+        t_drain.add(time.ticks_diff(time.ticks_us(), t0))
 
 async def run_master_mode():
     logger = ulogger.Logger()
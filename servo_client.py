@@ -0,0 +1,357 @@
+"""
+Asyncio client for the binary servo protocol (servo_proto.py).
+
+Commands are pipelined: up to `window` of them are in flight at once and
+matched to the brick's acks by sequence number. Acks are cumulative per
+channel: the brick keeps only the newest value of a channel, so an ack
+settles every earlier command whose channels the acked one all covers;
+an earlier command for another channel still needs its own ack. Commands without an ack in `timeout`
+seconds are re-sent up to `retries` times before they count as lost.
+
+    async with ServoClient("192.168.4.1") as servo:
+        await servo.set([(0, 90), (1, 45)])         # waits for the ack
+        await servo.stream(sweep([0]), rate_hz=50, duration=5)
+        print(servo.stats)
+
+Streamed positions are never retried, the next tick supersedes them.
+
+    python servo_client.py 192.168.4.1 set 0:90 1:45
+    python servo_client.py 192.168.4.1 move 0:180 --vmax 120 --amax 360
+    python servo_client.py 192.168.4.1 sweep --rate 50 --duration 10
+
+servo_motor_controll_through_AP.py stays the interactive text client.
+"""
+
+import argparse
+import asyncio
+import math
+import socket
+import time
+
+from servo_proto import CommandParser, pack_command, pack_waypoints, pack_move, unpack_ack, STATUS_OK
+
+ESP_IP = "192.168.4.1"
+ESP_PORT = 5005
+
+DEFAULT_WINDOW = 8
+DEFAULT_TIMEOUT_S = 0.1
+DEFAULT_RETRIES = 2
+
+
+def seq_newer(a, b):
+    """a was sent after b (16 bit wrap aware)."""
+    return 0 < ((a - b) & 0xFFFF) < 0x8000
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+class ServoStats:
+    """Link counters and RTT samples (seconds) of one client."""
+
+    def __init__(self):
+        self.sent = 0           # commands, not counting re-sends
+        self.resent = 0
+        self.acked = 0
+        self.coalesced = 0      # acked as part of a newer command's ack
+        self.lost = 0           # gave up after the retries
+        self.rtt = []
+
+    def loss_rate(self):
+        done = self.acked + self.lost
+        return self.lost / done if done else 0.0
+
+    def rtt_ms(self):
+        """dict of RTT percentiles in ms (only first transmissions are sampled)."""
+        s = sorted(self.rtt)
+        out = {"n": len(s)}
+        for q in (50, 90, 99, 100):
+            v = percentile(s, q)
+            out["p%d" % q if q < 100 else "max"] = None if v is None else round(v * 1000, 2)
+        return out
+
+    def __str__(self):
+        return "sent=%d resent=%d acked=%d coalesced=%d lost=%d (%.1f%%) rtt %s" % (
+            self.sent, self.resent, self.acked, self.coalesced, self.lost,
+            self.loss_rate() * 100, self.rtt_ms())
+
+
+class _Pending:
+    __slots__ = ("seq", "data", "channels", "future", "sent_at", "tries", "retries", "timer")
+
+    def __init__(self, seq, data, channels, future, retries):
+        self.seq = seq
+        self.data = data
+        self.channels = channels
+        self.future = future
+        self.sent_at = 0.0
+        self.tries = 0
+        self.retries = retries
+        self.timer = None
+
+
+class _Protocol(asyncio.DatagramProtocol):
+
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._on_datagram(data)
+
+    def error_received(self, exc):
+        # e.g. ICMP port unreachable while the brick boots, retries cover it
+        pass
+
+
+class ServoClient:
+    """Pipelined servo commands over UDP, see the module docstring."""
+
+    def __init__(self, host=ESP_IP, port=ESP_PORT, window=DEFAULT_WINDOW,
+                 timeout=DEFAULT_TIMEOUT_S, retries=DEFAULT_RETRIES):
+        self.target = (host, port)
+        self.timeout = timeout
+        self.retries = retries
+        self.stats = ServoStats()
+        self._window_size = window
+        self._window = None
+        self._seq = 0
+        self._inflight = {}
+        self._parser = CommandParser()
+        self._last_acked = None     # newest acked command, stale re-sends are acked with it
+        self._transport = None
+        self._loop = None
+
+    # -------------------- LIFECYCLE --------------------
+
+    async def connect(self):
+        self._loop = asyncio.get_running_loop()
+        self._window = asyncio.Semaphore(self._window_size)
+        self._transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _Protocol(self), remote_addr=self.target, family=socket.AF_INET)
+        return self
+
+    def close(self):
+        for p in list(self._inflight.values()):
+            p.future.cancel()               # future.cancelled() for whoever awaits it
+            self._settle(p)
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    # -------------------- COMMANDS --------------------
+
+    async def submit(self, entries, duty=False, retries=None):
+        """
+        Sends one command once the window has room and returns a future of
+        its ack (seq, applied, coalesced, status), TimeoutError when lost.
+        """
+        return await self._submit(lambda seq: pack_command(seq, entries, ack=True, duty=duty), retries)
+
+    async def _submit(self, build, retries=None):
+        await self._window.acquire()
+        seq = self._seq
+        try:
+            data = build(seq)
+        except Exception:
+            self._window.release()
+            raise
+        self._seq = (seq + 1) & 0xFFFF
+        parser = self._parser
+        parser.parse(data, len(data))
+        p = _Pending(seq, data, frozenset(parser.channels[:parser.count]), self._loop.create_future(),
+                     self.retries if retries is None else retries)
+        self._inflight[seq] = p
+        self.stats.sent += 1
+        self._transmit(p)
+        return p.future
+
+    async def set(self, entries, duty=False):
+        """Sends one command and waits for its ack."""
+        return await (await self.submit(entries, duty))
+
+    async def waypoints(self, waypoints, append=False):
+        """
+        Queues (channel, degrees, dt_ms) waypoints the brick interpolates
+        itself, waits for the ack. Send the next batch with append=True
+        before the current one runs out.
+        """
+        return await (await self._submit(lambda seq: pack_waypoints(seq, waypoints, True, append)))
+
+    async def move(self, moves):
+        """(channel, degrees, vmax deg/s, amax deg/s^2) trapezoidal moves, waits for the ack."""
+        return await (await self._submit(lambda seq: pack_move(seq, moves, True)))
+
+    def send(self, entries, duty=False):
+        """Fire and forget, no ack requested, does not use the window."""
+        seq = self._seq
+        self._seq = (seq + 1) & 0xFFFF
+        self._transport.sendto(pack_command(seq, entries, ack=False, duty=duty))
+        self.stats.sent += 1
+        return seq
+
+    async def stream(self, trajectory, rate_hz, duty=False, duration=None):
+        """
+        Sends one command per tick at a fixed rate. `trajectory` is an
+        iterable of entry lists or a function t -> entries (t in seconds).
+        A full window delays the next tick instead of queueing more.
+        """
+        loop = self._loop
+        period = 1.0 / rate_hz
+        t0 = next_t = loop.time()
+        points = None if callable(trajectory) else iter(trajectory)
+        while duration is None or next_t - t0 < duration:
+            if points is None:
+                entries = trajectory(next_t - t0)
+            else:
+                entries = next(points, None)
+                if entries is None:
+                    break
+            fut = await self.submit(entries, duty, retries=0)
+            fut.add_done_callback(_ignore_result)
+            next_t += period
+            delay = next_t - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_t = loop.time()    # fell behind, do not burst
+        await self.flush()
+
+    async def flush(self, timeout=None):
+        """Waits until every in-flight command is acked or lost."""
+        futures = [p.future for p in self._inflight.values()]
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+    # -------------------- INTERNALS --------------------
+
+    def _transmit(self, p):
+        if p.tries:
+            self.stats.resent += 1
+        p.tries += 1
+        p.sent_at = time.perf_counter()
+        self._transport.sendto(p.data)
+        p.timer = self._loop.call_later(self.timeout, self._expire, p)
+
+    def _expire(self, p):
+        if self._inflight.get(p.seq) is not p:
+            return
+        if p.tries <= p.retries:
+            self._transmit(p)
+        else:
+            self.stats.lost += 1
+            self._settle(p, exc=asyncio.TimeoutError("servo command %d not acked" % p.seq))
+
+    def _settle(self, p, result=None, exc=None):
+        del self._inflight[p.seq]
+        if p.timer is not None:
+            p.timer.cancel()
+        if not p.future.done():
+            if exc is not None:
+                p.future.set_exception(exc)
+            else:
+                p.future.set_result(result)
+        self._window.release()
+
+    def _on_datagram(self, data):
+        ack = unpack_ack(data)
+        if ack is None:
+            return
+        now = time.perf_counter()
+        seq = ack[0]
+        acked = self._inflight.get(seq)
+        if acked is not None:
+            if acked.tries == 1:
+                # re-sent commands would mix up which copy got acked
+                self.stats.rtt.append(now - acked.sent_at)
+            self.stats.acked += 1
+            self._settle(acked, ack)
+            if self._last_acked is None or seq_newer(seq, self._last_acked.seq):
+                self._last_acked = acked
+        elif self._last_acked is not None and self._last_acked.seq == seq:
+            acked = self._last_acked
+        if acked is not None:
+            # latest wins per channel on the brick: an older command is
+            # superseded only if the acked one set all of its channels
+            for p in [p for p in self._inflight.values()
+                      if seq_newer(seq, p.seq) and p.channels <= acked.channels]:
+                self.stats.coalesced += 1
+                self.stats.acked += 1
+                self._settle(p, ack)
+
+
+def _ignore_result(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+
+def sweep(channels, low=0.0, high=180.0, period_s=2.0):
+    """Trajectory function: all `channels` follow a sine between low and high."""
+    mid, amp = (low + high) / 2, (high - low) / 2
+
+    def at(t):
+        angle = mid + amp * math.sin(2 * math.pi * t / period_s)
+        return [(ch, angle) for ch in channels]
+    return at
+
+
+async def _main(args):
+    async with ServoClient(args.host, args.port, args.window, args.timeout, args.retries) as servo:
+        if args.cmd == "set":
+            entries = []
+            for item in args.entries:
+                ch, _, angle = item.partition(":")
+                entries.append((int(ch), float(angle)))
+            try:
+                seq, applied, coalesced, status = await servo.set(entries)
+                print("ack seq=%d applied=%d%s" % (
+                    seq, applied, "" if status == STATUS_OK else " status=%d" % status))
+            except asyncio.TimeoutError as e:
+                print("-> Error: %s" % e)
+        elif args.cmd == "move":
+            moves = []
+            for item in args.entries:
+                ch, _, angle = item.partition(":")
+                moves.append((int(ch), float(angle), args.vmax, args.amax))
+            print("ack", await servo.move(moves))
+        else:
+            await servo.stream(sweep(args.channels), args.rate, duration=args.duration)
+        print(servo.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary servo client")
+    parser.add_argument("host", help="brick IP address, e.g. %s" % ESP_IP)
+    parser.add_argument("--port", type=int, default=ESP_PORT)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S)
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("set", help="set channels, e.g. 0:90 1:45")
+    p.add_argument("entries", nargs="+")
+
+    p = sub.add_parser("move", help="trapezoidal move interpolated on the brick, e.g. 0:180")
+    p.add_argument("entries", nargs="+")
+    p.add_argument("--vmax", type=float, default=120.0, help="deg/s")
+    p.add_argument("--amax", type=float, default=360.0, help="deg/s^2")
+
+    p = sub.add_parser("sweep", help="stream a sine sweep and report RTT / loss")
+    p.add_argument("--channels", type=int, nargs="+", default=[0])
+    p.add_argument("--rate", type=float, default=50.0)
+    p.add_argument("--duration", type=float, default=10.0)
+
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Binary servo command protocol.
+
+Shared by the servo brick (MicroPython) and the host clients (CPython),
+keep it free of numpy, typing and anything else MicroPython does not ship.
+
+Every datagram starts with a fixed 8 byte little-endian header:
+
+    offset  size  field
+    0       2     magic     0x5653 ("SV" on the wire)
+    2       1     version   VERSION
+    3       1     op        OP_* - what follows the header
+    4       1     flags     FLAG_* bit mask
+    5       2     seq       per-client sequence number, wraps at 0xFFFF
+    7       1     count     number of entries in the payload
+
+OP_SET payload: `count` x (uint8 channel, uint16 value). The value is an
+angle in tenths of a degree (0..1800), or a raw PWM duty with FLAG_DUTY.
+All channels of one packet are applied together, so several servos at
+50 Hz cost one small datagram per tick.
+
+Trajectories, interpolated on the brick (servo_traj.py), angles always in
+tenths of a degree:
+
+    OP_WAYPOINTS  `count` x (uint8 channel, uint16 angle, uint16 dt_ms):
+                  reach angle dt_ms after the previous waypoint, linearly.
+                  Replaces the channel's queue unless FLAG_APPEND is set.
+    OP_MOVE       `count` x (uint8 channel, uint16 angle, uint16 vmax deg/s,
+                  uint16 amax deg/s^2): trapezoidal move from rest.
+
+OP_ACK (brick -> host, only when the command had FLAG_ACK):
+
+    count      channels applied
+    payload    uint8 coalesced: older commands superseded by this one
+               uint8 status: STATUS_*
+
+Acks are cumulative per channel: the brick drains every pending packet,
+applies only the newest value per channel and acks the newest seq that
+asked for one, so an ack for seq N settles every earlier command whose
+channels are all set by command N as well (not ones for other channels,
+they may have been lost).
+
+The brick still accepts the old decimal ASCII angle per datagram (anything
+that does not start with MAGIC) and answers those with JSON.
+"""
+
+from struct import pack_into, unpack_from
+
+MAGIC = 0x5653
+VERSION = 1
+
+HEADER_FMT = "<HBBBHB"
+HEADER_SIZE = 8
+ENTRY_SIZE = 3              # OP_SET
+
+# ops
+OP_SET = 0
+OP_ACK = 1
+OP_WAYPOINTS = 2
+OP_MOVE = 3
+
+ENTRY_SIZES = {OP_SET: 3, OP_WAYPOINTS: 5, OP_MOVE: 7}
+
+# flags
+FLAG_ACK = 0x01         # reply with OP_ACK
+FLAG_DUTY = 0x02        # values are raw duty, not tenths of a degree
+FLAG_APPEND = 0x04      # OP_WAYPOINTS: queue after the current ones
+
+# ack status
+STATUS_OK = 0
+STATUS_BAD_CHANNEL = 1  # at least one channel does not exist, the rest applied
+STATUS_BAD_PACKET = 2
+STATUS_QUEUE_FULL = 3   # OP_WAYPOINTS: waypoints beyond the queue size were dropped
+
+MAX_ENTRIES = 16
+MAX_PACKET = HEADER_SIZE + MAX_ENTRIES * ENTRY_SIZES[OP_MOVE]
+ACK_SIZE = HEADER_SIZE + 2
+
+
+def pack_header(buf, offset, op, flags, seq, count):
+    pack_into(HEADER_FMT, buf, offset, MAGIC, VERSION, op, flags, seq & 0xFFFF, count)
+
+
+def is_binary(data):
+    """True for datagrams of this protocol, False for the legacy text angles."""
+    return len(data) >= HEADER_SIZE and data[0] == (MAGIC & 0xFF) and data[1] == (MAGIC >> 8)
+
+
+class CommandParser:
+    """
+    Brick side: parses command packets into preallocated arrays, no
+    allocation per packet. Feed it the receive buffer (or a memoryview).
+    Entry i is (channels[i], values[i], args[i], args2[i]), the extra
+    arguments are dt_ms (OP_WAYPOINTS) or vmax, amax (OP_MOVE).
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.op = 0
+        self.flags = 0
+        self.seq = 0
+        self.count = 0
+        self.channels = bytearray(max_entries)
+        self.values = [0] * max_entries
+        self.args = [0] * max_entries
+        self.args2 = [0] * max_entries
+        self._max = max_entries
+
+    def parse(self, buf, n):
+        """Parses the first `n` bytes of `buf`, returns the entry count or -1."""
+        if n < HEADER_SIZE or buf[0] != (MAGIC & 0xFF) or buf[1] != (MAGIC >> 8) or buf[2] != VERSION:
+            return -1
+        self.op = buf[3]
+        self.flags = buf[4]
+        self.seq = buf[5] | (buf[6] << 8)
+        count = buf[7]
+        size = ENTRY_SIZES.get(self.op)
+        if size is None or count > self._max or n < HEADER_SIZE + count * size:
+            return -1
+        o = HEADER_SIZE
+        for i in range(count):
+            self.channels[i] = buf[o]
+            self.values[i] = buf[o + 1] | (buf[o + 2] << 8)
+            if size > 3:
+                self.args[i] = buf[o + 3] | (buf[o + 4] << 8)
+            if size > 5:
+                self.args2[i] = buf[o + 5] | (buf[o + 6] << 8)
+            o += size
+        self.count = count
+        return count
+
+
+class AckPacker:
+    """Brick side: fills one preallocated OP_ACK datagram."""
+
+    def __init__(self):
+        self.buf = bytearray(ACK_SIZE)
+
+    def pack(self, seq, applied, coalesced=0, status=STATUS_OK):
+        pack_header(self.buf, 0, OP_ACK, 0, seq, applied)
+        self.buf[HEADER_SIZE] = min(coalesced, 255)
+        self.buf[HEADER_SIZE + 1] = status
+        return self.buf
+
+
+# -------------------- HOST SIDE --------------------
+
+def pack_command(seq, entries, ack=True, duty=False):
+    """
+    entries: iterable of (channel, value). Values are degrees (float ok,
+    sent in tenths) or raw duty with duty=True. Returns a bytearray.
+    """
+    entries = list(entries)
+    if len(entries) > MAX_ENTRIES:
+        raise ValueError("at most %d channels per packet" % MAX_ENTRIES)
+    buf = bytearray(HEADER_SIZE + len(entries) * ENTRY_SIZE)
+    flags = (FLAG_ACK if ack else 0) | (FLAG_DUTY if duty else 0)
+    pack_header(buf, 0, OP_SET, flags, seq, len(entries))
+    o = HEADER_SIZE
+    for channel, value in entries:
+        v = int(value) if duty else int(round(value * 10))
+        pack_into("<BH", buf, o, channel, max(0, min(0xFFFF, v)))
+        o += ENTRY_SIZE
+    return buf
+
+
+def pack_waypoints(seq, waypoints, ack=True, append=False):
+    """waypoints: iterable of (channel, degrees, dt_ms). Returns a bytearray."""
+    waypoints = list(waypoints)
+    if len(waypoints) > MAX_ENTRIES:
+        raise ValueError("at most %d waypoints per packet" % MAX_ENTRIES)
+    buf = bytearray(HEADER_SIZE + len(waypoints) * ENTRY_SIZES[OP_WAYPOINTS])
+    flags = (FLAG_ACK if ack else 0) | (FLAG_APPEND if append else 0)
+    pack_header(buf, 0, OP_WAYPOINTS, flags, seq, len(waypoints))
+    o = HEADER_SIZE
+    for channel, angle, dt_ms in waypoints:
+        pack_into("<BHH", buf, o, channel, max(0, min(1800, int(round(angle * 10)))),
+                  max(1, min(0xFFFF, int(dt_ms))))
+        o += ENTRY_SIZES[OP_WAYPOINTS]
+    return buf
+
+
+def pack_move(seq, moves, ack=True):
+    """moves: iterable of (channel, degrees, vmax deg/s, amax deg/s^2). Returns a bytearray."""
+    moves = list(moves)
+    if len(moves) > MAX_ENTRIES:
+        raise ValueError("at most %d moves per packet" % MAX_ENTRIES)
+    buf = bytearray(HEADER_SIZE + len(moves) * ENTRY_SIZES[OP_MOVE])
+    pack_header(buf, 0, OP_MOVE, FLAG_ACK if ack else 0, seq, len(moves))
+    o = HEADER_SIZE
+    for channel, angle, vmax, amax in moves:
+        pack_into("<BHHH", buf, o, channel, max(0, min(1800, int(round(angle * 10)))),
+                  max(1, min(0xFFFF, int(vmax))), max(1, min(0xFFFF, int(amax))))
+        o += ENTRY_SIZES[OP_MOVE]
+    return buf
+
+
+def unpack_ack(data):
+    """Returns (seq, applied, coalesced, status) or None."""
+    if len(data) < ACK_SIZE or not is_binary(data):
+        return None
+    magic, version, op, flags, seq, applied = unpack_from(HEADER_FMT, data, 0)
+    if version != VERSION or op != OP_ACK:
+        return None
+    return seq, applied, data[HEADER_SIZE], data[HEADER_SIZE + 1]
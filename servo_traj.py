@@ -0,0 +1,196 @@
+"""
+On-device servo trajectories, interpolated at the PWM update rate.
+
+The host sends a handful of packets per move (servo_proto OP_WAYPOINTS or
+OP_MOVE), the brick fills in every intermediate position itself, so motion
+quality no longer depends on WiFi jitter and a lost packet only shortens
+the queued plan instead of leaving a gap.
+
+Per channel, positions are in tenths of a degree and time in ms:
+
+    waypoints   queue of (target, dt_ms), each reached linearly dt_ms after
+                the previous one; FLAG_APPEND adds to the queue, otherwise
+                it replaces the segment in progress and the queue, starting
+                from the current position
+    move        trapezoidal profile to one target, limited by a maximum
+                velocity and acceleration, starting at rest
+
+A direct OP_SET on a channel cancels its trajectory, the next one starts
+from the position that was set (raw duty values converted back). Per tick
+everything is small-int math (positions stay within 0..1800 tenths), so
+MicroPython allocates nothing after construction; move() itself may.
+"""
+
+import time
+
+import uasyncio
+
+UPDATE_MS = 20              # 50 Hz, one servo PWM period
+QUEUE_SIZE = 16             # waypoints per channel
+
+MODE_IDLE = 0
+MODE_WAYPOINTS = 1
+MODE_MOVE = 2
+
+
+class ChannelTrajectory:
+    """Trajectory state of one servo channel."""
+
+    __slots__ = ("pos", "mode", "targets", "durations", "head", "count",
+                 "t0", "start", "target", "duration",
+                 "dist", "v", "a", "t_acc", "t_flat")
+
+    def __init__(self, pos=900, size=QUEUE_SIZE):
+        self.pos = pos              # current position, tenths of a degree
+        self.mode = MODE_IDLE
+        self.targets = [0] * size
+        self.durations = [0] * size
+        self.head = 0
+        self.count = 0
+        self.t0 = 0                 # ticks_ms at the start of the segment
+        self.start = pos
+        self.target = pos
+        self.duration = 0
+        self.dist = 0               # move: signed distance, tenths
+        self.v = 0                  # move: cruise velocity, deg/s (= tenths per 100 ms)
+        self.a = 0                  # move: acceleration, deg/s^2
+        self.t_acc = 0              # move: ms accelerating (and decelerating)
+        self.t_flat = 0             # move: ms at cruise velocity
+
+    def cancel(self, pos=None):
+        """Stops here (or at `pos` when the position was set directly)."""
+        self.mode = MODE_IDLE
+        self.count = 0
+        if pos is not None:
+            self.pos = pos
+
+    def add_waypoint(self, target, dt_ms, now, append=True):
+        if not append or self.mode != MODE_WAYPOINTS:
+            if self.mode != MODE_IDLE:
+                # cut the segment (or move) in progress where it is now
+                self.update(now)
+                self.mode = MODE_IDLE
+            self.count = 0
+        size = len(self.targets)
+        if self.count == size:
+            return False            # queue full, the host sent too far ahead
+        i = (self.head + self.count) % size
+        self.targets[i] = target
+        self.durations[i] = max(1, dt_ms)
+        self.count += 1
+        if self.mode != MODE_WAYPOINTS:
+            self.mode = MODE_WAYPOINTS
+            self._next_segment(now)
+        return True
+
+    def _next_segment(self, t0):
+        if not self.count:
+            self.mode = MODE_IDLE
+            return
+        self.start = self.pos
+        self.target = self.targets[self.head]
+        self.duration = self.durations[self.head]
+        self.head = (self.head + 1) % len(self.targets)
+        self.count -= 1
+        self.t0 = t0
+
+    def move(self, target, vmax_dps, amax_dps2, now):
+        # with t in ms and s in tenths: s = a * t^2 / 200000, s = v * t / 100
+        if self.mode != MODE_IDLE:
+            self.update(now)
+        self.count = 0
+        dist = target - self.pos
+        v = max(1, vmax_dps)
+        a = max(1, amax_dps2)
+        d = abs(dist)
+        t_acc = v * 1000 // a
+        if a * t_acc * t_acc > d * 100000:
+            # never reaches vmax: triangle profile
+            t_acc = int((d * 100000 / a) ** 0.5)
+            t_flat = 0
+        else:
+            t_flat = (d - a * t_acc * t_acc // 100000) * 100 // v
+        self.start = self.pos
+        self.target = target
+        self.dist = dist
+        self.v = v
+        self.a = a
+        self.t_acc = t_acc
+        self.t_flat = t_flat
+        self.t0 = now
+        self.mode = MODE_MOVE
+
+    def update(self, now):
+        """Advances to `now`, returns the position in tenths."""
+        mode = self.mode
+        if mode == MODE_WAYPOINTS:
+            t = time.ticks_diff(now, self.t0)
+            while t >= self.duration:
+                # segment done, carry the overshoot into the next one
+                self.pos = self.target
+                t0 = time.ticks_add(self.t0, self.duration)
+                self._next_segment(t0)
+                if self.mode != MODE_WAYPOINTS:
+                    return self.pos
+                t = time.ticks_diff(now, self.t0)
+            self.pos = self.start + (self.target - self.start) * t // self.duration
+        elif mode == MODE_MOVE:
+            t = time.ticks_diff(now, self.t0)
+            t_acc, t_flat, a = self.t_acc, self.t_flat, self.a
+            total = 2 * t_acc + t_flat
+            if t >= total:
+                self.pos = self.target
+                self.mode = MODE_IDLE
+                return self.pos
+            # a * t * t <= 200000 * 1800 < 2^30: small ints only
+            if t < t_acc:
+                s = a * t * t // 200000
+            elif t < t_acc + t_flat:
+                s = a * t_acc * t_acc // 200000 + self.v * (t - t_acc) // 100
+            else:
+                td = total - t
+                s = abs(self.dist) - a * td * td // 200000
+            self.pos = self.start + (s if self.dist >= 0 else -s)
+        return self.pos
+
+
+class TrajectoryPlayer:
+    """Runs the trajectories of every channel and writes the PWM duty."""
+
+    def __init__(self, servos, to_duty, update_ms=UPDATE_MS, start=900):
+        self.servos = servos
+        self.to_duty = to_duty
+        self.update_ms = update_ms
+        self.channels = [ChannelTrajectory(start) for _ in servos]
+        self._duty = [-1] * len(servos)
+
+    def active(self):
+        for traj in self.channels:
+            if traj.mode != MODE_IDLE:
+                return True
+        return False
+
+    def cancel(self, ch, pos=None):
+        self.channels[ch].cancel(pos)
+        self._duty[ch] = -1
+
+    def step(self, now):
+        for ch in range(len(self.channels)):
+            traj = self.channels[ch]
+            if traj.mode == MODE_IDLE:
+                continue
+            duty = self.to_duty(traj.update(now))
+            if duty != self._duty[ch]:
+                self.servos[ch].duty(duty)
+                self._duty[ch] = duty
+
+    async def run(self):
+        next_ms = time.ticks_ms()
+        while True:
+            self.step(time.ticks_ms())
+            next_ms = time.ticks_add(next_ms, self.update_ms)
+            delay = time.ticks_diff(next_ms, time.ticks_ms())
+            if delay < 0:
+                next_ms = time.ticks_ms()   # fell behind, do not burst
+                delay = 0
+            await uasyncio.sleep_ms(delay)
@@ -0,0 +1,48 @@
+"""
+Host (CPython) stand-ins for the MicroPython modules the brick firmware
+imports, so rc_main.py, rc_main_nb.py, sensor_station_mode_current.py and
+servo_AP_2way_com.py run unchanged on a laptop:
+
+    machine, network, uasyncio, ulogger, ujson, rc_module,
+    vl53l5cx, vl53l5cx.mp (fake VL53L5CXMP driven by sim/scenes.py)
+
+    python -m sim rc_main_nb.py --scene sweep --duration 30
+
+or from code (benchmarks, tests):
+
+    import sim
+    sim.install(scene="wall", send_fail_rate=0.01)
+    import rc_main_nb
+    asyncio.run(rc_main_nb.main())
+
+install() puts sim/modules first on sys.path, adds the MicroPython
+time.ticks_* / sleep_ms functions to the stdlib time module and swaps
+socket.socket for a subclass that sends everything to loopback, so
+broadcasts to 192.168.x.255 reach a viewer on the same machine.
+"""
+
+import os
+import sys
+
+from sim.config import CONFIG  # noqa: F401  (re-exported)
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+
+_installed = False
+
+
+def install(**settings):
+    """Activates the stand-ins, `settings` override fields of sim.config.CONFIG."""
+    global _installed
+    CONFIG.update(**settings)
+    if _installed:
+        return CONFIG
+    _installed = True
+
+    if MODULES_DIR not in sys.path:
+        sys.path.insert(0, MODULES_DIR)
+
+    from sim import ticks, loopback
+    ticks.install()
+    loopback.install()
+    return CONFIG
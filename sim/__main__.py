@@ -0,0 +1,67 @@
+"""
+Runs a brick script on the host against the simulated hardware.
+
+    python -m sim rc_main_nb.py --scene wall --duration 20
+    python -m sim sensor_station_mode_current.py --scene session.tofcap --send-fail-rate 0.05
+
+Frames go to 127.0.0.1:5005, start viewer3.py next to it to watch them.
+"""
+
+import _thread
+import argparse
+import os
+import runpy
+import sys
+import threading
+
+import sim
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("script", help="firmware script to run, e.g. rc_main_nb.py")
+    parser.add_argument("--scene", default=sim.CONFIG.scene,
+                        help="flat, wall, sweep or the path of a .tofcap recording")
+    parser.add_argument("--duration", type=float, default=None, help="stop after N seconds")
+    parser.add_argument("--noise-mm", type=int, default=sim.CONFIG.noise_mm)
+    parser.add_argument("--init-s", type=float, default=sim.CONFIG.init_s,
+                        help="time tof.init() takes (firmware upload)")
+    parser.add_argument("--read-cost-ms", type=float, default=sim.CONFIG.read_cost_ms,
+                        help="time get_ranging_data() blocks (I2C transfer)")
+    parser.add_argument("--send-fail-rate", type=float, default=sim.CONFIG.send_fail_rate,
+                        help="probability of OSError per sendto")
+    parser.add_argument("--wifi-connect-s", type=float, default=sim.CONFIG.wifi_connect_s)
+    parser.add_argument("--int-pin", type=int, default=None, help="Pin id of the sensor INT line")
+    args = parser.parse_args()
+
+    sim.install(
+        scene=args.scene,
+        noise_mm=args.noise_mm,
+        init_s=args.init_s,
+        read_cost_ms=args.read_cost_ms,
+        send_fail_rate=args.send_fail_rate,
+        wifi_connect_s=args.wifi_connect_s,
+        int_pin=args.int_pin,
+    )
+
+    script = os.path.abspath(args.script)
+    sys.path.insert(1, os.path.dirname(script))
+    sys.argv = [script]
+
+    if args.duration:
+        # the scripts already handle Ctrl+C, stop them the same way
+        timer = threading.Timer(args.duration, _thread.interrupt_main)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        from sim import loopback
+        print("[SIM] datagrams: %(sent)d sent, %(failed)d failed (injected)" % loopback.stats)
+
+
+if __name__ == "__main__":
+    main()
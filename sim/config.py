@@ -0,0 +1,26 @@
+"""Knobs of the simulated hardware, shared by all stand-in modules."""
+
+
+class SimConfig:
+
+    def __init__(self):
+        # ToF sensor
+        self.scene = "sweep"            # name in sim.scenes.SCENES or a .tofcap path
+        self.noise_mm = 4               # gaussian-ish noise added to synthetic scenes
+        self.init_s = 0.0               # tof.init() firmware upload time (real: ~1-3 s)
+        self.read_cost_ms = 0.0         # get_ranging_data() I2C transfer time, blocks the loop
+        self.int_pin = None             # Pin id wired to the sensor INT output
+
+        # network
+        self.wifi_connect_s = 0.5       # time until WLAN.isconnected() turns True
+        self.send_fail_rate = 0.0       # probability of OSError(ENOBUFS) per sendto
+        self.rssi = -55
+
+    def update(self, **settings):
+        for key, value in settings.items():
+            if not hasattr(self, key):
+                raise AttributeError("unknown sim setting %r" % key)
+            setattr(self, key, value)
+
+
+CONFIG = SimConfig()
@@ -0,0 +1,46 @@
+"""
+Routes the firmware's UDP traffic over loopback.
+
+socket.socket is replaced by a subclass that rewrites every non-loopback
+destination (AP broadcast, station subnet, host IPs) to 127.0.0.1 and can
+inject send failures like a full WiFi TX queue does on the brick.
+"""
+
+import errno
+import random
+import socket
+
+from sim.config import CONFIG
+
+_socket = socket.socket
+
+stats = {"sent": 0, "failed": 0, "remapped": 0}
+
+
+def remap(addr):
+    host = addr[0]
+    if host.startswith("127.") or host in ("", "0.0.0.0", "localhost"):
+        return addr, False
+    return ("127.0.0.1",) + tuple(addr[1:]), True
+
+
+class LoopbackSocket(_socket):
+
+    def sendto(self, data, *args):
+        addr = args[-1]
+        addr, remapped = remap(addr)
+        if remapped:
+            stats["remapped"] += 1
+            if CONFIG.send_fail_rate and random.random() < CONFIG.send_fail_rate:
+                stats["failed"] += 1
+                raise OSError(errno.ENOBUFS, "simulated TX queue full")
+        n = _socket.sendto(self, data, *(args[:-1] + (addr,)))
+        stats["sent"] += 1
+        return n
+
+    def connect(self, addr):
+        return _socket.connect(self, remap(addr)[0])
+
+
+def install():
+    socket.socket = LoopbackSocket
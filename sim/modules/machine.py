@@ -0,0 +1,150 @@
+"""Stand-in for the MicroPython machine module (the parts the bricks use)."""
+
+import time
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+_reset_cause = PWRON_RESET
+
+
+def reset_cause():
+    return _reset_cause
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def freq(hz=None):
+    return 160_000_000
+
+
+def unique_id():
+    return b"\x00\x00sim\x01"
+
+
+def idle():
+    time.sleep(0)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+class Pin:
+    IN = 1
+    OUT = 2
+    OPEN_DRAIN = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    _pins = {}      # id -> Pin, so simulated peripherals can drive inputs
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self._value = value
+        self._handler = None
+        self._trigger = 0
+        Pin._pins[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._drive(v)
+
+    def on(self):
+        self._drive(1)
+
+    def off(self):
+        self._drive(0)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger if handler is not None else 0
+
+    def _drive(self, v):
+        """Sets the level and runs the IRQ handler on a matching edge."""
+        v = 1 if v else 0
+        old, self._value = self._value, v
+        if self._handler is None or old == v:
+            return
+        if (v == 0 and self._trigger & Pin.IRQ_FALLING) or (v == 1 and self._trigger & Pin.IRQ_RISING):
+            self._handler(self)
+
+    @classmethod
+    def lookup(cls, id):
+        return cls._pins.get(id)
+
+
+class SoftI2C:
+
+    def __init__(self, scl=None, sda=None, freq=400_000, timeout=50_000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+
+    def scan(self):
+        return [0x29]
+
+
+class I2C(SoftI2C):
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400_000, timeout=50_000):
+        super().__init__(scl=scl, sda=sda, freq=freq, timeout=timeout)
+        self.id = id
+
+
+class PWM:
+
+    def __init__(self, pin, freq=50, duty=None, duty_u16=None):
+        self.pin = pin
+        self._freq = freq
+        self._duty = 0 if duty is None else duty
+        self.history = []           # (time.monotonic(), duty) for inspection
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+        self.history.append((time.monotonic(), d))
+        if len(self.history) > 10000:
+            del self.history[:5000]
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty * 64
+        self.duty(d >> 6)
+
+    def deinit(self):
+        pass
+
+
+class WDT:
+
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+
+    def feed(self):
+        pass
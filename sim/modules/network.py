@@ -0,0 +1,88 @@
+"""
+Stand-in for the MicroPython network module.
+
+Interfaces report 127.0.0.1 and all UDP traffic is routed over loopback
+(see sim/loopback.py). Station mode connects after CONFIG.wifi_connect_s.
+"""
+
+import time
+
+from sim.config import CONFIG
+
+STA_IF = 0
+AP_IF = 1
+
+AUTH_OPEN = 0
+AUTH_WEP = 1
+AUTH_WPA_PSK = 2
+AUTH_WPA2_PSK = 3
+AUTH_WPA_WPA2_PSK = 4
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+
+_interfaces = {}
+
+
+class WLAN:
+
+    def __new__(cls, interface_id=STA_IF):
+        # like on the device, WLAN(STA_IF) always returns the same interface
+        wlan = _interfaces.get(interface_id)
+        if wlan is None:
+            wlan = _interfaces[interface_id] = super().__new__(cls)
+            wlan._init(interface_id)
+        return wlan
+
+    def _init(self, interface_id):
+        self.interface_id = interface_id
+        self._active = False
+        self._config = {"ssid": "", "key": "", "security": AUTH_WPA2_PSK, "txpower": 20}
+        self._connect_at = None
+        self._down = False          # set by tests / benches to simulate an outage
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+
+    def config(self, *args, **kwargs):
+        if args:
+            if args[0] == "mac":
+                return b"\x02\x00\x00\x00\x00\x01"
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+        if self.interface_id == AP_IF:
+            self._active = True
+
+    def connect(self, ssid=None, key=None, **kwargs):
+        self._config["ssid"] = ssid
+        self._config["key"] = key
+        self._connect_at = time.monotonic() + CONFIG.wifi_connect_s
+
+    def disconnect(self):
+        self._connect_at = None
+
+    def isconnected(self):
+        if self.interface_id == AP_IF:
+            return self._active
+        return (not self._down and self._connect_at is not None
+                and time.monotonic() >= self._connect_at)
+
+    def status(self, param=None):
+        if param == "rssi":
+            return CONFIG.rssi
+        if param is not None:
+            return None
+        if self.isconnected():
+            return STAT_GOT_IP
+        return STAT_CONNECTING if self._connect_at is not None else STAT_IDLE
+
+    def ifconfig(self, config=None):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+    def scan(self):
+        return [(self._config["ssid"].encode(), b"\x02\x00\x00\x00\x00\x02", 6, CONFIG.rssi, AUTH_WPA2_PSK, False)]
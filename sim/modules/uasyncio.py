@@ -0,0 +1,46 @@
+"""Stand-in for MicroPython uasyncio on top of CPython asyncio."""
+
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+from asyncio import CancelledError, Event, TimeoutError, get_running_loop  # noqa: F401
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout):
+    return await _asyncio.wait_for(aw, timeout / 1000)
+
+
+class ThreadSafeFlag:
+    """
+    Like uasyncio.ThreadSafeFlag: set() may be called from an IRQ handler,
+    i.e. any thread here; wait() returns once set and clears the flag.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._event = None
+        self._pending = False
+
+    def set(self):
+        loop = self._loop
+        if loop is None:
+            self._pending = True
+        else:
+            loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._pending = False
+        if self._event is not None:
+            self._event.clear()
+
+    async def wait(self):
+        if self._event is None:
+            self._loop = get_running_loop()
+            self._event = Event()
+            if self._pending:
+                self._event.set()
+        await self._event.wait()
+        self._event.clear()
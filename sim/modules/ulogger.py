@@ -0,0 +1,93 @@
+"""
+Stand-in for the CyberBrick ulogger module. TO_TERM handlers print,
+TO_FILE handlers append to the same relative path under a temp directory
+(synchronously, like the flash writes on the brick).
+"""
+
+import os
+import tempfile
+
+FILE_ROOT = os.path.join(tempfile.gettempdir(), "cyberbrick_sim")
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+CRITICAL = 50
+
+TO_TERM = 0
+TO_FILE = 1
+
+_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR", CRITICAL: "CRITICAL"}
+
+
+class BaseClock:
+
+    def __call__(self) -> str:
+        return ""
+
+
+class Handler:
+
+    def __init__(self, level=INFO, colorful=False, fmt="&(time)%-&(level)%-&(msg)%",
+                 clock=None, direction=TO_TERM, file_name=None, index_file_name=None,
+                 max_file_size=4096):
+        self.level = level
+        self.fmt = fmt
+        self.clock = clock or BaseClock()
+        self.direction = direction
+        self.file_name = file_name
+        self._file = None
+        if direction == TO_FILE and file_name:
+            path = os.path.join(FILE_ROOT, os.path.normpath(file_name).lstrip("./\\"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a")
+
+    def emit(self, level, msg, name):
+        if level < self.level:
+            return
+        line = (self.fmt.replace("&(time)%", self.clock())
+                .replace("&(level)%", _NAMES.get(level, str(level)))
+                .replace("&(msg)%", msg)
+                .replace("&(name)%", name or ""))
+        if self.direction == TO_FILE:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+        else:
+            print(line)
+
+
+_default_handlers = (Handler(),)
+
+
+class Logger:
+
+    def __init__(self, name="", handlers=None):
+        global _default_handlers
+        self.name = name
+        if handlers:
+            _default_handlers = handlers
+        self.handlers = handlers or _default_handlers
+
+    def _log(self, level, msg, *args):
+        msg = str(msg) % args if args else str(msg)
+        for handler in self.handlers:
+            handler.emit(level, msg, self.name)
+
+    def debug(self, msg, *args):
+        self._log(DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self._log(INFO, msg, *args)
+
+    def warn(self, msg, *args):
+        self._log(WARN, msg, *args)
+
+    warning = warn
+
+    def error(self, msg, *args):
+        self._log(ERROR, msg, *args)
+
+    def critical(self, msg, *args):
+        self._log(CRITICAL, msg, *args)
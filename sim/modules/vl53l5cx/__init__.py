@@ -0,0 +1,27 @@
+"""Constants of the vl53l5cx driver package."""
+
+RESOLUTION_4X4 = 16
+RESOLUTION_8X8 = 64
+
+TARGET_ORDER_CLOSEST = 1
+TARGET_ORDER_STRONGEST = 2
+
+RANGING_MODE_CONTINUOUS = 1
+RANGING_MODE_AUTONOMOUS = 3
+
+POWER_MODE_SLEEP = 0
+POWER_MODE_WAKEUP = 1
+
+DATA_AMBIENT_PER_SPAD = 1
+DATA_NB_SPADS_ENABLED = 2
+DATA_NB_TARGET_DETECTED = 3
+DATA_SIGNAL_PER_SPAD = 4
+DATA_RANGE_SIGMA_MM = 5
+DATA_DISTANCE_MM = 6
+DATA_REFLECTANCE = 7
+DATA_TARGET_STATUS = 8
+DATA_MOTION_INDICATOR = 9
+
+STATUS_VALID = 5
+STATUS_VALID_LARGE_PULSE = 6
+STATUS_VALID_NO_TARGET = 9
@@ -0,0 +1,161 @@
+"""
+Fake VL53L5CXMP for the host simulation.
+
+Honours resolution, ranging_freq, start/stop_ranging and produces a new
+frame every 1 / ranging_freq seconds from the scene in sim.config.CONFIG.
+check_data_ready() turns True once per frame period like the real sensor,
+get_ranging_data() optionally blocks for CONFIG.read_cost_ms to mimic the
+I2C transfer. If CONFIG.int_pin is set, the INT pin (a sim machine.Pin)
+is pulsed low on every new frame from a timer thread.
+"""
+
+import threading
+import time
+from array import array
+
+from sim.config import CONFIG
+from sim.scenes import make_scene
+from vl53l5cx import (
+    RESOLUTION_4X4, RESOLUTION_8X8, TARGET_ORDER_CLOSEST,
+    DATA_DISTANCE_MM, DATA_TARGET_STATUS, DATA_RANGE_SIGMA_MM,
+    DATA_SIGNAL_PER_SPAD, DATA_NB_TARGET_DETECTED, DATA_AMBIENT_PER_SPAD,
+    STATUS_VALID, STATUS_VALID_NO_TARGET,
+)
+
+MAX_RANGE_MM = 4000
+
+
+class RangingResults:
+
+    def __init__(self, zones):
+        self.distance_mm = array("H", [0] * zones)     # uint16, like the wire format
+        self.target_status = array("B", [STATUS_VALID] * zones)
+        self.range_sigma_mm = array("H", [0] * zones)
+        self.signal_per_spad = array("I", [0] * zones)
+        self.nb_target_detected = array("B", [1] * zones)
+        self.ambient_per_spad = array("I", [0] * zones)
+
+
+class VL53L5CXMP:
+
+    def __init__(self, i2c, addr=0x29, lpn=None):
+        self.i2c = i2c
+        self.addr = addr
+        self.lpn = lpn
+        self._resolution = RESOLUTION_4X4
+        self.ranging_freq = 1
+        self.target_order = TARGET_ORDER_CLOSEST
+        self._outputs = {DATA_DISTANCE_MM}
+        self._ranging = False
+        self._t0 = 0.0
+        self._last_read = -1
+        self._scene = None
+        self._results = RangingResults(RESOLUTION_4X4)
+        self._int_thread = None
+        self.frames_read = 0
+        self.frames_missed = 0      # produced by the sensor but never read
+
+    # -------------------- CONFIG --------------------
+
+    def init(self):
+        if CONFIG.init_s:
+            time.sleep(CONFIG.init_s)   # firmware upload over I2C
+        self._scene = make_scene(CONFIG.scene)
+
+    def is_alive(self):
+        return True
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        if value not in (RESOLUTION_4X4, RESOLUTION_8X8):
+            raise ValueError("invalid resolution")
+        self._resolution = value
+        self._results = RangingResults(value)
+
+    def start_ranging(self, outputs):
+        self._outputs = set(outputs)
+        if self._scene is None:
+            self._scene = make_scene(CONFIG.scene)
+        self._t0 = time.monotonic()
+        self._last_read = -1
+        self._ranging = True
+        if CONFIG.int_pin is not None and self._int_thread is None:
+            self._int_thread = threading.Thread(target=self._int_loop, daemon=True)
+            self._int_thread.start()
+
+    def stop_ranging(self):
+        self._ranging = False
+
+    # -------------------- DATA --------------------
+
+    def _frame_index(self):
+        return int((time.monotonic() - self._t0) * self.ranging_freq)
+
+    def check_data_ready(self):
+        return self._ranging and self._frame_index() > self._last_read
+
+    def get_ranging_data(self):
+        idx = self._frame_index()
+        if self._last_read >= 0 and idx > self._last_read + 1:
+            self.frames_missed += idx - self._last_read - 1
+        self._last_read = idx
+        self.frames_read += 1
+        if CONFIG.read_cost_ms:
+            time.sleep(CONFIG.read_cost_ms / 1000)
+
+        res = self._results
+        zones = self._resolution
+        t = idx / self.ranging_freq
+        self._scene.render(t, zones, res.distance_mm)
+        if len(self._outputs) > 1:
+            self._fill_extra(res, zones)
+        self._release_int()
+        return res
+
+    def _fill_extra(self, res, zones):
+        for i in range(zones):
+            d = res.distance_mm[i]
+            if d <= 0 or d >= MAX_RANGE_MM:
+                res.target_status[i] = STATUS_VALID_NO_TARGET
+                res.nb_target_detected[i] = 0
+                res.signal_per_spad[i] = 0
+            else:
+                res.target_status[i] = STATUS_VALID
+                res.nb_target_detected[i] = 1
+                # signal falls with distance squared, sigma grows with it
+                res.signal_per_spad[i] = int(4e8 / (d * d + 1000))
+            res.range_sigma_mm[i] = 1 + d // 400
+            res.ambient_per_spad[i] = 2
+
+    # -------------------- INT PIN --------------------
+
+    def _pin(self):
+        from machine import Pin
+        return Pin.lookup(CONFIG.int_pin)
+
+    def _release_int(self):
+        pin = self._pin()
+        if pin is not None and pin.value() == 0:
+            pin._drive(1)
+
+    def _int_loop(self):
+        # active low data-ready, asserted at every frame boundary
+        last = -1
+        while True:
+            if not self._ranging:
+                time.sleep(0.01)
+                continue
+            idx = self._frame_index()
+            if idx != last:
+                last = idx
+                pin = self._pin()
+                if pin is not None:
+                    if pin.value() == 0:
+                        pin._drive(1)
+                    pin._drive(0)
+            next_t = self._t0 + (idx + 1) / self.ranging_freq
+            time.sleep(max(0.0, next_t - time.monotonic()))
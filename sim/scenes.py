@@ -0,0 +1,109 @@
+"""
+Synthetic and recorded scenes for the fake VL53L5CX.
+
+A scene renders the distances of one frame at time `t` (seconds since
+ranging started) into a preallocated array, zone 0 first, row by row.
+"""
+
+import math
+import random
+
+from sim.config import CONFIG
+
+
+class Scene:
+
+    def render(self, t, zones, out):
+        side = 4 if zones == 16 else 8
+        noise = CONFIG.noise_mm
+        for i in range(zones):
+            d = self.distance(t, (i % side) / (side - 1), (i // side) / (side - 1))
+            if noise:
+                d += random.randint(-noise, noise)
+            out[i] = max(0, int(d))
+
+    def distance(self, t, x, y):
+        """Distance in mm of the zone at normalised position x, y in [0, 1]."""
+        raise NotImplementedError
+
+
+class Flat(Scene):
+    """Static wall at a fixed distance."""
+
+    def __init__(self, distance_mm=1500):
+        self.distance_mm = distance_mm
+
+    def distance(self, t, x, y):
+        return self.distance_mm
+
+
+class Wall(Scene):
+    """Slightly tilted wall moving back and forth between 300 and 2000 mm."""
+
+    def __init__(self, period_s=6.0):
+        self.period_s = period_s
+
+    def distance(self, t, x, y):
+        base = 1150 + 850 * math.sin(2 * math.pi * t / self.period_s)
+        return base + 150 * (x - 0.5)
+
+
+class Sweep(Scene):
+    """Close object crossing a far background from left to right."""
+
+    def __init__(self, period_s=4.0, background_mm=2000, object_mm=400, width=0.3):
+        self.period_s = period_s
+        self.background_mm = background_mm
+        self.object_mm = object_mm
+        self.width = width
+
+    def distance(self, t, x, y):
+        pos = (t % self.period_s) / self.period_s * (1 + 2 * self.width) - self.width
+        if abs(x - pos) < self.width / 2 and y > 0.25:
+            return self.object_mm
+        return self.background_mm
+
+
+class Capture(Scene):
+    """Loops over the frames of a tof_capture.py recording."""
+
+    def __init__(self, path, source=0):
+        from tof_capture import CaptureReader
+        self.cap = CaptureReader(path)
+        recs = self.cap.records
+        self.recs = recs[recs["source"] == source] if len(self.cap.sources) > 1 else recs
+        if not len(self.recs):
+            raise ValueError("capture %s has no frames" % path)
+        self.t = self.recs["t"] - self.recs["t"][0]
+        self.duration = float(self.t[-1]) or 1.0
+
+    def render(self, t, zones, out):
+        import numpy as np
+        i = int(np.searchsorted(self.t, t % self.duration, side="right")) - 1
+        rec = self.recs[max(i, 0)]
+        rec_zones = int(rec["zones"])
+        if rec_zones == zones:
+            src = rec["distance"][:zones]
+        elif rec_zones == 64:
+            # 8x8 recording shown at 4x4: take every other zone
+            src = rec["distance"][:64].reshape(8, 8)[::2, ::2].ravel()
+        else:
+            src = rec["distance"][:16].reshape(4, 4).repeat(2, 0).repeat(2, 1).ravel()
+        for i in range(zones):
+            out[i] = int(src[i])
+
+
+SCENES = {
+    "flat": Flat,
+    "wall": Wall,
+    "sweep": Sweep,
+}
+
+
+def make_scene(spec):
+    """`spec` is a Scene, a name from SCENES or the path of a capture file."""
+    if isinstance(spec, Scene):
+        return spec
+    if spec in SCENES:
+        return SCENES[spec]()
+    return Capture(spec)
@@ -0,0 +1,43 @@
+"""MicroPython time.ticks_* and sleep_ms/us for the stdlib time module."""
+
+import time
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD >> 1
+
+_t0 = time.perf_counter()
+
+
+def ticks_ms():
+    return int((time.perf_counter() - _t0) * 1000) & TICKS_MAX
+
+
+def ticks_us():
+    return int((time.perf_counter() - _t0) * 1000000) & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(a, b):
+    return ((a - b + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def install():
+    for fn in (ticks_ms, ticks_us, ticks_cpu, ticks_diff, ticks_add, sleep_ms, sleep_us):
+        if not hasattr(time, fn.__name__):
+            setattr(time, fn.__name__, fn)
@@ -0,0 +1,218 @@
+"""
+Multi-sensor aggregation: one socket, many bricks, one array per tick.
+
+Every brick broadcasts to the same port, so frames are demultiplexed by
+source address into a bounded per-sensor history. A brick that reboots
+comes back on a new source port: a new source takes over the slot of one
+not heard for `source_timeout_s`, so `sources` does not grow with every
+reboot (the index of a slot then refers to the new source). All histories live in
+shared preallocated arrays indexed [sensor, slot]:
+
+    frames     (sensors, depth, 64)  uint16  4x4 frames upscaled to 8x8
+    stamps     (sensors, depth)      float64 host time of the frame
+
+A frame is stamped with its receive time minus the decoder's age estimate
+(the extra delay vs the fastest frame of that source), which puts every
+sensor on the host monotonic clock without trusting the device ticks.
+
+snapshot(t) aligns all sensors to time t in a handful of numpy operations
+over the whole (sensors, depth) block, never one Python iteration per
+sensor:
+
+    ALIGN_NEAREST   closest frame to t
+    ALIGN_LINEAR    interpolated between the frames around t, falls back
+                    to the newest one when t is past it
+
+and returns a fused (sensors, 8, 8) float32 array plus a valid mask.
+
+    rx = FrameReceiver(max_age_ms=None).start()
+    agg = SensorAggregator().attach(rx)
+    for t, grids, valid in agg.ticks(20):
+        ...
+
+    python tof_aggregate.py [--rate 10] [--align linear]
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from tof_receiver import FrameReceiver, UDP_PORT
+
+ZONES = 64
+SIDE = 8
+
+ALIGN_NEAREST = "nearest"
+ALIGN_LINEAR = "linear"
+
+DEFAULT_DEPTH = 16          # frames kept per sensor (0.8 s at 20 Hz)
+DEFAULT_DELAY_S = 0.1       # ticks() looks this far back so frames around t have arrived
+MAX_GAP_S = 0.5             # a sensor without a frame this close to t is not valid
+SOURCE_TIMEOUT_S = 10.0     # slot of a silent source is reused after this
+
+
+class SensorAggregator:
+    """Per-source frame histories with vectorised time alignment."""
+
+    def __init__(self, depth=DEFAULT_DEPTH, max_sensors=8, max_gap_s=MAX_GAP_S,
+                 source_timeout_s=SOURCE_TIMEOUT_S):
+        self.depth = depth
+        self.max_gap_s = max_gap_s
+        self.source_timeout_s = source_timeout_s
+        self.sources = []           # index -> source address
+        self._index = {}            # source address -> index
+        self._lock = threading.Lock()
+        self._alloc(max_sensors)
+
+    def _alloc(self, capacity):
+        frames = np.zeros((capacity, self.depth, ZONES), dtype=np.uint16)
+        stamps = np.full((capacity, self.depth), -np.inf)
+        heads = np.zeros(capacity, dtype=np.intp)
+        n = len(self.sources)
+        if n:
+            frames[:n] = self.frames[:n]
+            stamps[:n] = self.stamps[:n]
+            heads[:n] = self.heads[:n]
+        self.frames, self.stamps, self.heads = frames, stamps, heads
+
+    def __len__(self):
+        return len(self.sources)
+
+    # -------------------- INPUT --------------------
+
+    def attach(self, rx):
+        """Feeds every frame of a FrameReceiver into the aggregator."""
+        rx.add_callback(self.push)
+        return self
+
+    def push(self, frame):
+        """Stores one Frame, O(1) whatever the number of sensors."""
+        with self._lock:
+            i = self._index.get(frame.source)
+            if i is None:
+                i = self._silent_slot(frame.recv_time)
+                if i is None:
+                    i = len(self.sources)
+                    if i == len(self.heads):
+                        self._alloc(2 * i)
+                    self.sources.append(frame.source)
+                else:
+                    del self._index[self.sources[i]]
+                    self.sources[i] = frame.source
+                    self.stamps[i] = -np.inf
+                    self.heads[i] = 0
+                self._index[frame.source] = i
+            slot = self.heads[i]
+            if frame.zones == ZONES:
+                self.frames[i, slot] = frame.distance.reshape(-1)
+            else:
+                # nearest upscale so every sensor fits the same (8, 8) grid
+                self.frames[i, slot].reshape(SIDE, SIDE)[:] = frame.distance.repeat(2, 0).repeat(2, 1)
+            self.stamps[i, slot] = frame.recv_time - frame.age_ms / 1000.0
+            self.heads[i] = (slot + 1) % self.depth
+
+    def _silent_slot(self, now):
+        # only runs for a source not seen before, not per frame
+        n = len(self.sources)
+        if not n or self.source_timeout_s is None:
+            return None
+        newest = self.stamps[:n].max(axis=1)
+        i = int(np.argmin(newest))
+        return i if newest[i] < now - self.source_timeout_s else None
+
+    # -------------------- ALIGNMENT --------------------
+
+    def snapshot(self, t=None, align=ALIGN_NEAREST):
+        """
+        All sensors aligned to host time `t` (time.monotonic(), default now).
+
+        Returns (grids, valid): grids is a new (sensors, 8, 8) float32 array
+        in mm, valid a (sensors,) bool array, False for sensors that had no
+        frame within max_gap_s of t (their grid is 0).
+        """
+        if t is None:
+            t = time.monotonic()
+        with self._lock:
+            n = len(self.sources)
+            frames = self.frames[:n].copy()
+            stamps = self.stamps[:n].copy()
+        rows = np.arange(n)
+
+        if align == ALIGN_NEAREST:
+            j = np.argmin(np.abs(stamps - t), axis=1)
+            grids = frames[rows, j].astype(np.float32)
+            valid = np.abs(stamps[rows, j] - t) <= self.max_gap_s
+        elif align == ALIGN_LINEAR:
+            before = np.where(stamps <= t, stamps, -np.inf)
+            after = np.where(stamps > t, stamps, np.inf)
+            a = np.argmax(before, axis=1)
+            b = np.argmin(after, axis=1)
+            ta = before[rows, a]
+            tb = after[rows, b]
+            # no frame after t yet: hold the newest, no frame before t: take the oldest
+            has_a = np.isfinite(ta)
+            has_b = np.isfinite(tb)
+            span = np.where(has_a & has_b, tb - ta, 1.0)
+            w = np.where(has_a & has_b, (t - ta) / span, np.where(has_a, 0.0, 1.0))
+            w = w.astype(np.float32)[:, None]
+            grids = frames[rows, a] * (1 - w) + frames[rows, b] * w
+            nearest = np.minimum(np.where(has_a, t - ta, np.inf), np.where(has_b, tb - t, np.inf))
+            valid = nearest <= self.max_gap_s
+        else:
+            raise ValueError("unknown alignment %r" % align)
+
+        grids[~valid] = 0
+        return grids.reshape(n, SIDE, SIDE), valid
+
+    def ticks(self, rate_hz, align=ALIGN_LINEAR, delay_s=DEFAULT_DELAY_S):
+        """
+        Yields (t, grids, valid) at a fixed rate, `delay_s` behind real time
+        so the frames around t have arrived for interpolation.
+        """
+        period = 1.0 / rate_hz
+        next_t = time.monotonic()
+        while True:
+            next_t += period
+            sleep = next_t - time.monotonic()
+            if sleep > 0:
+                time.sleep(sleep)
+            else:
+                next_t = time.monotonic()   # fell behind, do not burst
+            t = next_t - delay_s
+            grids, valid = self.snapshot(t, align)
+            yield t, grids, valid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the frames of several ToF bricks")
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--rate", type=float, default=10.0, help="fused ticks per second")
+    parser.add_argument("--align", default=ALIGN_LINEAR, choices=(ALIGN_NEAREST, ALIGN_LINEAR))
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    args = parser.parse_args()
+
+    # alignment needs late frames too, the aggregator decides what is too old
+    with FrameReceiver(args.port, max_age_ms=None, queue_size=0) as rx:
+        agg = SensorAggregator(args.depth).attach(rx)
+        print("Listening on port %d..." % args.port)
+        n = 0
+        try:
+            for t, grids, valid in agg.ticks(args.rate, args.align):
+                n += 1
+                if n % max(1, int(args.rate)):
+                    continue
+                print("%d sensors, %d valid" % (len(valid), np.count_nonzero(valid)))
+                for i, source in enumerate(agg.sources):
+                    g = grids[i]
+                    print("  %-22s %s min %5d mm  mean %5d mm" % (
+                        "%s:%d" % source[:2] if isinstance(source, tuple) else source,
+                        "ok   " if valid[i] else "stale", g.min(), g.mean()))
+        except KeyboardInterrupt:
+            pass
+        print(rx.stats())
+
+
+if __name__ == "__main__":
+    main()
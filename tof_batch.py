@@ -0,0 +1,96 @@
+"""
+Packs several frame datagrams into one UDP datagram (brick side).
+
+At 4x4 / 60 Hz the per-datagram cost (802.11 preamble, IP/UDP headers,
+sendto() in MicroPython) is larger than the 32 byte payload, so frames are
+collected and sent together. Layout of a KIND_BATCH datagram:
+
+    offset             size       field
+    0                  12         header, kind=KIND_BATCH, seq=batch counter,
+                                  zones=number of frames, tick=flush time
+    HEADER_SIZE        ...        the inner datagrams back to back, each a
+                                  complete KIND_FRAME / KIND_DELTA datagram
+                                  with its own header (seq, tick_ms)
+    end - 2 * count    2 * count  uint16 offset of every inner datagram
+
+The offset table sits at the end so frames can be appended as they come
+and nothing has to be moved when the batch is closed.
+
+A batch is sent when it holds `max_frames`, when the next frame would not
+fit in `max_bytes`, or when the oldest frame has waited `max_delay_ms`.
+"""
+
+import time
+from struct import pack_into
+
+from tof_proto import HEADER_SIZE, KIND_BATCH, pack_header
+
+# (max_frames, max_bytes, max_delay_ms)
+BATCH_THROUGHPUT = (16, 1400, 100)   # few, large datagrams
+BATCH_LATENCY = (2, 600, 20)         # at most ~one extra frame of delay
+
+
+class FrameBatcher:
+    """Collects frame datagrams into KIND_BATCH datagrams."""
+
+    def __init__(self, max_frames=16, max_bytes=1400, max_delay_ms=100):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.max_delay_ms = max_delay_ms
+        self.seq = 0
+        # double buffered: one is being sent while the next fills up
+        self._bufs = (bytearray(max_bytes), bytearray(max_bytes))
+        self._cur = 0
+        self._offsets = [0] * max_frames
+        self._count = 0
+        self._end = HEADER_SIZE
+        self._first_tick = 0
+
+    def add(self, data, tick_ms):
+        """
+        Appends one frame datagram. Returns a batch datagram to send, or
+        None while the batch is still filling up.
+        """
+        n = len(data)
+        out = None
+        if self._count and self._end + n + 2 * (self._count + 1) > self.max_bytes:
+            out = self.flush(tick_ms)
+        if HEADER_SIZE + n + 2 > self.max_bytes:
+            raise ValueError("frame larger than batch budget")
+
+        buf = self._bufs[self._cur]
+        buf[self._end:self._end + n] = data
+        if not self._count:
+            self._first_tick = tick_ms
+        self._offsets[self._count] = self._end
+        self._count += 1
+        self._end += n
+
+        if self._count >= self.max_frames:
+            # cannot coincide with the overflow flush above: that needs a
+            # frame already waiting, and then max_frames > 1
+            out = self.flush(tick_ms)
+        return out
+
+    def poll(self, tick_ms):
+        """Call every loop iteration, returns a batch whose time is up."""
+        if self._count and time.ticks_diff(tick_ms, self._first_tick) >= self.max_delay_ms:
+            return self.flush(tick_ms)
+        return None
+
+    def flush(self, tick_ms):
+        """Closes the current batch, returns it or None if it is empty."""
+        if not self._count:
+            return None
+        buf = self._bufs[self._cur]
+        o = self._end
+        for i in range(self._count):
+            pack_into("<H", buf, o, self._offsets[i])
+            o += 2
+        pack_header(buf, 0, KIND_BATCH, self.seq, self._count, 0, tick_ms)
+        self.seq = (self.seq + 1) & 0xFFFF
+
+        self._cur ^= 1
+        self._count = 0
+        self._end = HEADER_SIZE
+        return memoryview(buf)[:o]
@@ -0,0 +1,141 @@
+"""
+Fast boot of the ToF bricks (MicroPython).
+
+The two slow steps of a boot do not depend on each other: WiFi
+association (scan, auth, DHCP) runs in the WiFi driver's own task once
+wlan.connect() was called, and tof.init() uploads the sensor firmware
+(tens of kB) over I2C. boot_station() starts the association first, uploads the
+firmware while it is in progress and only then waits for the IP, so
+the boot takes the longer of the two instead of their sum. The upload
+cannot yield (the driver's init() is one call), so init_tof() is a plain
+function run before the first await, not a task next to the WiFi wait:
+
+    boot = BootTimer()
+    ip, tof = await boot_station(wlan, SSID, KEY, VL53L5CXMP, 3, 2, boot)
+    ...
+    boot.first_frame()              # after the first sendto()
+
+make_i2c() prefers the hardware I2C peripheral (any pins on the ESP32-C3
+through the GPIO matrix) at I2C_HW_FREQ, the firmware upload is then
+several times faster than on the bit-banged SoftI2C at 400 kHz. It falls
+back to SoftI2C if the peripheral cannot be created or does not see the
+sensor, and init_tof() retries on SoftI2C if the upload fails.
+
+BootTimer prints one "[BOOT]" line per phase and, at the first frame,
+the time since reset, so slow boots after a brownout or watchdog reset
+show up in the log.
+"""
+
+import time
+
+import uasyncio as asyncio
+from machine import Pin, SoftI2C
+
+try:
+    from machine import I2C
+except ImportError:
+    I2C = None
+
+I2C_HW_ID = 0
+I2C_HW_FREQ = 1_000_000     # VL53L5CX supports fast mode plus
+I2C_SOFT_FREQ = 400_000
+TOF_ADDR = 0x29
+
+WIFI_TIMEOUT_MS = 30_000
+WIFI_POLL_MS = 50
+
+
+class BootTimer:
+    """Start / end of each boot phase, in ms since the timer was created."""
+
+    def __init__(self):
+        self.t0 = time.ticks_ms()   # ticks_ms() counts from reset on the brick
+        self.starts = {}
+        self.done = False
+
+    def ms(self):
+        return time.ticks_diff(time.ticks_ms(), self.t0)
+
+    def begin(self, name):
+        self.starts[name] = self.ms()
+
+    def end(self, name, note=""):
+        start = self.starts.get(name, 0)
+        end = self.ms()
+        print("[BOOT] %-10s %5d ms  (%d..%d)%s" % (name, end - start, start, end, note))
+
+    def first_frame(self):
+        """Call after the first frame went out, reports once."""
+        if self.done:
+            return
+        self.done = True
+        print("[BOOT] first frame %d ms after start, %d ms after reset" % (self.ms(), time.ticks_ms()))
+
+
+def make_i2c(sda, scl, hw_id=I2C_HW_ID, freq=I2C_HW_FREQ):
+    """Hardware I2C at `freq` when available, else SoftI2C at I2C_SOFT_FREQ."""
+    if hw_id is not None and I2C is not None:
+        try:
+            i2c = I2C(hw_id, sda=Pin(sda), scl=Pin(scl), freq=freq)
+            if TOF_ADDR in i2c.scan():
+                return i2c
+        except (ValueError, OSError, TypeError):
+            pass
+        print("[BOOT] hardware I2C unavailable, using SoftI2C")
+    return SoftI2C(sda=Pin(sda), scl=Pin(scl), freq=I2C_SOFT_FREQ)
+
+
+async def connect_wifi(wlan, boot, timeout_ms=WIFI_TIMEOUT_MS, start=None):
+    """
+    Waits for the association started by boot_station(), polling every
+    WIFI_POLL_MS without blocking the loop. The timeout counts from
+    `start` (ticks_ms of wlan.connect(), default now). Returns the IP or None.
+    """
+    if start is None:
+        start = time.ticks_ms()
+    while not wlan.isconnected():
+        if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+            boot.end("wifi", "  FAILED status=%s" % wlan.status())
+            return None
+        await asyncio.sleep_ms(WIFI_POLL_MS)
+    ip = wlan.ifconfig()[0]
+    boot.end("wifi", "  ip=%s" % ip)
+    return ip
+
+
+def init_tof(make_tof, sda, scl, boot, hw_id=I2C_HW_ID):
+    """
+    Builds the sensor with make_tof(i2c) and initialises it. tof.init()
+    blocks for the firmware upload, the association keeps going in the
+    WiFi driver meanwhile.
+    """
+    boot.begin("tof_init")
+    i2c = make_i2c(sda, scl, hw_id)
+    tof = make_tof(i2c)
+    try:
+        tof.init()
+    except OSError as e:
+        if I2C is None or not isinstance(i2c, I2C):
+            raise
+        # bus too fast for the wiring, the upload is not worth losing the sensor
+        print("[BOOT] tof.init() failed on hardware I2C (%s), retrying on SoftI2C" % e)
+        i2c = SoftI2C(sda=Pin(sda), scl=Pin(scl), freq=I2C_SOFT_FREQ)
+        tof = make_tof(i2c)
+        tof.init()
+    boot.end("tof_init", "  %s" % type(i2c).__name__)
+    return tof
+
+
+async def boot_station(wlan, ssid, key, make_tof, sda, scl, boot, hw_id=I2C_HW_ID,
+                       timeout_ms=WIFI_TIMEOUT_MS):
+    """Associates and initialises the sensor concurrently, returns (ip, tof)."""
+    boot.begin("wifi")
+    start = time.ticks_ms()
+    wlan.active(True)
+    if not wlan.isconnected():
+        # a connect left over from before a soft reset would make connect() raise
+        wlan.disconnect()
+        wlan.connect(ssid, key)
+    tof = init_tof(make_tof, sda, scl, boot, hw_id)
+    ip = await connect_wifi(wlan, boot, timeout_ms, start)
+    return ip, tof
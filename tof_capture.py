@@ -0,0 +1,323 @@
+"""
+Recording and replay of ToF sessions.
+
+Capture file layout (little endian):
+
+    offset   size         field
+    0        8            magic b"TOFCAP01"
+    8        2            header size (HEADER_SIZE)
+    10       2            record size (RECORD_DTYPE.itemsize)
+    12       4            reserved
+    16       8            wall clock time.time() when the capture started
+    24       MAX_SOURCES  source table, SOURCE_SLOT bytes each, "ip:port"
+             * SOURCE_SLOT  ASCII zero padded, index = record "source"
+    HEADER_SIZE ...       fixed size records (RECORD_DTYPE), append only
+
+Every record holds the index fields (receive time relative to the start,
+device tick, seq, source) next to the frame itself. Records have a fixed
+size, so the reader maps the whole file with np.memmap: opening a multi
+hour capture is instant, and a time range is found by binary search on
+the `t` column without touching the rest of the file. A partial record at
+the end (recorder killed mid-write) is ignored.
+
+    python tof_capture.py record session.tofcap [--duration 60]
+    python tof_capture.py info session.tofcap
+    python tof_capture.py replay session.tofcap [--speed 4 | --max] [--start 10 --end 20]
+
+Replay re-sends the frames as normal tof_proto datagrams with their
+original seq and tick, one UDP socket per recorded source, so viewer.py
+and viewer3.py work against it unchanged.
+"""
+
+import argparse
+import os
+import socket
+import struct
+import time
+
+import numpy as np
+
+from tof_decode import TICKS_PERIOD
+from tof_proto import HEADER_SIZE as FRAME_HEADER_SIZE, KIND_FRAME, FIELD_DISTANCE, pack_header
+from tof_receiver import FrameReceiver, UDP_PORT
+
+MAGIC = b"TOFCAP01"
+HEADER_SIZE = 512
+MAX_SOURCES = 20
+SOURCE_SLOT = 24
+SOURCES_OFFSET = 24
+MAX_ZONES = 64
+
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),           # seconds since capture start (host clock)
+    ("tick_ms", "<u4"),     # device tick, 0 for legacy frames
+    ("seq", "<i4"),         # device seq, -1 for legacy frames
+    ("source", "<u2"),      # index into the header source table
+    ("zones", "u1"),
+    ("fields", "u1"),
+    ("distance", "<u2", (MAX_ZONES,)),
+])
+
+
+def _source_key(source):
+    if isinstance(source, tuple):
+        return "%s:%d" % source[:2]
+    return str(source)
+
+
+class CaptureWriter:
+    """Appends frames to a capture file."""
+
+    def __init__(self, path, flush_every=64):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._sources = {}
+        self._rec = np.zeros(1, dtype=RECORD_DTYPE)
+        self._start_mono = None
+        self._file = open(path, "wb")
+        self._start_wall = time.time()
+        header = bytearray(HEADER_SIZE)
+        header[0:8] = MAGIC
+        struct.pack_into("<HH4xd", header, 8, HEADER_SIZE, RECORD_DTYPE.itemsize, self._start_wall)
+        self._file.write(header)
+
+    def _source_id(self, source):
+        key = _source_key(source)
+        sid = self._sources.get(key)
+        if sid is None:
+            if len(self._sources) >= MAX_SOURCES:
+                raise ValueError("capture holds at most %d sources" % MAX_SOURCES)
+            sid = self._sources[key] = len(self._sources)
+            # fill the slot in the fixed header, then go back to appending
+            slot = key.encode()[:SOURCE_SLOT].ljust(SOURCE_SLOT, b"\0")
+            self._file.seek(SOURCES_OFFSET + sid * SOURCE_SLOT)
+            self._file.write(slot)
+            self._file.seek(0, os.SEEK_END)
+        return sid
+
+    def write(self, frame):
+        if self._start_mono is None:
+            self._start_mono = frame.recv_time
+        rec = self._rec[0]
+        rec["t"] = frame.recv_time - self._start_mono
+        rec["tick_ms"] = frame.tick_ms or 0
+        rec["seq"] = -1 if frame.seq is None else frame.seq
+        rec["source"] = self._source_id(frame.source)
+        rec["zones"] = frame.zones
+        rec["fields"] = frame.fields
+        rec["distance"][:frame.zones] = frame.distance.reshape(-1)
+        rec["distance"][frame.zones:] = 0
+        self._file.write(self._rec.tobytes())
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureReader:
+    """
+    Memory mapped view of a capture file.
+
+    `records` is the np.memmap of RECORD_DTYPE, columns can be sliced
+    directly (records["distance"][a:b], records["t"], ...).
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[0:8] != MAGIC:
+            raise ValueError("%s is not a ToF capture" % path)
+        header_size, record_size, self.start_wall = struct.unpack_from("<HH4xd", header, 8)
+        if record_size != RECORD_DTYPE.itemsize:
+            raise ValueError("unsupported record size %d" % record_size)
+        self.sources = []
+        for i in range(MAX_SOURCES):
+            off = SOURCES_OFFSET + i * SOURCE_SLOT
+            name = header[off:off + SOURCE_SLOT].rstrip(b"\0")
+            if not name:
+                break
+            self.sources.append(name.decode())
+
+        count = (os.path.getsize(path) - header_size) // record_size
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                                     offset=header_size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return float(self.records["t"][-1]) if len(self.records) else 0.0
+
+    def span(self, start=None, end=None):
+        """Index range [i, j) of the records with start <= t < end (seconds)."""
+        t = self.records["t"]
+        i = 0 if start is None else int(np.searchsorted(t, start, side="left"))
+        j = len(t) if end is None else int(np.searchsorted(t, end, side="left"))
+        return i, j
+
+    def between(self, start=None, end=None):
+        """Records with start <= t < end, still backed by the memmap."""
+        i, j = self.span(start, end)
+        return self.records[i:j]
+
+    def frames(self, start=None, end=None, source=None):
+        """
+        Distances of a time range as a (count, side, side) array, a memmap
+        view for 8x8 captures. All frames in the range must have the same
+        resolution; use `source` to pick one sensor out of a multi-sensor
+        capture (allocates).
+        """
+        recs = self.between(start, end)
+        if source is not None:
+            recs = recs[recs["source"] == source]
+        if not len(recs):
+            return np.zeros((0, 8, 8), dtype=np.uint16)
+        zones = int(recs["zones"][0])
+        side = 4 if zones == 16 else 8
+        return recs["distance"][:, :zones].reshape(-1, side, side)
+
+
+# -------------------- RECORD / REPLAY --------------------
+
+def record(path, port=UDP_PORT, duration=None, max_age_ms=None):
+    """Records everything arriving on `port` until Ctrl+C or `duration` s."""
+    deadline = None if duration is None else time.monotonic() + duration
+    with FrameReceiver(port, max_age_ms=max_age_ms, queue_size=4096) as rx, CaptureWriter(path) as writer:
+        last = None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                # disk writes stay off the receiver thread
+                last = rx.wait(timeout=0.2, newer_than=last)
+                for frame in rx.drain():
+                    writer.write(frame)
+        except KeyboardInterrupt:
+            pass
+        for frame in rx.drain():
+            writer.write(frame)
+        print("recorded %d frames, %s" % (writer.count, rx.stats()))
+        if rx.overflows:
+            print("WARNING: %d frames lost in the receive queue" % rx.overflows)
+
+
+def replay(path, host="127.0.0.1", port=UDP_PORT, speed=1.0, start=None, end=None, loop=False):
+    """
+    Re-sends a capture. speed=1.0 is real time, 4.0 four times faster,
+    None as fast as possible.
+
+    tick_ms is rewritten to the replay clock (first recorded tick + time
+    since the replay started, across loops) and seq continues on every
+    loop pass, so receivers do not take the frames for late or stale ones.
+    """
+    cap = CaptureReader(path)
+    recs = cap.between(start, end)
+    if not len(recs):
+        print("nothing to replay")
+        return
+
+    socks = []
+    for _ in range(max(1, len(cap.sources))):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        socks.append(sock)
+    target = (host, port)
+    buf = bytearray(FRAME_HEADER_SIZE + MAX_ZONES * 2)
+    legacy_seq = [0] * len(socks)
+
+    # per source: first recorded tick / seq, seq offset of the current pass
+    first_tick = [None] * len(socks)
+    first_seq = [None] * len(socks)
+    last_seq = [0] * len(socks)
+    seq_shift = [0] * len(socks)
+    sources, idx = np.unique(recs["source"], return_index=True)
+    for sid, i in zip(sources.tolist(), idx.tolist()):
+        first_tick[sid] = int(recs["tick_ms"][i])
+        first_seq[sid] = int(recs["seq"][i])            # -1: legacy, numbered by legacy_seq
+
+    try:
+        clock0 = time.monotonic()
+        while True:
+            t0 = float(recs["t"][0])
+            wall0 = time.monotonic()
+            for rec in recs:
+                if speed:
+                    delay = wall0 + (float(rec["t"]) - t0) / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                sid = int(rec["source"])
+                zones = int(rec["zones"])
+                seq = int(rec["seq"])
+                if seq < 0:
+                    seq = legacy_seq[sid]
+                    legacy_seq[sid] = (seq + 1) & 0xFFFF
+                seq = (seq + seq_shift[sid]) & 0xFFFF
+                last_seq[sid] = seq
+                tick = first_tick[sid] + int((time.monotonic() - clock0) * 1000)
+                # only the distances are recorded, not the extra fields
+                pack_header(buf, 0, KIND_FRAME, seq, zones, FIELD_DISTANCE, tick & (TICKS_PERIOD - 1))
+                n = FRAME_HEADER_SIZE + zones * 2
+                buf[FRAME_HEADER_SIZE:n] = rec["distance"][:zones].tobytes()
+                socks[sid].sendto(memoryview(buf)[:n], target)
+            if not loop:
+                break
+            for sid in range(len(socks)):
+                if first_seq[sid] is not None and first_seq[sid] >= 0:
+                    # the next pass continues right after this one
+                    seq_shift[sid] = (last_seq[sid] + 1 - first_seq[sid]) & 0xFFFF
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sock in socks:
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record / replay ToF frame streams")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("record")
+    p.add_argument("path")
+    p.add_argument("--port", type=int, default=UDP_PORT)
+    p.add_argument("--duration", type=float, default=None)
+
+    p = sub.add_parser("info")
+    p.add_argument("path")
+
+    p = sub.add_parser("replay")
+    p.add_argument("path")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=UDP_PORT)
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--max", action="store_true", help="send as fast as possible")
+    p.add_argument("--start", type=float, default=None, help="seconds from capture start")
+    p.add_argument("--end", type=float, default=None)
+    p.add_argument("--loop", action="store_true")
+
+    args = parser.parse_args()
+    if args.cmd == "record":
+        record(args.path, args.port, args.duration)
+    elif args.cmd == "info":
+        cap = CaptureReader(args.path)
+        print("%d frames, %.1f s, started %s" % (
+            len(cap), cap.duration, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cap.start_wall))))
+        for i, name in enumerate(cap.sources):
+            print("  source %d: %s, %d frames" % (i, name, np.count_nonzero(cap.records["source"] == i)))
+    else:
+        replay(args.path, args.host, args.port, None if args.max else args.speed,
+               args.start, args.end, args.loop)
+
+
+if __name__ == "__main__":
+    main()
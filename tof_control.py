@@ -0,0 +1,238 @@
+"""
+Host side of the KIND_CONTROL channel (see tof_proto.py / tof_profile.py).
+
+    python tof_control.py 192.168.4.1 profile 4x4@60     # pin a profile
+    python tof_control.py 192.168.4.1 profile 8x8@15 --auto
+    python tof_control.py 192.168.4.1 auto               # back to automatic
+    python tof_control.py 192.168.4.1 auto --off
+    python tof_control.py 192.168.4.1 frames 40          # full frames from a summary mode brick
+
+LossReporter closes the loop from a running receiver: once per interval it
+sends the loss each source saw since the last report back to that source,
+so the brick backs off its rate when the link cannot keep up:
+
+    rx = FrameReceiver().start()
+    LossReporter(rx).start()
+
+Subscription asks the bricks for a unicast stream (see tof_transport.py):
+every brick heard on the broadcast fallback, plus any given explicitly,
+gets an OP_SUBSCRIBE for the receiver's port, renewed before the lease
+runs out:
+
+    Subscription(rx, bricks=["192.168.4.1"]).start()
+"""
+
+import argparse
+import socket
+import struct
+import threading
+
+from tof_proto import (
+    HEADER_SIZE, KIND_CONTROL, OP_SET_PROFILE, OP_LOSS_REPORT, OP_SUBSCRIBE, OP_UNSUBSCRIBE,
+    OP_FULL_FRAMES,
+    CONTROL_PORT, ZONES_4X4, ZONES_8X8, pack_header,
+)
+
+REPORT_INTERVAL_S = 1.0
+MIN_EXPECTED = 10           # frames in an interval before loss means anything
+LEASE_S = 10                # subscription lease, renewed every LEASE_S / 3
+
+
+def parse_profile(text):
+    """'4x4@60' -> (16, 60)."""
+    res, _, freq = text.lower().partition("@")
+    zones = {"4x4": ZONES_4X4, "8x8": ZONES_8X8}.get(res)
+    if zones is None or not freq.isdigit():
+        raise ValueError("profile must look like 4x4@60 or 8x8@15, got %r" % text)
+    return zones, int(freq)
+
+
+class ControlClient:
+    """Sends KIND_CONTROL datagrams to one brick."""
+
+    def __init__(self, host, port=CONTROL_PORT, sock=None):
+        self.target = (host, port)
+        self.seq = 0
+        self._sock = sock if sock is not None else socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._buf = bytearray(HEADER_SIZE + 5)
+
+    def _send(self, payload):
+        pack_header(self._buf, 0, KIND_CONTROL, self.seq, 0, 0, 0)
+        self.seq = (self.seq + 1) & 0xFFFF
+        n = HEADER_SIZE + len(payload)
+        self._buf[HEADER_SIZE:n] = payload
+        self._sock.sendto(memoryview(self._buf)[:n], self.target)
+
+    def set_profile(self, zones, freq_hz, auto=False):
+        self._send(struct.pack("<BBBB", OP_SET_PROFILE, zones, freq_hz, int(auto)))
+
+    def auto(self, enabled=True):
+        self._send(struct.pack("<BBBB", OP_SET_PROFILE, 0, 0, int(enabled)))
+
+    def report_loss(self, loss_rate):
+        permille = min(1000, max(0, int(round(loss_rate * 1000))))
+        self._send(struct.pack("<BH", OP_LOSS_REPORT, permille))
+
+    def subscribe(self, port, lease_s=LEASE_S):
+        self._send(struct.pack("<BHH", OP_SUBSCRIBE, port, lease_s))
+
+    def unsubscribe(self, port):
+        self._send(struct.pack("<BH", OP_UNSUBSCRIBE, port))
+
+    def full_frames(self, frames):
+        """Summary mode: the next `frames` frames in full, 0xFFFF = until 0 is sent."""
+        self._send(struct.pack("<BH", OP_FULL_FRAMES, min(max(0, frames), 0xFFFF)))
+
+    def close(self):
+        self._sock.close()
+
+
+class LossReporter:
+    """Reports per source loss of a FrameReceiver back to the bricks."""
+
+    def __init__(self, rx, interval=REPORT_INTERVAL_S, port=CONTROL_PORT):
+        self.rx = rx
+        self.interval = interval
+        self.port = port
+        self.reports = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._clients = {}
+        self._last = {}             # source -> (accepted + stale, dropped)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tof-loss-reporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._sock.close()
+
+    def report(self):
+        """Sends one report per source that saw enough frames since the last call."""
+        for source, src in list(self.rx.decoder.sources.items()):
+            if not isinstance(source, tuple):
+                continue
+            st = src.stats
+            got, dropped = st.accepted + st.stale, st.dropped
+            prev_got, prev_dropped = self._last.get(source, (0, 0))
+            d_got, d_dropped = got - prev_got, dropped - prev_dropped
+            if d_got + d_dropped < MIN_EXPECTED:
+                continue
+            self._last[source] = (got, dropped)
+            client = self._clients.get(source[0])
+            if client is None:
+                client = self._clients[source[0]] = ControlClient(source[0], self.port, self._sock)
+            client.report_loss(d_dropped / (d_got + d_dropped))
+            self.reports += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except OSError:
+                pass    # brick gone for a moment, try again next interval
+
+
+class Subscription:
+    """Keeps the bricks streaming unicast to a FrameReceiver."""
+
+    def __init__(self, rx, bricks=(), lease_s=LEASE_S, port=CONTROL_PORT):
+        self.rx = rx
+        self.bricks = list(bricks)
+        self.lease_s = lease_s
+        self.port = port
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._clients = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tof-subscription", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for client in self._clients.values():
+            try:
+                client.unsubscribe(self.rx.port)
+            except OSError:
+                pass
+        self._sock.close()
+
+    def targets(self):
+        heard = [s[0] for s in list(self.rx.decoder.sources) if isinstance(s, tuple)]
+        return list(dict.fromkeys(self.bricks + heard))
+
+    def renew(self):
+        for ip in self.targets():
+            client = self._clients.get(ip)
+            if client is None:
+                client = self._clients[ip] = ControlClient(ip, self.port, self._sock)
+            client.subscribe(self.rx.port, self.lease_s)
+
+    def _run(self):
+        # first renewal right away, then well inside the lease
+        interval = max(0.5, self.lease_s / 3.0)
+        while True:
+            try:
+                self.renew()
+            except OSError:
+                pass    # brick not reachable yet
+            # discovery: retry soon while nothing has been heard
+            if self._stop.wait(interval if self._clients else 1.0):
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Switch the ToF profile of a brick")
+    parser.add_argument("host", help="brick IP address")
+    parser.add_argument("--port", type=int, default=CONTROL_PORT)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("profile", help="pin a profile, e.g. 4x4@60")
+    p.add_argument("profile")
+    p.add_argument("--auto", action="store_true", help="keep the automatic policy running")
+
+    p = sub.add_parser("auto", help="hand the profile back to the brick")
+    p.add_argument("--off", action="store_true")
+
+    p = sub.add_parser("subscribe", help="ask for a unicast stream to this host")
+    p.add_argument("--data-port", type=int, default=5005)
+    p.add_argument("--lease", type=int, default=LEASE_S)
+
+    p = sub.add_parser("unsubscribe")
+    p.add_argument("--data-port", type=int, default=5005)
+
+    p = sub.add_parser("frames", help="full frames from a summary mode brick")
+    p.add_argument("count", type=int, help="frames, 0 = back to summaries, -1 = until then")
+
+    args = parser.parse_args()
+    client = ControlClient(args.host, args.port)
+    try:
+        if args.cmd == "profile":
+            zones, freq = parse_profile(args.profile)
+            client.set_profile(zones, freq, args.auto)
+        elif args.cmd == "subscribe":
+            client.subscribe(args.data_port, args.lease)
+        elif args.cmd == "unsubscribe":
+            client.unsubscribe(args.data_port)
+        elif args.cmd == "frames":
+            client.full_frames(0xFFFF if args.count < 0 else args.count)
+        else:
+            client.auto(not args.off)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
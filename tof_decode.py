@@ -0,0 +1,397 @@
+"""
+Host side decoder for the ToF datagrams described in tof_proto.py.
+
+Keeps per-device sequence / clock state so the receiver can tell packet
+loss (gaps in seq) from sensor stalls (no gap, just no packets), drop
+duplicates and late reordered frames, and skip frames that are too old to
+be worth rendering.
+
+Extra ranging fields (tof_proto FIELD_STATUS ...) are unpacked into
+Frame.extra, a NumPy structured array of shape (side, side) with one
+column per field present in the datagram ("status", "sigma_mm",
+"signal", "targets"), or None for distance-only frames:
+
+    if frame.extra is not None:
+        good = zone_valid(frame.extra)          # (side, side) bool
+"""
+
+import time
+
+import numpy as np
+
+from struct import unpack_from
+
+from tof_proto import (
+    HEADER_SIZE, KIND_FRAME, KIND_DELTA, KIND_BATCH, KIND_SUMMARY, LEGACY_FRAME_SIZE, ZONES_8X8,
+    FIELD_DISTANCE, FIELD_STATUS, FIELD_SIGMA, FIELD_SIGNAL, FIELD_TARGETS, FIELDS_EXTRA,
+    extra_size, unpack_header,
+)
+
+SEQ_MOD = 1 << 16
+TICKS_PERIOD = 1 << 30      # MicroPython time.ticks_ms() wraps here
+RESET_MS = 1000             # device clock going back this much = reboot
+REORDER_WINDOW = 64         # older seq further back than this = reboot
+
+VALID_STATUS = (5, 9)       # VL53L5CX target status: range valid (9: large pulse)
+
+# field bit -> structured array column, in wire order
+EXTRA_COLUMNS = (
+    (FIELD_STATUS, ("status", "u1")),
+    (FIELD_SIGMA, ("sigma_mm", "u1")),
+    (FIELD_SIGNAL, ("signal", "<f4")),
+    (FIELD_TARGETS, ("targets", "u1")),
+)
+_extra_dtypes = {}
+
+
+def seq_diff(a, b):
+    """Signed distance a - b on the 16 bit sequence ring."""
+    return ((a - b + (SEQ_MOD >> 1)) % SEQ_MOD) - (SEQ_MOD >> 1)
+
+
+def ticks_diff(a, b):
+    """Signed a - b for device ticks, same semantics as time.ticks_diff()."""
+    return ((a - b + (TICKS_PERIOD >> 1)) % TICKS_PERIOD) - (TICKS_PERIOD >> 1)
+
+
+def decode_varints(b):
+    """
+    Decodes a uint8 array of LEB128 varints into an int64 array, without a
+    Python loop per value. A trailing unterminated varint is ignored.
+    """
+    ends = np.flatnonzero((b & 0x80) == 0)
+    if ends.size == 0:
+        return np.empty(0, dtype=np.int64)
+    b = b[:ends[-1] + 1].astype(np.int64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    group = np.repeat(np.arange(ends.size), ends - starts + 1)
+    shift = 7 * (np.arange(b.size) - starts[group])
+    return np.add.reduceat((b & 0x7F) << shift, starts)
+
+
+def unzigzag(z):
+    return (z >> 1) ^ -(z & 1)
+
+
+def extra_dtype(fields):
+    """Structured dtype of the extra fields in `fields`, None if there are none."""
+    fields &= FIELDS_EXTRA
+    if not fields:
+        return None
+    dt = _extra_dtypes.get(fields)
+    if dt is None:
+        dt = _extra_dtypes[fields] = np.dtype([col for bit, col in EXTRA_COLUMNS if fields & bit])
+    return dt
+
+
+def dequantize_signal(q):
+    """Inverse of tof_proto.quantize_signal() for a uint8 array, float32 kcps."""
+    q = q.astype(np.int64)
+    e = q >> 4
+    m = q & 0x0F
+    return np.where(e == 0, m, (16 + m) << np.maximum(e - 1, 0)).astype(np.float32)
+
+
+def _nibbles(raw, zones):
+    out = np.empty(zones, dtype=np.uint8)
+    out[0::2] = raw & 0x0F
+    out[1::2] = raw >> 4
+    return out
+
+
+def unpack_extra(data, offset, zones, fields):
+    """
+    Extra field blocks of one frame starting at `offset`, as a new (zones,)
+    structured array (see extra_dtype()), or None for distance-only frames.
+    """
+    dt = extra_dtype(fields)
+    if dt is None:
+        return None
+    raw = np.frombuffer(data, dtype=np.uint8, count=extra_size(zones, fields), offset=offset)
+    out = np.empty(zones, dtype=dt)
+    o = 0
+    if fields & FIELD_STATUS:
+        out["status"] = _nibbles(raw[o:o + (zones >> 1)], zones)
+        o += zones >> 1
+    if fields & FIELD_SIGMA:
+        out["sigma_mm"] = raw[o:o + zones]
+        o += zones
+    if fields & FIELD_SIGNAL:
+        out["signal"] = dequantize_signal(raw[o:o + zones])
+        o += zones
+    if fields & FIELD_TARGETS:
+        out["targets"] = _nibbles(raw[o:o + (zones >> 1)], zones)
+    return out
+
+
+def zone_valid(extra):
+    """
+    Zones with a trustworthy distance according to the extra fields (target
+    status, number of targets); all True when the frame carries neither.
+    """
+    names = extra.dtype.names
+    valid = np.ones(extra.shape, dtype=bool)
+    if "status" in names:
+        valid &= np.isin(extra["status"], VALID_STATUS)
+    if "targets" in names:
+        valid &= extra["targets"] > 0
+    return valid
+
+
+def unbatch(data):
+    """
+    Splits a KIND_BATCH datagram (see tof_batch.py) into memoryviews of the
+    inner datagrams, oldest first. Anything else is returned as is.
+    """
+    header = unpack_header(data)
+    if header is None or header[0] != KIND_BATCH:
+        return [data]
+    count = header[2]
+    table = len(data) - 2 * count
+    if table < HEADER_SIZE:
+        return []
+    offsets = unpack_from("<%dH" % count, data, table) + (table,)
+    mv = memoryview(data)
+    return [mv[offsets[i]:offsets[i + 1]] for i in range(count)
+            if HEADER_SIZE <= offsets[i] < offsets[i + 1] <= table]
+
+
+class Frame:
+    """One decoded distance frame."""
+
+    __slots__ = ("source", "seq", "tick_ms", "zones", "fields", "distance", "recv_time", "age_ms",
+                 "extra")
+
+    def __init__(self, source, seq, tick_ms, zones, fields, distance, recv_time, age_ms=0, extra=None):
+        self.source = source
+        self.seq = seq              # None for legacy headerless frames
+        self.tick_ms = tick_ms
+        self.zones = zones
+        self.fields = fields
+        self.distance = distance    # uint16 array of shape (side, side)
+        self.recv_time = recv_time  # host time.monotonic()
+        self.age_ms = age_ms        # estimated extra delay vs the fastest frame seen
+        self.extra = extra          # structured (side, side) array of the extra fields, or None
+
+    @property
+    def side(self):
+        return 4 if self.zones == 16 else 8
+
+    def __repr__(self):
+        return "Frame(source=%r, seq=%r, zones=%d, age_ms=%d)" % (
+            self.source, self.seq, self.zones, self.age_ms)
+
+
+class LinkStats:
+    """Counters for one source (or the sum of all of them)."""
+
+    __slots__ = ("received", "accepted", "dropped", "duplicates", "reordered", "stale", "resets",
+                 "invalid", "no_key")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def add(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def loss_rate(self):
+        expected = self.accepted + self.stale + self.dropped
+        return self.dropped / expected if expected else 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return "LinkStats(%s)" % ", ".join("%s=%d" % kv for kv in self.as_dict().items())
+
+
+class _Source:
+    __slots__ = ("last_seq", "last_tick", "offset_ms", "stats", "key_seq", "key")
+
+    def __init__(self):
+        self.last_seq = None
+        self.last_tick = 0
+        self.offset_ms = None
+        self.stats = LinkStats()
+        self.key_seq = None                             # last keyframe, for KIND_DELTA
+        self.key = np.zeros(ZONES_8X8, dtype=np.int64)
+
+
+class FrameDecoder:
+    """
+    Turns datagrams into Frame objects.
+
+    decode() returns None for anything that should not be shown: garbage,
+    duplicates, frames older than one already returned, and frames whose
+    estimated age exceeds `max_age_ms` (pass None to keep everything).
+
+    Age is estimated per source as (host receive time - device tick) minus
+    the smallest such value seen so far, i.e. the extra delay compared to
+    the fastest frame. The baseline slowly relaxes upwards so clock drift
+    between host and brick does not accumulate.
+
+    KIND_DELTA datagrams are expanded against the last keyframe of the same
+    source; deltas whose keyframe was lost are counted as `no_key`.
+
+    KIND_BATCH datagrams carry several frames: decode_many() returns all of
+    them, decode() only the newest one.
+    """
+
+    def __init__(self, max_age_ms=250):
+        self.max_age_ms = max_age_ms
+        self.sources = {}
+
+    def _source(self, addr):
+        src = self.sources.get(addr)
+        if src is None:
+            src = self.sources[addr] = _Source()
+        return src
+
+    def stats(self, addr=None):
+        """Stats of one source, or the sum over all sources."""
+        if addr is not None:
+            return self._source(addr).stats
+        total = LinkStats()
+        for src in self.sources.values():
+            total.add(src.stats)
+        return total
+
+    def decode_many(self, data, addr=None, now=None):
+        """Returns the list of frames in `data`, oldest first."""
+        if now is None:
+            now = time.monotonic()
+        frames = []
+        for part in unbatch(data):
+            frame = self._decode_one(part, addr, now)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+    def decode(self, data, addr=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        frame = None
+        for part in unbatch(data):
+            frame = self._decode_one(part, addr, now) or frame
+        return frame
+
+    def _decode_one(self, data, addr, now):
+        src = self._source(addr)
+        st = src.stats
+        st.received += 1
+
+        header = unpack_header(data)
+        if header is None:
+            if len(data) == LEGACY_FRAME_SIZE:
+                st.accepted += 1
+                dist = np.frombuffer(data, dtype="<u2", count=ZONES_8X8).reshape(8, 8)
+                return Frame(addr, None, None, ZONES_8X8, 1, dist, now)
+            st.invalid += 1
+            return None
+
+        kind, seq, zones, fields, tick = header
+        if kind == KIND_SUMMARY:
+            # summary mode brick (tof_summary.py), not a frame and not an error
+            return None
+        extra = extra_size(zones, fields)
+        if kind == KIND_FRAME:
+            extra_at = HEADER_SIZE + zones * 2
+        elif kind == KIND_DELTA:
+            extra_at = HEADER_SIZE + 2 + (zones >> 3)
+        else:
+            extra_at = None
+        if (extra_at is None or zones not in (16, 64) or not fields & FIELD_DISTANCE
+                or len(data) < extra_at + extra):
+            st.invalid += 1
+            return None
+
+        if not self._track(src, seq, tick):
+            return None
+
+        if kind == KIND_FRAME:
+            dist = np.frombuffer(data, dtype="<u2", count=zones, offset=HEADER_SIZE)
+            # keep it even if stale, the next deltas refer to it
+            src.key_seq = seq
+            src.key[:zones] = dist
+        else:
+            key_seq = data[HEADER_SIZE] | (data[HEADER_SIZE + 1] << 8)
+            if key_seq != src.key_seq:
+                st.no_key += 1
+                return None
+
+        age = self._age(src, tick, now)
+        if self.max_age_ms is not None and age > self.max_age_ms:
+            st.stale += 1
+            return None
+
+        if kind == KIND_DELTA:
+            dist = self._expand_delta(src, data, zones, extra)
+            if dist is None:
+                st.invalid += 1
+                return None
+
+        st.accepted += 1
+        side = 4 if zones == 16 else 8
+        if extra:
+            extra = unpack_extra(data, extra_at, zones, fields).reshape(side, side)
+        else:
+            extra = None
+        return Frame(addr, seq, tick, zones, fields, dist.reshape(side, side), now, age, extra)
+
+    def _expand_delta(self, src, data, zones, extra=0):
+        nbitmap = zones >> 3
+        raw = np.frombuffer(data, dtype=np.uint8, offset=HEADER_SIZE + 2)
+        changed = np.unpackbits(raw[:nbitmap], bitorder="little")[:zones].astype(bool)
+        deltas = unzigzag(decode_varints(raw[nbitmap + extra:]))
+        if deltas.size != np.count_nonzero(changed):
+            return None
+        dist = src.key[:zones].copy()
+        dist[changed] += deltas
+        return dist.astype(np.uint16)
+
+    def _track(self, src, seq, tick):
+        """Updates sequence state, returns False if the frame must be dropped."""
+        st = src.stats
+        if src.last_seq is None:
+            src.last_seq, src.last_tick = seq, tick
+            return True
+
+        d = seq_diff(seq, src.last_seq)
+        if d < -REORDER_WINDOW or (d <= 0 and ticks_diff(tick, src.last_tick) < -RESET_MS):
+            # device restarted, sequence and clock start over
+            st.resets += 1
+            src.last_seq, src.last_tick, src.offset_ms = seq, tick, None
+            src.key_seq = None
+            return True
+        if d == 0:
+            st.duplicates += 1
+            return False
+        if d < 0:
+            # arrived after a newer frame: it was counted as lost, now it is
+            # just late, and a newer frame has already been shown
+            st.reordered += 1
+            if st.dropped:
+                st.dropped -= 1
+            return False
+
+        st.dropped += d - 1
+        src.last_seq, src.last_tick = seq, tick
+        return True
+
+    def _age(self, src, tick, now):
+        # host clock - device clock on the device's ticks ring, so the 2^30
+        # wrap of ticks_ms() (12.4 days of uptime) is not a jump
+        sample = ticks_diff(int(now * 1000) & (TICKS_PERIOD - 1), tick)
+        if src.offset_ms is None:
+            src.offset_ms = sample
+            return 0
+        age = ticks_diff(sample, src.offset_ms)
+        if age < 0:
+            src.offset_ms = sample
+            return 0
+        src.offset_ms = ticks_diff(src.offset_ms + (age >> 8), 0)
+        return age
@@ -0,0 +1,122 @@
+"""
+Keyframe + delta encoding of distance frames (brick side).
+
+Every `key_interval` frames a normal KIND_FRAME (the keyframe) is sent. In
+between, KIND_DELTA datagrams only carry the zones that moved more than
+`deadband_mm` away from that keyframe:
+
+    offset        size      field
+    HEADER_SIZE   2         seq of the keyframe the deltas refer to
+    +2            zones/8   bitmap, bit i (LSB first) set = zone i present
+    +2+zones/8    extra     the extra field blocks of `fields` as in a
+                            KIND_FRAME, always sent in full (fixed size,
+                            see tof_proto.extra_size())
+    ...           ...       zigzag varints of (distance - keyframe) for
+                            every set bit, in zone order
+
+Deltas are relative to the keyframe and not to the previous frame, so a
+lost delta costs one frame and never corrupts the ones after it. Only a
+lost keyframe blanks the stream, until the next one.
+
+Runs allocation free once warmed up: all buffers are preallocated and the
+memoryview for each datagram length is created once and cached.
+"""
+
+from tof_proto import (
+    HEADER_SIZE, KIND_FRAME, KIND_DELTA, FIELD_DISTANCE, FIELDS_EXTRA, extra_size, pack_extra,
+    pack_header,
+)
+
+
+class DeltaPacker:
+    """Drop-in replacement for FramePacker that emits keyframes + deltas."""
+
+    def __init__(self, zones=64, key_interval=20, deadband_mm=10, fields=FIELD_DISTANCE):
+        self.key_interval = key_interval
+        self.deadband_mm = deadband_mm
+        self.fields = fields | FIELD_DISTANCE
+        self.seq = 0
+        self.key_seq = 0
+        self.resize(zones)
+
+    def resize(self, zones):
+        """Switches resolution, the sequence continues with a keyframe."""
+        self.zones = zones
+        self.key = [0] * zones
+        self._since_key = self.key_interval     # forces a keyframe first
+        self._nbitmap = (zones + 7) >> 3
+        self._extra = extra_size(zones, self.fields)
+        # zigzag of a 17 bit difference fits in 3 varint bytes
+        size = HEADER_SIZE + 2 + self._nbitmap + self._extra + zones * 3
+        self.buf = bytearray(size)
+        self._mv = memoryview(self.buf)
+        self._views = [None] * (size + 1)
+
+    def _view(self, n):
+        v = self._views[n]
+        if v is None:
+            v = self._views[n] = self._mv[:n]
+        return v
+
+    def force_keyframe(self):
+        self._since_key = self.key_interval
+
+    def pack(self, distance_mm, tick_ms, res=None):
+        """
+        Encodes one frame, returns a memoryview of the datagram to send.
+        `res` is the ranging result, needed with extra fields.
+        """
+        if self._since_key >= self.key_interval:
+            return self._pack_key(distance_mm, tick_ms, res)
+
+        buf = self.buf
+        key = self.key
+        deadband = self.deadband_mm
+        bitmap = HEADER_SIZE + 2
+        n = bitmap + self._nbitmap
+        if self.fields & FIELDS_EXTRA:
+            n = pack_extra(buf, n, res, self.zones, self.fields)
+        full = HEADER_SIZE + self.zones * 2 + self._extra
+        for i in range(self._nbitmap):
+            buf[bitmap + i] = 0
+
+        for i in range(self.zones):
+            d = (distance_mm[i] & 0xFFFF) - key[i]
+            if -deadband <= d <= deadband:
+                continue
+            buf[bitmap + (i >> 3)] |= 1 << (i & 7)
+            z = d << 1 if d >= 0 else ((-d) << 1) - 1
+            while z >= 0x80:
+                buf[n] = (z & 0x7F) | 0x80
+                n += 1
+                z >>= 7
+            buf[n] = z
+            n += 1
+            if n >= full:
+                # scene changed too much, a keyframe is smaller
+                return self._pack_key(distance_mm, tick_ms, res)
+
+        pack_header(buf, 0, KIND_DELTA, self.seq, self.zones, self.fields, tick_ms)
+        buf[HEADER_SIZE] = self.key_seq & 0xFF
+        buf[HEADER_SIZE + 1] = self.key_seq >> 8
+        self.seq = (self.seq + 1) & 0xFFFF
+        self._since_key += 1
+        return self._view(n)
+
+    def _pack_key(self, distance_mm, tick_ms, res):
+        buf = self.buf
+        key = self.key
+        pack_header(buf, 0, KIND_FRAME, self.seq, self.zones, self.fields, tick_ms)
+        o = HEADER_SIZE
+        for i in range(self.zones):
+            v = distance_mm[i] & 0xFFFF
+            key[i] = v
+            buf[o] = v & 0xFF
+            buf[o + 1] = v >> 8
+            o += 2
+        if self.fields & FIELDS_EXTRA:
+            o = pack_extra(buf, o, res, self.zones, self.fields)
+        self.key_seq = self.seq
+        self.seq = (self.seq + 1) & 0xFFFF
+        self._since_key = 1
+        return self._view(o)
@@ -0,0 +1,380 @@
+"""
+Temporal filtering of many sensors at once, in place on preallocated
+(sensors, zones) arrays.
+
+Every step takes one frame per sensor (or a subset of them) and runs, for
+all sensors and zones together:
+
+    validity    zones outside [min_mm, max_mm] (0 = no target) or masked
+                out by the caller (or, for Frames, by their target status,
+                tof_decode.zone_valid()) are ignored
+    Hampel      a sample further than hampel_k * MAD from the median of
+                the last `window` valid samples is an outlier and replaced
+                by that median
+    median      output the sliding median instead of the sample
+    EMA         exponential smoothing, restarted after a gap
+    hold        an invalid zone keeps its last value for `hold` of its
+                sensor's frames, then is reported invalid
+
+Each sensor has its own position in the sliding window, so a sensor that
+sent nothing in a step keeps its history and state untouched. The window
+median is taken over valid samples only (invalid slots sort to +inf and
+are indexed past), so there is no per-step allocation beyond numpy's
+internal sort buffer and the cost is fixed by (window, sensors, zones).
+
+    bank = FilterBank(sensors=4)
+    bank.step(grids.reshape(4, 64), present=valid)   # tof_aggregate ticks
+    bank.push_frames(rx.drain())                     # or raw frames
+    bank.values, bank.valid                          # (sensors, zones)
+
+    python tof_filter.py [--window 5] [--alpha 0.3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from tof_decode import zone_valid
+from tof_receiver import FrameReceiver, UDP_PORT
+
+ZONES = 64
+SIDE = 8
+
+WINDOW = 5                  # samples in the median / Hampel window
+ALPHA = 0.3                 # EMA weight of the new sample, None = off
+HAMPEL_K = 3.0              # outlier threshold in scaled MADs, None = off
+MAD_FLOOR_MM = 20.0         # a steady zone has MAD 0, do not call 1 mm of noise an outlier
+HOLD = 5                    # frames an invalid zone keeps its last value
+MIN_MM = 1
+MAX_MM = 4000
+MAX_BATCH = 8               # frames per sensor staged by push_frames() before filtering
+SOURCE_TIMEOUT_S = 10.0     # push_frames(): a new source takes over a slot silent this long
+
+MAD_SCALE = 1.4826          # MAD -> standard deviation for gaussian noise
+
+
+class FilterBank:
+    """Per-zone filters for `sensors` sensors, see the module docstring."""
+
+    def __init__(self, sensors, zones=ZONES, window=WINDOW, alpha=ALPHA, median=False,
+                 hampel_k=HAMPEL_K, hold=HOLD, min_mm=MIN_MM, max_mm=MAX_MM, max_batch=MAX_BATCH):
+        self.sensors = sensors
+        self.zones = zones
+        self.window = window
+        self.alpha = alpha
+        self.median = median
+        self.hampel_k = hampel_k
+        self.hold = hold
+        self.min_mm = min_mm
+        self.max_mm = max_mm
+        self.sources = []           # index -> source address, push_frames() only
+        self._index = {}
+        self._seen = []             # index -> recv_time of the newest frame
+        self.outliers = 0           # samples replaced by the Hampel test
+        self.invalid = 0            # samples rejected by the validity mask
+        self.skipped = 0            # frames of a resolution the bank cannot map
+        shape = (sensors, zones)
+        n = sensors * zones
+
+        # output
+        self.values = np.zeros(shape, dtype=np.float32)
+        self.valid = np.zeros(shape, dtype=bool)
+        self.age = np.full(shape, hold + 1, dtype=np.int32)    # frames since the last valid sample
+
+        # sliding window, rows [slot * sensors + sensor], plus one scratch row
+        # that absent sensors write to
+        self._win = np.zeros((window * sensors + 1, zones), dtype=np.float32)
+        self._win_ok = np.zeros((window * sensors + 1, zones), dtype=bool)
+        self._heads = np.zeros(sensors, dtype=np.intp)
+        self._rows = np.zeros(sensors, dtype=np.intp)
+        self._sensor_ids = np.arange(sensors, dtype=np.intp)
+        self._scratch = window * sensors
+
+        # per step temporaries
+        self._x = np.zeros(shape, dtype=np.float32)
+        self._ok = np.zeros(shape, dtype=bool)
+        self._tmp_ok = np.zeros(shape, dtype=bool)
+        self._d = np.zeros(shape, dtype=np.float32)
+        self._med = np.zeros(shape, dtype=np.float32)
+        self._mad = np.zeros(shape, dtype=np.float32)
+        self._hi = np.zeros(shape, dtype=np.float32)
+        self._count = np.zeros(shape, dtype=np.intp)
+        self._lo_idx = np.zeros(shape, dtype=np.intp)
+        self._hi_idx = np.zeros(shape, dtype=np.intp)
+        self._flat = np.arange(n, dtype=np.intp).reshape(shape)
+        self._sorted = np.zeros((window, sensors, zones), dtype=np.float32)
+        self._bad = np.zeros((window, sensors, zones), dtype=bool)
+        self._absent = np.zeros(sensors, dtype=bool)
+        self._all = np.ones(sensors, dtype=bool)
+
+        # push_frames() staging
+        self._stage = np.zeros((max_batch, sensors, zones), dtype=np.float32)
+        self._stage_present = np.zeros((max_batch, sensors), dtype=bool)
+        self._stage_valid = np.ones((max_batch, sensors, zones), dtype=bool)
+        self._stage_count = [0] * sensors
+
+    def grids(self):
+        """values as a (sensors, side, side) view."""
+        side = 4 if self.zones == 16 else 8
+        return self.values.reshape(self.sensors, side, side)
+
+    def reset(self, sensor=None):
+        """Forgets the history of one sensor (resolution switch) or of all."""
+        s = slice(None) if sensor is None else sensor
+        self.valid[s] = False
+        self.age[s] = self.hold + 1
+        self._win_ok[:self._scratch].reshape(self.window, self.sensors, self.zones)[:, s] = False
+
+    # -------------------- FILTERING --------------------
+
+    def _window_median(self, out):
+        """Median of the valid samples staged in _sorted (invalid = +inf) into `out`."""
+        srt = self._sorted
+        srt.sort(axis=0)
+        flat = srt.reshape(-1)
+        np.take(flat, self._lo_idx, out=out)
+        np.take(flat, self._hi_idx, out=self._hi)
+        np.add(out, self._hi, out=out)
+        np.multiply(out, 0.5, out=out)
+
+    def step(self, x, valid=None, present=None):
+        """
+        Filters one frame per sensor. x is (sensors, zones) in mm, `valid`
+        an optional (sensors, zones) mask of zones the sensor reported as
+        good, `present` an optional (sensors,) mask of the sensors that
+        actually have a new frame in x.
+        """
+        S, Z, W = self.sensors, self.zones, self.window
+        present = self._all if present is None else present
+        pz = present[:, None]
+        xs, ok, tmp = self._x, self._ok, self._tmp_ok
+        np.copyto(xs, x, casting="unsafe")
+
+        # -- validity --
+        np.greater_equal(xs, self.min_mm, out=ok)
+        np.less_equal(xs, self.max_mm, out=tmp)
+        np.logical_and(ok, tmp, out=ok)
+        if valid is not None:
+            np.logical_and(ok, valid, out=ok)
+        np.logical_and(ok, pz, out=ok)
+        self.invalid += Z * int(np.count_nonzero(present)) - int(np.count_nonzero(ok))
+
+        # -- write the window slot of every present sensor --
+        rows = self._rows
+        np.multiply(self._heads, S, out=rows)
+        np.add(rows, self._sensor_ids, out=rows)
+        np.logical_not(present, out=self._absent)
+        np.copyto(rows, self._scratch, where=self._absent)
+        self._win[rows] = xs
+        self._win_ok[rows] = ok
+        np.add(self._heads, present, out=self._heads, casting="unsafe")
+        np.remainder(self._heads, W, out=self._heads)
+
+        if self.hampel_k is not None or self.median:
+            win = self._win[:self._scratch].reshape(W, S, Z)
+            win_ok = self._win_ok[:self._scratch].reshape(W, S, Z)
+            # median index among the valid samples, invalid ones sorted last
+            cnt = self._count
+            np.sum(win_ok, axis=0, out=cnt)
+            np.subtract(cnt, 1, out=self._lo_idx)
+            np.maximum(self._lo_idx, 0, out=self._lo_idx)
+            np.floor_divide(self._lo_idx, 2, out=self._lo_idx)
+            np.floor_divide(cnt, 2, out=self._hi_idx)
+            # (lo, hi) -> flat offsets into the sorted (W, S, Z) block
+            np.multiply(self._lo_idx, S * Z, out=self._lo_idx)
+            np.add(self._lo_idx, self._flat, out=self._lo_idx)
+            np.multiply(self._hi_idx, S * Z, out=self._hi_idx)
+            np.add(self._hi_idx, self._flat, out=self._hi_idx)
+
+            bad = self._bad
+            np.logical_not(win_ok, out=bad)
+            np.copyto(self._sorted, win)
+            np.copyto(self._sorted, np.inf, where=bad)
+            med = self._med
+            self._window_median(med)
+            # zones without a valid sample in the window: keep the infs out of the MAD
+            np.equal(cnt, 0, out=tmp)
+            np.copyto(med, 0, where=tmp)
+
+            if self.hampel_k is not None:
+                # MAD of the same samples, invalid ones stay at +inf
+                np.subtract(win, med, out=self._sorted)
+                np.abs(self._sorted, out=self._sorted)
+                np.copyto(self._sorted, np.inf, where=bad)
+                mad = self._mad
+                self._window_median(mad)
+                np.multiply(mad, MAD_SCALE * self.hampel_k, out=mad)
+                np.maximum(mad, MAD_FLOOR_MM * self.hampel_k, out=mad)
+                d = self._d
+                np.subtract(xs, med, out=d)
+                np.abs(d, out=d)
+                np.greater(d, mad, out=tmp)
+                np.logical_and(tmp, ok, out=tmp)
+                self.outliers += int(np.count_nonzero(tmp))
+                np.copyto(xs, med, where=tmp)
+
+            if self.median:
+                np.copyto(xs, med, where=ok)
+
+        # -- EMA, restarted where the output had gone invalid --
+        values = self.values
+        if self.alpha is None:
+            np.copyto(values, xs, where=ok)
+        else:
+            d = self._d
+            np.subtract(xs, values, out=d)
+            np.multiply(d, self.alpha, out=d)
+            np.logical_and(ok, self.valid, out=tmp)
+            np.add(values, d, out=values, where=tmp)
+            np.greater(ok, self.valid, out=tmp)       # ok and not valid
+            np.copyto(values, xs, where=tmp)
+
+        # -- hold last valid --
+        age = self.age
+        np.add(age, pz, out=age, casting="unsafe")
+        np.copyto(age, 0, where=ok)
+        np.minimum(age, self.hold + 1, out=age)
+        np.less_equal(age, self.hold, out=self.valid)
+
+    def update(self, batch, valid=None, present=None):
+        """
+        Filters a batch of frames, oldest first: batch (steps, sensors,
+        zones), valid (steps, sensors, zones) and present (steps, sensors)
+        optional as in step().
+        """
+        for k in range(len(batch)):
+            self.step(batch[k],
+                      None if valid is None else valid[k],
+                      None if present is None else present[k])
+
+    # -------------------- FRAMES --------------------
+
+    def sensor(self, source, now=None):
+        """
+        Index of a source address, assigned on first use. When all slots
+        are taken, a slot not heard of for SOURCE_TIMEOUT_S before `now`
+        (a rebooted brick on a new port) is reset and reused.
+        """
+        i = self._index.get(source)
+        if i is None:
+            if len(self.sources) < self.sensors:
+                i = len(self.sources)
+                self.sources.append(source)
+                self._seen.append(now)
+            else:
+                i = self._silent_slot(now)
+                if i is None:
+                    return None     # more live bricks than filter slots
+                del self._index[self.sources[i]]
+                self.sources[i] = source
+                self.reset(i)
+            self._index[source] = i
+        if now is not None:
+            self._seen[i] = now
+        return i
+
+    def _silent_slot(self, now):
+        if now is None:
+            return None
+        oldest = None
+        for i, seen in enumerate(self._seen):
+            if seen is not None and seen < now - SOURCE_TIMEOUT_S and (
+                    oldest is None or seen < self._seen[oldest]):
+                oldest = i
+        return oldest
+
+    def push_frames(self, frames):
+        """
+        Filters a batch of Frames (e.g. FrameReceiver.drain()), grouped per
+        source: the k-th frame of every sensor goes into step k. 4x4 and
+        8x8 frames are rescaled to the bank's resolution, other sizes are
+        counted in `skipped`. Returns the number of frames used.
+        """
+        stage, present, counts = self._stage, self._stage_present, self._stage_count
+        used = 0
+        for frame in frames:
+            if frame.zones != self.zones and {frame.zones, self.zones} != {16, 64}:
+                self.skipped += 1
+                continue
+            i = self.sensor(frame.source, frame.recv_time)
+            if i is None:
+                continue
+            k = counts[i]
+            if k == len(stage):
+                self._flush_stage()
+                k = 0
+            dst = stage[k, i]
+            np.copyto(dst, self._rescale(frame.zones, frame.distance), casting="unsafe")
+            if frame.extra is not None:
+                self._stage_valid[k, i] = self._rescale(frame.zones, zone_valid(frame.extra))
+            present[k, i] = True
+            counts[i] = k + 1
+            used += 1
+        self._flush_stage()
+        return used
+
+    def _rescale(self, zones, grid):
+        """A frame's zone grid at the bank's resolution, flat."""
+        if zones == self.zones:
+            return grid.reshape(-1)
+        if zones == 16:
+            # 4x4 into an 8x8 bank, same nearest upscale as tof_aggregate
+            return grid.reshape(4, 4).repeat(2, 0).repeat(2, 1).reshape(-1)
+        # 8x8 into a 4x4 bank, every other zone like sim/scenes.py Capture
+        return grid.reshape(SIDE, SIDE)[::2, ::2].reshape(-1)
+
+    def _flush_stage(self):
+        steps = max(self._stage_count)
+        for k in range(steps):
+            self.step(self._stage[k], self._stage_valid[k], self._stage_present[k])
+            self._stage_present[k] = False
+            self._stage_valid[k] = True
+        for i in range(self.sensors):
+            self._stage_count[i] = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter the frames of every ToF brick and print them")
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--sensors", type=int, default=4)
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--median", action="store_true", help="output the sliding median")
+    parser.add_argument("--hampel", type=float, default=HAMPEL_K, help="outlier threshold, 0 = off")
+    args = parser.parse_args()
+
+    bank = FilterBank(args.sensors, window=args.window, alpha=args.alpha or None,
+                      median=args.median, hampel_k=args.hampel or None)
+    with FrameReceiver(args.port) as rx:
+        print("Listening on port %d..." % args.port)
+        frames = 0
+        busy = 0.0
+        t_report = time.monotonic() + 1.0
+        try:
+            while True:
+                batch = rx.drain()
+                t0 = time.perf_counter()
+                frames += bank.push_frames(batch)
+                busy += time.perf_counter() - t0
+                now = time.monotonic()
+                if now >= t_report:
+                    t_report = now + 1.0
+                    print("%d frames  filter %.2f ms/frame  outliers %d  invalid %d  skipped %d" % (
+                        frames, 1000 * busy / max(1, frames), bank.outliers, bank.invalid,
+                        bank.skipped))
+                    for i, source in enumerate(bank.sources):
+                        v = bank.values[i][bank.valid[i]]
+                        print("  %-22s valid %2d/%d  mean %5d mm" % (
+                            "%s:%d" % source[:2] if isinstance(source, tuple) else source,
+                            len(v), bank.zones, v.mean() if len(v) else 0))
+                    frames = 0
+                    busy = 0.0
+                time.sleep(0.01)
+        except KeyboardInterrupt:
+            pass
+        print(rx.stats())
+
+
+if __name__ == "__main__":
+    main()
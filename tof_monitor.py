@@ -0,0 +1,91 @@
+"""
+Collects the KIND_TELEMETRY datagrams of every brick (tof_telemetry.py)
+and prints them per device.
+
+    python tof_monitor.py [--port 5007] [--json telemetry.jsonl]
+
+Each report covers the last window on the device: counters are shown as
+totals and per second, timings as count / min / avg / max in microseconds.
+"""
+
+import argparse
+import json
+import socket
+import time
+
+from tof_proto import TELEMETRY_PORT
+from tof_telemetry import unpack_telemetry
+
+
+def format_report(source, rep):
+    window_s = rep["window_ms"] / 1000.0 or 1.0
+    lines = ["%s:%d  %s  seq=%d  window=%.1fs  heap free=%d alloc=%d" % (
+        source[0], source[1], rep["role"], rep["seq"], window_s, rep["mem_free"], rep["mem_alloc"])]
+    counters = "  ".join("%s=%d (%.1f/s)" % (name, n, n / window_s) for name, n in rep["counters"].items())
+    lines.append("    " + counters)
+    if rep["gauges"]:
+        lines.append("    " + "  ".join("%s=%d" % kv for kv in rep["gauges"].items()))
+    for name, (count, tmin, tavg, tmax) in rep["timers"].items():
+        if count:
+            lines.append("    %-8s n=%-6d min=%-7d avg=%-7d max=%d us" % (name, count, tmin, tavg, tmax))
+    return "\n".join(lines)
+
+
+class TelemetryMonitor:
+    """Latest report per device, plus gaps in the telemetry seq."""
+
+    def __init__(self):
+        self.latest = {}
+        self.missed = {}
+        self._last_seq = {}
+
+    def feed(self, data, source):
+        rep = unpack_telemetry(data)
+        if rep is None:
+            return None
+        last = self._last_seq.get(source)
+        if last is not None:
+            gap = (rep["seq"] - last - 1) & 0xFFFF
+            if gap < 0x8000:
+                self.missed[source] = self.missed.get(source, 0) + gap
+        self._last_seq[source] = rep["seq"]
+        rep["recv_time"] = time.time()
+        self.latest[source] = rep
+        return rep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show brick loop telemetry")
+    parser.add_argument("--port", type=int, default=TELEMETRY_PORT)
+    parser.add_argument("--json", default=None, help="also append every report to this JSON lines file")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", args.port))
+    monitor = TelemetryMonitor()
+    out = open(args.json, "a") if args.json else None
+    print("Listening for telemetry on port %d..." % args.port)
+    try:
+        while True:
+            data, source = sock.recvfrom(2048)
+            rep = monitor.feed(data, source)
+            if rep is None:
+                continue
+            print(format_report(source, rep))
+            if out is not None:
+                out.write(json.dumps(dict(rep, source="%s:%d" % source)) + "\n")
+                out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        if out is not None:
+            out.close()
+        for source, missed in monitor.missed.items():
+            if missed:
+                print("%s:%d missed %d reports" % (source[0], source[1], missed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Distance frames -> metric 3D points.
+
+Each VL53L5CX zone looks along a fixed ray inside the square field of view
+(45 x 45 degrees), so converting a frame is one multiply by a precomputed
+(zones, 3) ray table, one table per resolution. Rays are spread evenly in
+angle, zone (0, 0) is the first one in the frame (row major).
+
+Sensor frame: x right, y down (rows), z out of the sensor along the
+optical axis, metres. A Pose moves points into a common (robot / world)
+frame: p_world = R @ p_sensor + t.
+
+Everything is batched, leading dimensions are broadcast:
+
+    rays = ray_table(8)
+    pts = to_points(frame.distance, rays)              # (64, 3)
+    pts = to_points(grids, rays, stack_poses(poses))   # grids (S, 8, 8) -> (S, 64, 3)
+
+Zones with distance 0 (no target) map to the origin of their sensor, use
+`valid = distance.reshape(..., zones) > 0` to drop them.
+"""
+
+import numpy as np
+
+FOV_DEG = 45.0
+
+# what the sensor distance measures along each zone ray
+DISTANCE_RADIAL = "radial"              # length of the ray
+DISTANCE_PERPENDICULAR = "perpendicular"  # z of the point (plane distance)
+
+_tables = {}
+
+
+def ray_table(side, fov_deg=FOV_DEG, mode=DISTANCE_RADIAL):
+    """
+    (side * side, 3) float32 ray table, cached. Multiplying it by a distance
+    in mm gives the point in metres.
+    """
+    key = (side, fov_deg, mode)
+    rays = _tables.get(key)
+    if rays is None:
+        half = np.radians(fov_deg) / 2
+        angles = (np.arange(side) + 0.5) / side * 2 * half - half
+        ay, ax = np.meshgrid(angles, angles, indexing="ij")
+        rays = np.stack([np.tan(ax), np.tan(ay), np.ones_like(ax)], axis=-1).reshape(-1, 3)
+        if mode == DISTANCE_RADIAL:
+            rays /= np.linalg.norm(rays, axis=1, keepdims=True)
+        elif mode != DISTANCE_PERPENDICULAR:
+            raise ValueError("unknown distance mode %r" % mode)
+        rays = (rays / 1000.0).astype(np.float32)
+        rays.setflags(write=False)
+        _tables[key] = rays
+    return rays
+
+
+class Pose:
+    """Mounting pose of a sensor: rotation (yaw, pitch, roll in degrees) + offset in metres."""
+
+    __slots__ = ("rotation", "translation")
+
+    def __init__(self, xyz=(0.0, 0.0, 0.0), yaw=0.0, pitch=0.0, roll=0.0):
+        cy, sy = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+        cp, sp = np.cos(np.radians(pitch)), np.sin(np.radians(pitch))
+        cr, sr = np.cos(np.radians(roll)), np.sin(np.radians(roll))
+        rz = np.array([[cy, -sy, 0], [sy, cy, 0], [0, 0, 1]])
+        ry = np.array([[cp, 0, sp], [0, 1, 0], [-sp, 0, cp]])
+        rx = np.array([[1, 0, 0], [0, cr, -sr], [0, sr, cr]])
+        self.rotation = (rz @ ry @ rx).astype(np.float32)
+        self.translation = np.asarray(xyz, dtype=np.float32)
+
+    def __repr__(self):
+        return "Pose(translation=%s)" % (self.translation.tolist(),)
+
+
+def stack_poses(poses):
+    """List of Pose -> (R (S, 3, 3), t (S, 3)) for to_points()."""
+    return (np.stack([p.rotation for p in poses]),
+            np.stack([p.translation for p in poses]))
+
+
+def to_points(distance, rays, pose=None, out=None):
+    """
+    distance (..., side, side) or (..., zones) in mm -> (..., zones, 3) points.
+
+    `pose` is a Pose, a (R, t) pair from stack_poses() matching the leading
+    dimensions of `distance`, or None for the sensor frame. `out` is reused
+    when given (float32, right shape).
+    """
+    zones = rays.shape[0]
+    d = np.asarray(distance)
+    if d.shape[-1] != zones:
+        d = d.reshape(d.shape[:-2] + (zones,))
+    if out is None:
+        out = np.empty(d.shape + (3,), dtype=np.float32)
+    np.multiply(d[..., None], rays, out=out, casting="unsafe")
+    if pose is None:
+        return out
+    if isinstance(pose, Pose):
+        rot, trans = pose.rotation, pose.translation
+    else:
+        rot, trans = pose
+    # p @ R.T == (R @ p.T).T, batched over every leading dimension
+    pts = np.matmul(out, np.swapaxes(rot, -1, -2))
+    np.add(pts, trans[:, None, :] if trans.ndim == 2 else trans, out=out)
+    return out
+
+
+class PointCloud:
+    """
+    Converter for a fixed set of sensors, e.g. the (S, 8, 8) output of
+    SensorAggregator.snapshot(). Reuses its output array.
+    """
+
+    def __init__(self, poses=None, side=8, fov_deg=FOV_DEG, mode=DISTANCE_RADIAL):
+        self.rays = ray_table(side, fov_deg, mode)
+        self.pose = None if poses is None else stack_poses(poses)
+        self._out = None
+
+    def __call__(self, grids):
+        """grids (S, side, side) -> points (S, zones, 3), valid (S, zones)."""
+        grids = np.asarray(grids)
+        flat = grids.reshape(grids.shape[0], -1)
+        shape = flat.shape + (3,)
+        if self._out is None or self._out.shape != shape:
+            self._out = np.empty(shape, dtype=np.float32)
+        pose = self.pose
+        if pose is not None and pose[0].shape[0] != flat.shape[0]:
+            raise ValueError("%d poses for %d sensors" % (pose[0].shape[0], flat.shape[0]))
+        return to_points(flat, self.rays, pose, self._out), flat > 0
@@ -0,0 +1,201 @@
+"""
+Runtime resolution / ranging-rate controller for the ranging loop.
+
+Two profiles are preferred depending on what the sensor sees:
+
+    home profile    the one the controller was created with (e.g. the
+                    configured 8x8 @ 20 Hz, PROFILE_DETAIL by default),
+                    something is far away
+    PROFILE_FAST    4x4 @ 60 Hz   closest object nearer than CLOSE_MM
+
+The range policy only runs in auto mode. The rate backs off under
+congestion in any mode (multiplicative, one halving per step) and
+recovers slowly (one step per RECOVER_MS of a clean link):
+
+  * a window of SEND_WINDOW sends with more than SEND_FAIL_MAX failed
+    sendto() calls (OSError: TX buffer full),
+  * a receiver reporting more than LOSS_HIGH_PM permille loss
+    (OP_LOSS_REPORT, see tof_control.py on the host).
+
+Fewer, fresh frames are better than a backlog of stale ones.
+
+The host can also pin a profile with OP_SET_PROFILE (auto mode off) or
+hand control back to the range policy; a pinned profile still backs off.
+
+Changes are rate limited to one per MIN_HOLD_MS since every switch
+restarts ranging on the sensor.
+"""
+
+import time
+
+from tof_proto import (
+    HEADER_SIZE, KIND_CONTROL, OP_SET_PROFILE, OP_LOSS_REPORT, unpack_header,
+)
+
+PROFILE_DETAIL = (64, 15)
+PROFILE_FAST = (16, 60)
+
+MAX_FREQ_HZ = {16: 60, 64: 15}      # VL53L5CX limits per resolution
+MIN_FREQ_HZ = 2
+MAX_BACKOFF = 3
+
+CLOSE_MM = 500                      # switch to FAST below this ...
+FAR_MM = 800                        # ... and back to DETAIL above this
+RANGE_FRAMES = 5                    # consecutive frames before switching
+OBSERVE_EVERY = 2                   # look at every Nth frame only
+
+SEND_WINDOW = 20
+SEND_FAIL_MAX = 2
+LOSS_HIGH_PM = 50
+LOSS_LOW_PM = 10
+RECOVER_MS = 5000
+MIN_HOLD_MS = 2000
+
+
+class ProfileController:
+    """Picks the sensor profile from range, send failures and host reports."""
+
+    def __init__(self, tof, outputs, profile=PROFILE_DETAIL, auto=True):
+        self.tof = tof
+        self.outputs = outputs
+        self.auto = auto
+        self.home = profile                 # back to this when nothing is close
+        self.preferred = profile
+        self.backoff = 0
+        self.zones, self.freq = profile
+        self.changes = 0
+
+        self._sends = 0
+        self._send_fails = 0
+        self._close = 0
+        self._far = 0
+        self._frame = 0
+        self._last_change = time.ticks_ms()
+        self._last_trouble = self._last_change
+
+    # -------------------- INPUTS --------------------
+
+    def send_result(self, ok):
+        """Call after every sendto(), ok=False when it raised OSError."""
+        self._sends += 1
+        if not ok:
+            self._send_fails += 1
+        if self._sends >= SEND_WINDOW:
+            if self._send_fails > SEND_FAIL_MAX:
+                self._congested()
+            self._sends = 0
+            self._send_fails = 0
+
+    def observe(self, distance_mm):
+        """Looks at the closest valid zone of a frame (range policy)."""
+        self._frame += 1
+        if not self.auto or self._frame % OBSERVE_EVERY:
+            return
+        closest = 0xFFFF
+        for i in range(self.zones):
+            d = distance_mm[i]
+            if 0 < d < closest:
+                closest = d
+        if closest < CLOSE_MM:
+            self._close += 1
+            self._far = 0
+            if self._close >= RANGE_FRAMES:
+                self.preferred = PROFILE_FAST
+        elif closest > FAR_MM:
+            self._far += 1
+            self._close = 0
+            if self._far >= RANGE_FRAMES:
+                self.preferred = self.home
+
+    def handle_control(self, data):
+        """Applies a KIND_CONTROL datagram from the host, returns True if it was one."""
+        header = unpack_header(data)
+        if header is None or header[0] != KIND_CONTROL or len(data) <= HEADER_SIZE:
+            return False
+        op = data[HEADER_SIZE]
+        if op == OP_SET_PROFILE and len(data) >= HEADER_SIZE + 4:
+            zones = data[HEADER_SIZE + 1]
+            freq = data[HEADER_SIZE + 2]
+            self.auto = bool(data[HEADER_SIZE + 3])
+            if zones in MAX_FREQ_HZ and freq:
+                self.preferred = self.home = (zones, min(freq, MAX_FREQ_HZ[zones]))
+                self.backoff = 0
+                # an explicit command is applied right away
+                self._last_change = time.ticks_add(time.ticks_ms(), -MIN_HOLD_MS)
+        elif op == OP_LOSS_REPORT and len(data) >= HEADER_SIZE + 3:
+            loss_pm = data[HEADER_SIZE + 1] | (data[HEADER_SIZE + 2] << 8)
+            if loss_pm > LOSS_HIGH_PM:
+                self._congested()
+            elif loss_pm > LOSS_LOW_PM:
+                # not bad enough to back off, but no reason to recover either
+                self._last_trouble = time.ticks_ms()
+        return True
+
+    def _congested(self):
+        self._last_trouble = time.ticks_ms()
+        if self.backoff < MAX_BACKOFF:
+            self.backoff += 1
+
+    # -------------------- DECISION --------------------
+
+    def target(self):
+        zones, freq = self.preferred
+        return zones, max(MIN_FREQ_HZ, freq >> self.backoff)
+
+    def update(self):
+        """
+        Call once per loop iteration. Reconfigures the sensor and returns
+        True when the profile changed (resize the packer, adapt sleeps).
+        """
+        now = time.ticks_ms()
+        if self.backoff and time.ticks_diff(now, self._last_trouble) > RECOVER_MS:
+            self.backoff -= 1
+            self._last_trouble = now
+
+        zones, freq = self.target()
+        if (zones, freq) == (self.zones, self.freq):
+            return False
+        if time.ticks_diff(now, self._last_change) < MIN_HOLD_MS:
+            return False
+
+        tof = self.tof
+        tof.stop_ranging()
+        tof.resolution = zones
+        tof.ranging_freq = freq
+        tof.start_ranging(self.outputs)
+        self.zones, self.freq = zones, freq
+        self._last_change = now
+        self.changes += 1
+        return True
+
+    def __str__(self):
+        return "%dx%d@%dHz%s backoff=%d" % (
+            4 if self.zones == 16 else 8, 4 if self.zones == 16 else 8, self.freq,
+            " auto" if self.auto else "", self.backoff)
+
+
+def open_control_socket(port):
+    """Non-blocking UDP socket for KIND_CONTROL datagrams from the host."""
+    import socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", port))
+    sock.setblocking(False)
+    return sock
+
+
+def poll_control(sock, controller, transport=None, max_datagrams=4, summary=None):
+    """
+    Feeds pending control datagrams to `controller` (subscriptions to
+    `transport`, a tof_transport.FrameTransport, and full frame requests to
+    `summary`, a tof_summary.Summarizer), never blocks.
+    """
+    for _ in range(max_datagrams):
+        try:
+            data, addr = sock.recvfrom(64)
+        except OSError:
+            return
+        if transport is not None and transport.handle_control(data, addr):
+            continue
+        if summary is not None and summary.handle_control(data):
+            continue
+        controller.handle_control(data)
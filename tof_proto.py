@@ -0,0 +1,219 @@
+"""
+Wire format of the ToF frame datagrams.
+
+Shared by the brick firmware (MicroPython) and the host tools (CPython), so
+keep it free of numpy, typing and anything else MicroPython does not ship.
+
+Every datagram starts with a fixed 12 byte little-endian header:
+
+    offset  size  field
+    0       2     magic     0x4654 ("TF" on the wire)
+    2       1     version   VERSION
+    3       1     kind      KIND_* - what follows the header
+    4       2     seq       per-device sequence number, wraps at 0xFFFF
+    6       1     zones     16 (4x4) or 64 (8x8)
+    7       1     fields    FIELD_* bit mask of the payload contents
+    8       4     tick_ms   time.ticks_ms() on the device when the frame was read
+
+KIND_FRAME payload: `zones` little-endian uint16 distances in mm, then the
+extra ranging fields set in `fields`, each a block over all zones in bit
+order (zone 0 first, nibbles low half first):
+
+    FIELD_STATUS    4 bit  target status (VL53L5CX, 5 and 9 = valid)
+    FIELD_SIGMA     8 bit  range sigma in mm, 255 = 255 mm or more
+    FIELD_SIGNAL    8 bit  signal per SPAD in kcps, 4.4 mini float (see
+                           quantize_signal(), ~6% steps up to 500k)
+    FIELD_TARGETS   4 bit  number of targets detected
+
+so all four add 2.5 bytes per zone instead of 8 as uint16 (8x8: 160 bytes).
+
+KIND_DELTA payload: see tof_delta.py.
+KIND_BATCH payload: several of the above, see tof_batch.py.
+KIND_CONTROL payload: uint8 op (OP_*) + op specific arguments, sent by the
+host to the brick's CONTROL_PORT:
+
+    OP_SET_PROFILE   uint8 zones, uint8 freq_hz, uint8 auto (0/1);
+                     zones=0 only switches auto mode
+    OP_LOSS_REPORT   uint16 loss in permille seen by the receiver
+    OP_SUBSCRIBE     uint16 data port, uint16 lease_s: send frames to the
+                     sender's IP on that port until the lease runs out;
+                     repeat as a keepalive (see tof_transport.py)
+    OP_UNSUBSCRIBE   uint16 data port
+    OP_FULL_FRAMES   uint16 frames: in summary mode, send that many full
+                     frames (0xFFFF = until told otherwise, 0 = stop)
+
+KIND_TELEMETRY payload: loop statistics, sent every few seconds to
+TELEMETRY_PORT, `fields` holds the device role; see tof_telemetry.py.
+KIND_SUMMARY payload: closest distance and occupancy per sector instead
+of the zones, `fields` holds the number of sectors; see tof_summary.py.
+
+Old firmware sends the bare 128 byte `<64H` payload with no header at all,
+receivers still accept that as LEGACY_FRAME_SIZE.
+"""
+
+from struct import pack_into, unpack_from
+
+MAGIC = 0x4654
+VERSION = 1
+
+HEADER_FMT = "<HBBHBBI"
+HEADER_SIZE = 12
+
+# datagram kinds
+KIND_FRAME = 0
+KIND_DELTA = 1
+KIND_BATCH = 2
+KIND_CONTROL = 3
+KIND_TELEMETRY = 4
+KIND_SUMMARY = 5
+
+# KIND_CONTROL ops
+OP_SET_PROFILE = 1
+OP_LOSS_REPORT = 2
+OP_SUBSCRIBE = 3
+OP_UNSUBSCRIBE = 4
+OP_FULL_FRAMES = 5
+
+CONTROL_PORT = 5006
+TELEMETRY_PORT = 5007
+MULTICAST_GROUP = "239.0.70.84"     # TRANSPORT_MULTICAST, see tof_transport.py
+
+# payload fields
+FIELD_DISTANCE = 0x01
+FIELD_STATUS = 0x02
+FIELD_SIGMA = 0x04
+FIELD_SIGNAL = 0x08
+FIELD_TARGETS = 0x10
+FIELDS_EXTRA = FIELD_STATUS | FIELD_SIGMA | FIELD_SIGNAL | FIELD_TARGETS
+
+ZONES_4X4 = 16
+ZONES_8X8 = 64
+
+LEGACY_FRAME_SIZE = ZONES_8X8 * 2
+
+
+def pack_header(buf, offset, kind, seq, zones, fields, tick_ms):
+    """Writes a header into `buf` at `offset`."""
+    pack_into(HEADER_FMT, buf, offset,
+              MAGIC, VERSION, kind, seq & 0xFFFF, zones, fields,
+              tick_ms & 0xFFFFFFFF)
+
+
+def unpack_header(data, offset=0):
+    """
+    Returns (kind, seq, zones, fields, tick_ms) or None if `data` does not
+    start with a header of a version we understand.
+    """
+    if len(data) - offset < HEADER_SIZE:
+        return None
+    magic, version, kind, seq, zones, fields, tick_ms = unpack_from(HEADER_FMT, data, offset)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return kind, seq, zones, fields, tick_ms
+
+
+def extra_size(zones, fields):
+    """Bytes of the extra field blocks for `fields` (FIELD_DISTANCE excluded)."""
+    n = 0
+    if fields & FIELD_STATUS:
+        n += zones >> 1
+    if fields & FIELD_SIGMA:
+        n += zones
+    if fields & FIELD_SIGNAL:
+        n += zones
+    if fields & FIELD_TARGETS:
+        n += zones >> 1
+    return n
+
+
+def ranging_outputs(fields):
+    """VL53L5CX start_ranging() outputs for `fields` (brick side only)."""
+    from vl53l5cx import (
+        DATA_DISTANCE_MM, DATA_TARGET_STATUS, DATA_RANGE_SIGMA_MM, DATA_SIGNAL_PER_SPAD,
+        DATA_NB_TARGET_DETECTED,
+    )
+    outputs = {DATA_DISTANCE_MM}
+    if fields & FIELD_STATUS:
+        outputs.add(DATA_TARGET_STATUS)
+    if fields & FIELD_SIGMA:
+        outputs.add(DATA_RANGE_SIGMA_MM)
+    if fields & FIELD_SIGNAL:
+        outputs.add(DATA_SIGNAL_PER_SPAD)
+    if fields & FIELD_TARGETS:
+        outputs.add(DATA_NB_TARGET_DETECTED)
+    return outputs
+
+
+def quantize_signal(s):
+    """
+    uint32 -> uint8: below 16 as is, above 4 bit exponent + 4 bit mantissa,
+    value = (16 + m) << (e - 1). Integer only, no log on the brick.
+    """
+    if s < 16:
+        return s if s > 0 else 0
+    e = 1
+    while s >= 32:
+        s >>= 1
+        e += 1
+    if e > 15:
+        return 255
+    return (e << 4) | (s - 16)
+
+
+def _pack_nibbles(buf, o, values, zones):
+    for i in range(0, zones, 2):
+        buf[o] = (values[i] & 0x0F) | ((values[i + 1] & 0x0F) << 4)
+        o += 1
+    return o
+
+
+def pack_extra(buf, o, res, zones, fields):
+    """
+    Writes the extra field blocks of `fields` from a ranging result into
+    `buf` at `o`, returns the offset after them. No allocation.
+    """
+    if fields & FIELD_STATUS:
+        o = _pack_nibbles(buf, o, res.target_status, zones)
+    if fields & FIELD_SIGMA:
+        sigma = res.range_sigma_mm
+        for i in range(zones):
+            v = sigma[i]
+            buf[o + i] = v if v < 255 else 255
+        o += zones
+    if fields & FIELD_SIGNAL:
+        signal = res.signal_per_spad
+        for i in range(zones):
+            buf[o + i] = quantize_signal(signal[i])
+        o += zones
+    if fields & FIELD_TARGETS:
+        o = _pack_nibbles(buf, o, res.nb_target_detected, zones)
+    return o
+
+
+class FramePacker:
+    """
+    Packs distance frames into one preallocated datagram buffer.
+
+    The same bytearray is returned on every call, send it before packing
+    the next frame. With extra `fields` pack() needs the ranging result
+    they come from (the one get_ranging_data() returned).
+    """
+
+    def __init__(self, zones=ZONES_8X8, fields=FIELD_DISTANCE):
+        self.seq = 0
+        self.fields = fields | FIELD_DISTANCE
+        self.resize(zones)
+
+    def resize(self, zones):
+        """Switches resolution, the sequence continues."""
+        self.zones = zones
+        self.buf = bytearray(HEADER_SIZE + zones * 2 + extra_size(zones, self.fields))
+        self._fmt = "<%dH" % zones
+
+    def pack(self, distance_mm, tick_ms, res=None):
+        pack_header(self.buf, 0, KIND_FRAME, self.seq, self.zones, self.fields, tick_ms)
+        pack_into(self._fmt, self.buf, HEADER_SIZE, *distance_mm)
+        if self.fields & FIELDS_EXTRA:
+            pack_extra(self.buf, HEADER_SIZE + self.zones * 2, res, self.zones, self.fields)
+        self.seq = (self.seq + 1) & 0xFFFF
+        return self.buf
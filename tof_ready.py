@@ -0,0 +1,103 @@
+"""
+Data-ready detection for the VL53L5CX ranging loop (MicroPython).
+
+Two modes behind one `await ready.wait()`:
+
+    irq    the sensor INT pin (active low, needs a pull-up) fires a
+           Pin IRQ that sets a uasyncio.ThreadSafeFlag, the task sleeps
+           until the frame is ready and no I2C polling happens at all.
+           If no edge arrives within two frame periods (missed edge)
+           that frame is found by polling instead; after MAX_MISSED_IRQ
+           timeouts in a row (pin not wired) the mode drops to polling.
+    poll   check_data_ready() over I2C every `poll_ms`, the old behaviour.
+
+When the INT pin is wired it is also timestamped in poll mode, so
+`latency` measures INT edge -> sent() in both modes and the two can be
+compared on the same hardware. Without INT, poll mode measures from the
+moment check_data_ready() saw the frame.
+"""
+
+import time
+
+import uasyncio as asyncio
+from machine import Pin
+
+from loop_stats import TimingStats
+
+MODE_POLL = "poll"
+MODE_IRQ = "irq"
+
+MAX_MISSED_IRQ = 3          # timeouts in a row before irq mode gives up
+
+
+class DataReady:
+    """Waits for VL53L5CX frames by INT pin IRQ or by polling."""
+
+    def __init__(self, tof, mode=MODE_POLL, int_pin=None, freq_hz=20, poll_ms=10):
+        self.tof = tof
+        self.mode = mode if int_pin is not None else MODE_POLL
+        self.poll_ms = poll_ms
+        self.timeout_ms = 2 * 1000 // freq_hz
+        self.latency = TimingStats()
+        self.fallbacks = 0          # irq mode: frames found by polling instead
+        self.polls = 0              # check_data_ready() calls (I2C transactions)
+        self._irq_us = 0
+        self._missed = 0
+        self._ready_us = 0
+        self._flag = asyncio.ThreadSafeFlag()
+        self._pin = None
+        if int_pin is not None:
+            self._pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+            self._pin.irq(self._on_int, trigger=Pin.IRQ_FALLING)
+
+    def _on_int(self, pin):
+        # IRQ context: no allocation, just a timestamp and the flag
+        self._irq_us = time.ticks_us()
+        if self.mode == MODE_IRQ:
+            self._flag.set()
+
+    async def wait(self):
+        """Returns once a new frame can be read with get_ranging_data()."""
+        sleep_first = True
+        if self.mode == MODE_IRQ:
+            try:
+                await asyncio.wait_for_ms(self._flag.wait(), self.timeout_ms)
+                self._missed = 0
+                self._ready_us = self._irq_us
+                return
+            except asyncio.TimeoutError:
+                self.fallbacks += 1
+                self._missed += 1
+                if self._missed >= MAX_MISSED_IRQ:
+                    # INT never fires: not wired or wrong pin, stay on polling
+                    self.mode = MODE_POLL
+                sleep_first = False
+
+        while True:
+            # right after a frame the next one is never ready, sleep first
+            if sleep_first:
+                await asyncio.sleep_ms(self.poll_ms)
+            sleep_first = True
+            self.polls += 1
+            if self.tof.check_data_ready():
+                now = time.ticks_us()
+                if self.mode == MODE_IRQ:
+                    # a late edge of this frame must not make the next
+                    # wait() return before there is a new one
+                    self._flag.clear()
+                # with INT wired, measure from the real data-ready edge
+                self._ready_us = self._irq_us if self._pin is not None and self._irq_us else now
+                return
+
+    def set_freq(self, freq_hz):
+        """Ranging frequency changed (see tof_profile.py), adapts the irq timeout."""
+        self.timeout_ms = 2 * 1000 // freq_hz
+        self._missed = 0
+
+    def sent(self):
+        """Call right after the frame went out, records ready -> send latency."""
+        self.latency.add(time.ticks_diff(time.ticks_us(), self._ready_us))
+
+    def report(self):
+        return "[READY] %s: latency %s, polls=%d, fallbacks=%d" % (
+            self.mode, self.latency, self.polls, self.fallbacks)
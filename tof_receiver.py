@@ -0,0 +1,263 @@
+"""
+Host side ToF frame receiver.
+
+Runs recv + decode in a background thread so a slow consumer (matplotlib,
+disk, control code) never leaves datagrams piling up in the kernel buffer.
+Frames can be consumed in several ways:
+
+    rx = FrameReceiver().start()
+
+    frame = rx.latest()                 # newest frame, never blocks
+    frame = rx.wait(newer_than=frame)   # block until something newer arrives
+    for frame in rx: ...                # every frame, blocking
+    async for frame in rx: ...          # every frame, from asyncio code
+    rx.add_callback(fn)                 # fn(frame) on the receiver thread
+    frames = rx.drain()                 # every frame queued since last call
+
+latest(), wait(), callbacks and `async for` each see every frame and can
+be combined freely. The blocking iterator and drain() take frames from the
+same queue, so use one of the two: each frame goes to whichever asks first.
+
+The queues behind the iterators are bounded: when a consumer falls behind
+the oldest frames are dropped (counted in `overflows`), never the newest.
+A callback that raises is counted in `callback_errors` (the first error of
+each callback is printed) and does not stop the receiver thread.
+
+With `ring=FrameRing(...)` datagrams are read with recvfrom_into() into one
+preallocated buffer and the frames of the ring's source (the first brick
+heard unless given) are copied into the ring, so no bytes object is
+allocated per datagram for the frame data; the Frame objects and small
+lists / memoryview slices per datagram still are. Frame.distance then
+points into the ring and is only valid for `ring.capacity` frames; read the
+ring (e.g. ring.mean()) while holding `rx.lock`.
+
+With `multicast_group=MULTICAST_GROUP` the socket also joins the group the
+bricks send to in TRANSPORT_MULTICAST mode (see tof_transport.py).
+"""
+
+import asyncio
+import collections
+import select
+import socket
+import threading
+import time
+import traceback
+
+from tof_decode import FrameDecoder
+from tof_ring import push_datagram
+
+UDP_IP = "0.0.0.0"
+UDP_PORT = 5005
+
+RCVBUF_BYTES = 4 * 1024 * 1024
+MAX_DATAGRAM = 2048
+DRAIN_BATCH = 256           # datagrams read per wake-up before publishing
+
+
+class FrameReceiver:
+    """Background UDP receiver, see the module docstring for usage."""
+
+    def __init__(self, port=UDP_PORT, host=UDP_IP, max_age_ms=250, queue_size=256,
+                 rcvbuf=RCVBUF_BYTES, decoder=None, ring=None, multicast_group=None):
+        self.port = port
+        self.host = host
+        self.multicast_group = multicast_group
+        self.queue_size = queue_size
+        self.rcvbuf = rcvbuf
+        self.decoder = decoder if decoder is not None else FrameDecoder(max_age_ms=max_age_ms)
+        self.ring = ring
+        self.overflows = 0
+        self.callback_errors = 0
+        self._failed_callbacks = set()
+        self._buf = bytearray(MAX_DATAGRAM)
+        self._mv = memoryview(self._buf)
+
+        self._latest = None
+        self._latest_by_source = {}
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._callbacks = []
+        self._async_queues = []
+        self._sock = None
+        self._thread = None
+        self._running = False
+
+    # -------------------- LIFECYCLE --------------------
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except OSError:
+            pass    # the OS caps it, keep whatever we got
+        sock.bind((self.host, self.port))
+        if self.multicast_group:
+            # join on the interface we are bound to (0.0.0.0: let the OS pick)
+            mreq = socket.inet_aton(self.multicast_group) + socket.inet_aton(self.host)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock.setblocking(False)
+        self._sock = sock
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="tof-receiver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -------------------- CONSUMER API --------------------
+
+    @property
+    def lock(self):
+        """Held by the receiver thread while it writes into the ring."""
+        return self._cond
+
+    def latest(self, source=None):
+        """Newest frame (of one source if given), or None."""
+        if source is None:
+            return self._latest
+        return self._latest_by_source.get(source)
+
+    def wait(self, timeout=None, newer_than=None):
+        """
+        Blocks until a frame newer than `newer_than` (a Frame or None) has
+        arrived and returns the newest one, or None on timeout / stop.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                frame = self._latest
+                if frame is not None and frame is not newer_than:
+                    return frame
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def drain(self):
+        """Returns and clears every queued frame, oldest first."""
+        with self._cond:
+            frames = list(self._queue)
+            self._queue.clear()
+        return frames
+
+    def add_callback(self, fn):
+        """fn(frame) is called on the receiver thread, keep it short."""
+        self._callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self._callbacks.remove(fn)
+
+    def stats(self):
+        return self.decoder.stats()
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                frame = self._queue.popleft()
+            yield frame
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        entry = (loop, queue)
+        self._async_queues.append(entry)
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self._async_queues.remove(entry)
+
+    # -------------------- RECEIVER THREAD --------------------
+
+    def _run(self):
+        sock = self._sock
+        while self._running:
+            ready, _, _ = select.select([sock], [], [], 0.1)
+            if not ready:
+                continue
+
+            # read everything that is pending, publish once
+            frames = []
+            now = time.monotonic()
+            for _ in range(DRAIN_BATCH):
+                try:
+                    if self.ring is None:
+                        data, addr = sock.recvfrom(MAX_DATAGRAM)
+                    else:
+                        n, addr = sock.recvfrom_into(self._buf)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # e.g. ICMP port unreachable reported on Windows
+                    continue
+                if self.ring is None:
+                    frames.extend(self.decoder.decode_many(data, addr, now))
+                else:
+                    # must land in the ring before the next recv overwrites _buf
+                    with self._cond:
+                        push_datagram(self.decoder, self.ring, self._mv[:n], addr, now, frames)
+            if frames:
+                self._publish(frames)
+
+        for loop, queue in list(self._async_queues):
+            loop.call_soon_threadsafe(_put_latest, queue, None)
+
+    def _publish(self, frames):
+        for frame in frames:
+            self._latest_by_source[frame.source] = frame
+        with self._cond:
+            self._latest = frames[-1]
+            if self.queue_size:
+                self._queue.extend(frames)
+                extra = len(self._queue) - self.queue_size
+                if extra > 0:
+                    self.overflows += extra
+                    for _ in range(extra):
+                        self._queue.popleft()
+            self._cond.notify_all()
+
+        for fn in tuple(self._callbacks):
+            for frame in frames:
+                try:
+                    fn(frame)
+                except Exception:
+                    # one broken consumer must not starve the others
+                    self.callback_errors += 1
+                    if fn not in self._failed_callbacks:
+                        self._failed_callbacks.add(fn)
+                        print("[RX] callback %r failed:" % (fn,))
+                        traceback.print_exc()
+        for loop, queue in tuple(self._async_queues):
+            for frame in frames:
+                loop.call_soon_threadsafe(_put_latest, queue, frame)
+
+
+def _put_latest(queue, frame):
+    # runs on the consumer's event loop: drop the oldest frame when full
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(frame)
@@ -0,0 +1,158 @@
+"""
+Preallocated ring buffer of ToF frames with an O(zones) moving average.
+
+Replaces the `buffer.append(); buffer.pop(0); np.mean(buffer, axis=0)`
+pattern: every push copies the frame into a fixed slot and updates a
+running sum, so the N frame average costs one subtract + one add per zone
+instead of N adds, and nothing is allocated per frame.
+
+RingReader is the matching socket side for single-threaded loops: datagrams
+are read with recvfrom_into() into one preallocated bytearray, decoded as
+np.frombuffer views over it and copied straight into the ring. A ring holds
+one source: the one given, else the first one heard; frames of other
+bricks on the same port are passed on but not averaged in.
+"""
+
+import time
+
+import numpy as np
+
+from tof_decode import FrameDecoder
+
+MAX_ZONES = 64
+MAX_DATAGRAM = 2048
+
+
+class FrameRing:
+    """
+    Last `capacity` frames of one source, oldest overwritten first.
+
+    Not thread safe, push and read from the same thread (or under a lock,
+    see FrameReceiver(ring=...)).
+    """
+
+    def __init__(self, capacity=5, zones=MAX_ZONES, source=None):
+        self.capacity = capacity
+        self.zones = zones
+        self.source = source        # (ip, port), None = the first one pushed
+        self.other_sources = 0      # frames of other sources, not pushed
+        self.frames = np.zeros((capacity, MAX_ZONES), dtype=np.uint16)
+        self.seq = np.zeros(capacity, dtype=np.int32)
+        self.tick_ms = np.zeros(capacity, dtype=np.int64)
+        self.recv_time = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self.head = 0               # next slot to write
+        self._sum = np.zeros(MAX_ZONES, dtype=np.int64)
+        self._mean = np.zeros(MAX_ZONES, dtype=np.float32)
+
+    @property
+    def side(self):
+        return 4 if self.zones == 16 else 8
+
+    def __len__(self):
+        return self.count
+
+    def clear(self, zones=None):
+        if zones is not None:
+            self.zones = zones
+        self.count = 0
+        self.head = 0
+        self._sum[:] = 0
+
+    def push(self, frame):
+        """
+        Copies `frame` (a Frame) into the next slot and returns that slot as
+        a (side, side) view. The view stays valid for `capacity` pushes.
+        """
+        if frame.zones != self.zones:
+            # resolution switch, averaging 4x4 with 8x8 makes no sense
+            self.clear(frame.zones)
+        zones = self.zones
+        slot = self.frames[self.head, :zones]
+        s = self._sum[:zones]
+        if self.count == self.capacity:
+            np.subtract(s, slot, out=s)
+        else:
+            self.count += 1
+        np.copyto(slot, frame.distance.reshape(-1), casting="unsafe")
+        np.add(s, slot, out=s)
+
+        i = self.head
+        self.seq[i] = -1 if frame.seq is None else frame.seq
+        self.tick_ms[i] = 0 if frame.tick_ms is None else frame.tick_ms
+        self.recv_time[i] = frame.recv_time
+        self.head = (i + 1) % self.capacity
+        return slot.reshape(self.side, self.side)
+
+    def latest(self):
+        """Newest frame as a (side, side) view, or None when empty."""
+        if not self.count:
+            return None
+        return self.frames[(self.head - 1) % self.capacity, :self.zones].reshape(self.side, self.side)
+
+    def mean(self):
+        """
+        Moving average over the stored frames as a (side, side) float32
+        view. The array is reused, copy it if it must outlive the next push.
+        """
+        zones = self.zones
+        out = self._mean[:zones]
+        if self.count:
+            np.divide(self._sum[:zones], self.count, out=out, casting="unsafe")
+        else:
+            out[:] = 0
+        return out.reshape(self.side, self.side)
+
+    def window(self):
+        """Stored frames oldest first, shape (count, side, side). Allocates."""
+        idx = (self.head - self.count + np.arange(self.count)) % self.capacity
+        return self.frames[idx, :self.zones].reshape(self.count, self.side, self.side)
+
+
+class RingReader:
+    """
+    Drains a non-blocking UDP socket into a FrameRing without allocating a
+    new bytes object per datagram.
+    """
+
+    def __init__(self, sock, ring, decoder=None, max_age_ms=250):
+        self.sock = sock
+        self.ring = ring
+        self.decoder = decoder if decoder is not None else FrameDecoder(max_age_ms=max_age_ms)
+        self._buf = bytearray(MAX_DATAGRAM)
+        self._mv = memoryview(self._buf)
+
+    def poll(self, max_datagrams=256):
+        """Reads everything pending, returns the number of frames pushed."""
+        pushed = 0
+        now = time.monotonic()
+        for _ in range(max_datagrams):
+            try:
+                n, addr = self.sock.recvfrom_into(self._buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            pushed += push_datagram(self.decoder, self.ring, self._mv[:n], addr, now)
+        return pushed
+
+
+def push_datagram(decoder, ring, data, addr, now, frames=None):
+    """
+    Decodes `data` and pushes every frame of the ring's source into `ring`.
+    Frames are re-pointed at their ring slot (frames of other sources at a
+    copy) since `data` is about to be overwritten by the next recv. Returns
+    the number of frames pushed, appends all frames to `frames`.
+    """
+    n = 0
+    for frame in decoder.decode_many(data, addr, now):
+        if ring.source is None:
+            ring.source = frame.source
+        if frame.source == ring.source:
+            frame.distance = ring.push(frame)
+            n += 1
+        else:
+            # another brick on the port, averaging it in would mix sensors
+            frame.distance = frame.distance.copy()
+            ring.other_sources += 1
+        if frames is not None:
+            frames.append(frame)
+    return n
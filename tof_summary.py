@@ -0,0 +1,276 @@
+"""
+Edge summaries of the ToF frames: closest obstacle per sector instead of
+all zones, for consumers that only need "is something there, how far".
+
+Shared by the brick firmware (MicroPython) and the host tools (CPython).
+The zones are split into `regions` vertical sectors (column strips, left
+to right as seen in the frame). Per frame the brick takes the minimum
+valid distance of each sector and marks it occupied below its threshold
+(with HYSTERESIS_MM so an object at the edge does not flicker). A
+KIND_SUMMARY datagram goes out only when the occupancy changes, when an
+occupied sector's distance moved by `move_mm`, or every `heartbeat_ms`:
+
+    header   KIND_SUMMARY, zones = zones of the source frames,
+             fields = number of regions (up to 16)
+    payload  uint8  flags       SUMMARY_CHANGED | SUMMARY_MOVED | SUMMARY_HEARTBEAT
+             uint16 occupancy   bit r = sector r occupied
+             regions x uint8    min distance in DIST_STEP_MM steps,
+                                0 = no valid zone, 255 = 4080 mm or more
+
+19 bytes for 4 sectors, sent a few times per second at most, instead
+of 140+ bytes at the ranging rate. Summaries have their own seq.
+
+On the brick (allocation free, one pass over the zones per frame):
+
+    summary = Summarizer(ZONE_COUNT, 4, 800)
+    ...
+    if summary.full_frames:
+        buf = packer.pack(res.distance_mm, now, res)
+        summary.frame_sent()
+    else:
+        buf = summary.update(res.distance_mm, res.target_status, now)
+
+The host gets full frames on demand with OP_FULL_FRAMES on CONTROL_PORT
+(tof_control.py frames N), e.g. to look at a scene after an event, and
+the brick goes back to summaries after N frames.
+
+On the host, print the events of every brick:
+
+    python tof_summary.py [--port 5005] [--frames 40 --brick 192.168.4.1]
+"""
+
+import time
+from struct import pack_into, unpack_from
+
+from tof_proto import (
+    HEADER_SIZE, KIND_SUMMARY, KIND_CONTROL, OP_FULL_FRAMES, pack_header, unpack_header,
+)
+
+SUMMARY_CHANGED = 0x01          # occupancy bitmap changed
+SUMMARY_MOVED = 0x02            # an occupied sector's distance moved
+SUMMARY_HEARTBEAT = 0x04        # nothing changed, still alive
+
+MAX_REGIONS = 16
+DIST_STEP_MM = 16
+DIST_SHIFT = 4
+DIST_MAX_Q = 255
+
+THRESHOLD_MM = 800              # occupied below this ...
+HYSTERESIS_MM = 50              # ... and free again above this much more
+MOVE_MM = 100
+MOVE_EVERY_MS = 100             # distance updates at most this often
+HEARTBEAT_MS = 1000
+
+FULL_FRAMES_ON = 0xFFFF         # OP_FULL_FRAMES count: until told otherwise
+
+VALID_STATUS_A = 5              # VL53L5CX target status: range valid ...
+VALID_STATUS_B = 9              # ... (large pulse)
+NO_DISTANCE = 0xFFFF
+
+
+def summary_size(regions):
+    return HEADER_SIZE + 3 + regions
+
+
+def column_regions(zones, regions):
+    """Zone -> sector map, sector = column strip; bytearray(zones)."""
+    side = 4 if zones == 16 else 8
+    m = bytearray(zones)
+    for i in range(zones):
+        m[i] = (i % side) * regions // side
+    return m
+
+
+class Summarizer:
+    """Per-sector closest distance + occupancy, see the module docstring."""
+
+    def __init__(self, zones, regions=4, threshold_mm=THRESHOLD_MM, heartbeat_ms=HEARTBEAT_MS,
+                 move_mm=MOVE_MM, hysteresis_mm=HYSTERESIS_MM):
+        if not 0 < regions <= MAX_REGIONS:
+            raise ValueError("regions must be 1..%d" % MAX_REGIONS)
+        if isinstance(threshold_mm, int):
+            threshold_mm = (threshold_mm,) * regions
+        if len(threshold_mm) != regions:
+            raise ValueError("one threshold per region")
+        self.regions = regions
+        self.thresholds = list(threshold_mm)
+        self.heartbeat_ms = heartbeat_ms
+        self.move_q = max(1, move_mm >> DIST_SHIFT)
+        self.hysteresis_mm = hysteresis_mm
+        self.buf = bytearray(summary_size(regions))
+        self.mins = [NO_DISTANCE] * regions
+        self.sent_q = bytearray(regions)
+        self.occupancy = 0
+        self.seq = 0
+        self.sent = 0
+        self.full_frames = 0        # frames still to send in full (OP_FULL_FRAMES)
+        self._last_sent = None
+        self._last_moved = 0
+        self.resize(zones)
+
+    def resize(self, zones):
+        """New resolution: rebuild the zone map, the next frame is sent."""
+        self.zones = zones
+        self.region_of = column_regions(zones, self.regions)
+        self._last_sent = None
+
+    def handle_control(self, data):
+        """Applies OP_FULL_FRAMES, returns False for any other datagram."""
+        header = unpack_header(data)
+        if (header is None or header[0] != KIND_CONTROL or len(data) < HEADER_SIZE + 3
+                or data[HEADER_SIZE] != OP_FULL_FRAMES):
+            return False
+        self.full_frames = data[HEADER_SIZE + 1] | (data[HEADER_SIZE + 2] << 8)
+        if not self.full_frames:
+            # back to summaries: the host's picture is the last frame, resend
+            self._last_sent = None
+        return True
+
+    def frame_sent(self):
+        """Call after a full frame went out instead of a summary."""
+        if self.full_frames and self.full_frames != FULL_FRAMES_ON:
+            self.full_frames -= 1
+            if not self.full_frames:
+                self._last_sent = None
+
+    def update(self, distance_mm, status, now):
+        """
+        Folds one frame in (`status` = res.target_status or None to trust
+        every non-zero distance). Returns the datagram (memoryview of the
+        preallocated buffer) when it is due, else None.
+        """
+        n = self.regions
+        mins = self.mins
+        for r in range(n):
+            mins[r] = NO_DISTANCE
+        region_of = self.region_of
+        if status is None:
+            for i in range(self.zones):
+                d = distance_mm[i]
+                r = region_of[i]
+                if 0 < d < mins[r]:
+                    mins[r] = d
+        else:
+            for i in range(self.zones):
+                s = status[i]
+                if s == VALID_STATUS_A or s == VALID_STATUS_B:
+                    d = distance_mm[i]
+                    r = region_of[i]
+                    if 0 < d < mins[r]:
+                        mins[r] = d
+
+        buf = self.buf
+        sent_q = self.sent_q
+        thresholds = self.thresholds
+        occupancy = 0
+        moved = False
+        o = HEADER_SIZE + 3
+        for r in range(n):
+            d = mins[r]
+            if d == NO_DISTANCE:
+                q = 0
+            else:
+                q = d >> DIST_SHIFT
+                q = DIST_MAX_Q if q > DIST_MAX_Q else (q or 1)
+                limit = thresholds[r]
+                if (self.occupancy >> r) & 1:
+                    limit += self.hysteresis_mm
+                if d < limit:
+                    occupancy |= 1 << r
+                    diff = q - sent_q[r]
+                    if diff >= self.move_q or -diff >= self.move_q:
+                        moved = True
+            buf[o + r] = q
+
+        flags = 0
+        if occupancy != self.occupancy:
+            flags = SUMMARY_CHANGED
+        if moved and (flags or time.ticks_diff(now, self._last_moved) >= MOVE_EVERY_MS):
+            flags |= SUMMARY_MOVED
+        if not flags and (self._last_sent is None
+                          or time.ticks_diff(now, self._last_sent) >= self.heartbeat_ms):
+            flags = SUMMARY_HEARTBEAT
+        self.occupancy = occupancy
+        if not flags:
+            return None
+
+        pack_header(buf, 0, KIND_SUMMARY, self.seq, self.zones, n, now)
+        pack_into("<BH", buf, HEADER_SIZE, flags, occupancy)
+        for r in range(n):
+            sent_q[r] = buf[o + r]
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.sent += 1
+        self._last_sent = now
+        if flags != SUMMARY_HEARTBEAT:
+            self._last_moved = now
+        return memoryview(buf)
+
+
+def unpack_summary(data):
+    """
+    Host side: returns a dict (seq, tick_ms, zones, flags, occupied
+    [bool per sector], min_mm [lower bound per sector, None = nothing
+    valid]) or None.
+    """
+    header = unpack_header(data)
+    if header is None or header[0] != KIND_SUMMARY:
+        return None
+    kind, seq, zones, regions, tick_ms = header
+    if not 0 < regions <= MAX_REGIONS or len(data) < summary_size(regions):
+        return None
+    flags, occupancy = unpack_from("<BH", data, HEADER_SIZE)
+    o = HEADER_SIZE + 3
+    return {
+        "seq": seq, "tick_ms": tick_ms, "zones": zones, "flags": flags,
+        "occupied": [bool((occupancy >> r) & 1) for r in range(regions)],
+        "min_mm": [data[o + r] * DIST_STEP_MM if data[o + r] else None for r in range(regions)],
+    }
+
+
+def format_summary(source, s):
+    what = "+".join(name for bit, name in ((SUMMARY_CHANGED, "changed"), (SUMMARY_MOVED, "moved"),
+                                           (SUMMARY_HEARTBEAT, "heartbeat")) if s["flags"] & bit)
+    sectors = "  ".join("%s%s" % ("#" if occ else ".", "----" if d is None else "%4d" % d)
+                        for occ, d in zip(s["occupied"], s["min_mm"]))
+    return "%s  seq=%-5d %-9s %s" % (source[0], s["seq"], what, sectors)
+
+
+def main():
+    import argparse
+    import socket
+
+    from tof_control import ControlClient
+
+    parser = argparse.ArgumentParser(description="Print the edge summaries of the ToF bricks")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--brick", help="brick IP, for --frames")
+    parser.add_argument("--frames", type=int, help="ask the brick for N full frames first")
+    parser.add_argument("--all", action="store_true", help="print heartbeats too")
+    args = parser.parse_args()
+
+    if args.frames is not None:
+        if not args.brick:
+            parser.error("--frames needs --brick")
+        client = ControlClient(args.brick)
+        client.full_frames(args.frames)
+        client.close()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", args.port))
+    print("listening on :%d, # = occupied, distances in mm" % args.port)
+    try:
+        while True:
+            data, addr = sock.recvfrom(2048)
+            s = unpack_summary(data)
+            if s is None or (s["flags"] == SUMMARY_HEARTBEAT and not args.all):
+                continue
+            print(format_summary(addr, s))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Loop telemetry of the bricks: counters and min/avg/max timings, sent as a
+compact KIND_TELEMETRY datagram every few seconds (see tof_monitor.py on
+the host).
+
+Shared by the brick firmware (MicroPython) and the host tools (CPython).
+The datagram carries no names: both sides look them up in the per role
+tables below, in order.
+
+    header   KIND_TELEMETRY, fields = ROLE_*
+    payload  uint32 window_ms     time covered by these numbers
+             uint32 mem_free      gc.mem_free() when packed
+             uint32 mem_alloc
+             uint8  timers, uint8 counters
+             timers   x uint32 count, min, avg, max (us)
+             counters x uint32
+             uint8 gauges
+             gauges   x int32         current value, not reset (link state, RSSI)
+
+On the brick, timers are loop_stats.TimingStats, counters are bumped
+with `c.n += 1` and gauges set with `g.n = value`, all allocation free:
+
+    tel = Telemetry(ROLE_TOF)
+    t_read = tel.timer("read")
+    c_fail = tel.counter("send_fail")
+    ...
+    if tel.due(now):
+        tel.collect()
+        sock.sendto(tel.pack(now), (BROADCAST_IP, TELEMETRY_PORT))
+
+pack() only reads gc.mem_free() / gc.mem_alloc(), it does not collect.
+tel.collect() runs gc.collect() timed as the "gc" timer; the bricks call
+it once per report, at the point where they send it, so the pause shows
+up in the same datagram and mem_free is the heap right after it.
+"""
+
+import gc
+import time
+from struct import pack_into, unpack_from
+
+from loop_stats import TimingStats
+from tof_proto import HEADER_SIZE, KIND_TELEMETRY, pack_header, unpack_header
+
+ROLE_TOF = 1
+ROLE_SERVO = 2
+
+TIMERS = {
+    ROLE_TOF: ("read", "pack", "send", "period", "gc"),
+    ROLE_SERVO: ("drain", "apply", "gc"),
+}
+COUNTERS = {
+    ROLE_TOF: ("frames", "send_fail", "not_ready", "profile_changes", "link_down", "backlog_dropped",
+               "summaries"),
+    ROLE_SERVO: ("packets", "stale", "acks", "send_fail"),
+}
+GAUGES = {
+    ROLE_TOF: ("link", "rssi", "backlog"),
+    ROLE_SERVO: (),
+}
+ROLE_NAMES = {ROLE_TOF: "tof", ROLE_SERVO: "servo"}
+
+SUMMARY_FMT = "<IIIBB"
+SUMMARY_SIZE = 14
+TIMER_FMT = "<IIII"
+TIMER_SIZE = 16
+
+REPORT_EVERY_MS = 5000
+
+
+class Counter:
+    __slots__ = ("n",)
+
+    def __init__(self):
+        self.n = 0
+
+
+def _u32(v):
+    return min(max(0, v), 0xFFFFFFFF)
+
+
+class Telemetry:
+    """Brick side collector, see the module docstring."""
+
+    def __init__(self, role, every_ms=REPORT_EVERY_MS):
+        self.role = role
+        self.every_ms = every_ms
+        self.seq = 0
+        self.timers = [TimingStats() for _ in TIMERS[role]]
+        self.counters = [Counter() for _ in COUNTERS[role]]
+        self.gauges = [Counter() for _ in GAUGES[role]]
+        self.buf = bytearray(HEADER_SIZE + SUMMARY_SIZE + TIMER_SIZE * len(self.timers)
+                             + 4 * len(self.counters) + 1 + 4 * len(self.gauges))
+        self._gc = self.timer("gc")
+        self._start = time.ticks_ms()
+
+    def timer(self, name):
+        return self.timers[TIMERS[self.role].index(name)]
+
+    def counter(self, name):
+        return self.counters[COUNTERS[self.role].index(name)]
+
+    def gauge(self, name):
+        return self.gauges[GAUGES[self.role].index(name)]
+
+    def collect(self):
+        """gc.collect() timed as the "gc" timer, call it where a pause does not hurt."""
+        t0 = time.ticks_us()
+        gc.collect()
+        self._gc.add(time.ticks_diff(time.ticks_us(), t0))
+
+    def due(self, now):
+        return time.ticks_diff(now, self._start) >= self.every_ms
+
+    def pack(self, now):
+        """Fills the datagram, resets every timer and counter, returns the buffer."""
+        mem_free = gc.mem_free() if hasattr(gc, "mem_free") else 0
+        mem_alloc = gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0
+
+        buf = self.buf
+        pack_header(buf, 0, KIND_TELEMETRY, self.seq, 0, self.role, now)
+        self.seq = (self.seq + 1) & 0xFFFF
+        pack_into(SUMMARY_FMT, buf, HEADER_SIZE, _u32(time.ticks_diff(now, self._start)),
+                  mem_free, mem_alloc, len(self.timers), len(self.counters))
+        o = HEADER_SIZE + SUMMARY_SIZE
+        for t in self.timers:
+            pack_into(TIMER_FMT, buf, o, _u32(t.count), _u32(t.min), _u32(t.avg()), _u32(t.max))
+            t.reset()
+            o += TIMER_SIZE
+        for c in self.counters:
+            pack_into("<I", buf, o, _u32(c.n))
+            c.n = 0
+            o += 4
+        buf[o] = len(self.gauges)
+        o += 1
+        for g in self.gauges:
+            pack_into("<i", buf, o, g.n)
+            o += 4
+        self._start = now
+        return buf
+
+
+def unpack_telemetry(data):
+    """
+    Host side: returns a dict (role, seq, tick_ms, window_ms, mem_free,
+    mem_alloc, timers {name: (count, min, avg, max)}, counters {name: n},
+    gauges {name: value}) or None.
+    """
+    header = unpack_header(data)
+    if header is None or header[0] != KIND_TELEMETRY or len(data) < HEADER_SIZE + SUMMARY_SIZE:
+        return None
+    kind, seq, zones, role, tick_ms = header
+    window_ms, mem_free, mem_alloc, n_timers, n_counters = unpack_from(SUMMARY_FMT, data, HEADER_SIZE)
+    if len(data) < HEADER_SIZE + SUMMARY_SIZE + n_timers * TIMER_SIZE + n_counters * 4:
+        return None
+    timer_names = TIMERS.get(role, ())
+    counter_names = COUNTERS.get(role, ())
+    o = HEADER_SIZE + SUMMARY_SIZE
+    timers = {}
+    for i in range(n_timers):
+        name = timer_names[i] if i < len(timer_names) else "t%d" % i
+        timers[name] = unpack_from(TIMER_FMT, data, o)
+        o += TIMER_SIZE
+    counters = {}
+    for i in range(n_counters):
+        name = counter_names[i] if i < len(counter_names) else "c%d" % i
+        counters[name] = unpack_from("<I", data, o)[0]
+        o += 4
+    gauges = {}
+    if len(data) > o:
+        # older bricks end after the counters
+        gauge_names = GAUGES.get(role, ())
+        n_gauges = min(data[o], (len(data) - o - 1) // 4)
+        o += 1
+        for i in range(n_gauges):
+            name = gauge_names[i] if i < len(gauge_names) else "g%d" % i
+            gauges[name] = unpack_from("<i", data, o)[0]
+            o += 4
+    return {
+        "role": ROLE_NAMES.get(role, str(role)), "seq": seq, "tick_ms": tick_ms,
+        "window_ms": window_ms, "mem_free": mem_free, "mem_alloc": mem_alloc,
+        "timers": timers, "counters": counters, "gauges": gauges,
+    }
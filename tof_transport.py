@@ -0,0 +1,144 @@
+"""
+Where the brick sends its frames.
+
+Subnet broadcast goes out at the lowest basic 802.11 rate with no MAC
+retries, and every station on the network has to receive it. With
+subscriptions the host asks for the stream instead (OP_SUBSCRIBE on
+CONTROL_PORT, repeated as a keepalive) and the brick sends unicast, which
+the WiFi driver sends at the negotiated PHY rate and retries:
+
+    TRANSPORT_BROADCAST   every frame to the broadcast address (old behaviour)
+    TRANSPORT_SUBSCRIBE   unicast to each live subscriber
+    TRANSPORT_MULTICAST   one copy to MULTICAST_GROUP while anyone subscribed
+
+With no live subscriber the subscription modes fall back to broadcast, so
+hosts can still discover the brick and then subscribe (tof_control.py
+Subscription does that automatically). While subscribed, one datagram per
+BEACON_MS is still broadcast, so a second host finds the brick too and
+broadcast-only viewers see it is alive (at beacon rate). Subscribers expire after their
+lease, at most MAX_SUBSCRIBERS are kept; the oldest lease is replaced.
+"""
+
+import time
+from struct import unpack_from
+
+from tof_proto import (
+    HEADER_SIZE, KIND_CONTROL, OP_SUBSCRIBE, OP_UNSUBSCRIBE, MULTICAST_GROUP, unpack_header,
+)
+
+TRANSPORT_BROADCAST = "broadcast"
+TRANSPORT_SUBSCRIBE = "subscribe"
+TRANSPORT_MULTICAST = "multicast"
+
+MAX_SUBSCRIBERS = 4
+MAX_LEASE_S = 60
+BEACON_MS = 1000            # broadcast copy while subscribed, for discovery
+
+
+class FrameTransport:
+    """Sends frame datagrams according to the transport mode."""
+
+    def __init__(self, sock, broadcast_addr, mode=TRANSPORT_BROADCAST, max_subscribers=MAX_SUBSCRIBERS):
+        self.sock = sock
+        self.broadcast_addr = broadcast_addr
+        self.mode = mode
+        self.multicast_addr = (MULTICAST_GROUP, broadcast_addr[1])
+        self.addrs = [None] * max_subscribers       # (ip, port) per slot
+        self.expires = [0] * max_subscribers        # ticks_ms
+        self.count = 0                              # live subscribers
+        self.failed = 0                             # sendto() errors of the last send()
+        self._next_expiry = time.ticks_ms()
+        self._beacon_due = self._next_expiry
+
+    # -------------------- SUBSCRIPTIONS --------------------
+
+    def handle_control(self, data, addr):
+        """Handles OP_SUBSCRIBE / OP_UNSUBSCRIBE, returns False for anything else."""
+        header = unpack_header(data)
+        if (header is None or header[0] != KIND_CONTROL or len(data) < HEADER_SIZE + 3
+                or data[HEADER_SIZE] not in (OP_SUBSCRIBE, OP_UNSUBSCRIBE)):
+            return False
+        port = data[HEADER_SIZE + 1] | (data[HEADER_SIZE + 2] << 8)
+        if data[HEADER_SIZE] == OP_UNSUBSCRIBE:
+            self._remove(addr[0], port)
+        elif len(data) >= HEADER_SIZE + 5:
+            lease_s = unpack_from("<H", data, HEADER_SIZE + 3)[0]
+            self._add(addr[0], port, min(max(1, lease_s), MAX_LEASE_S))
+        return True
+
+    def _find(self, ip, port):
+        for i in range(len(self.addrs)):
+            a = self.addrs[i]
+            if a is not None and a[0] == ip and a[1] == port:
+                return i
+        return -1
+
+    def _add(self, ip, port, lease_s):
+        now = time.ticks_ms()
+        i = self._find(ip, port)
+        if i < 0:
+            # free slot, or the one closest to expiring
+            i = 0
+            for j in range(len(self.addrs)):
+                if self.addrs[j] is None:
+                    i = j
+                    break
+                if time.ticks_diff(self.expires[j], self.expires[i]) < 0:
+                    i = j
+            if self.addrs[i] is None:
+                self.count += 1
+            self.addrs[i] = (ip, port)
+            print("[TRANSPORT] subscriber %s:%d" % (ip, port))
+        self.expires[i] = time.ticks_add(now, lease_s * 1000)
+
+    def _remove(self, ip, port):
+        i = self._find(ip, port)
+        if i >= 0:
+            self.addrs[i] = None
+            self.count -= 1
+
+    def expire(self, now):
+        # checked once a second, not per frame
+        if time.ticks_diff(now, self._next_expiry) < 0:
+            return
+        self._next_expiry = time.ticks_add(now, 1000)
+        for i in range(len(self.addrs)):
+            if self.addrs[i] is not None and time.ticks_diff(now, self.expires[i]) >= 0:
+                print("[TRANSPORT] lease expired %s:%d" % self.addrs[i])
+                self.addrs[i] = None
+                self.count -= 1
+
+    # -------------------- SENDING --------------------
+
+    def send(self, buf):
+        """
+        Sends one datagram, returns True when every copy went out (False
+        feeds ProfileController.send_result() like a failed sendto).
+        """
+        sock = self.sock
+        self.failed = 0
+        if self.count and self.mode != TRANSPORT_BROADCAST:
+            now = time.ticks_ms()
+            if time.ticks_diff(now, self._beacon_due) >= 0:
+                self._beacon_due = time.ticks_add(now, BEACON_MS)
+                try:
+                    sock.sendto(buf, self.broadcast_addr)
+                except OSError:
+                    pass            # best effort, the next beacon follows
+        if self.count and self.mode == TRANSPORT_SUBSCRIBE:
+            for a in self.addrs:
+                if a is not None:
+                    try:
+                        sock.sendto(buf, a)
+                    except OSError:
+                        self.failed += 1
+            return not self.failed
+        addr = self.broadcast_addr
+        if self.count and self.mode == TRANSPORT_MULTICAST:
+            addr = self.multicast_addr
+        try:
+            sock.sendto(buf, addr)
+        except OSError:
+            self.failed = 1
+            return False
+        return True
@@ -0,0 +1,191 @@
+"""
+WiFi link supervision for the station mode bricks (MicroPython).
+
+WifiSupervisor is a low priority uasyncio task: it watches
+wlan.isconnected(), reconnects with exponential backoff when the link
+drops and samples the RSSI, all without blocking the ranging loop (every
+wait is an await, connect() itself returns at once).
+
+    wifi = WifiSupervisor(wlan, SSID, KEY)
+    asyncio.create_task(wifi.run())
+    ...
+    if wifi.up: ...
+
+FrameBacklog keeps the last `frames` datagrams in preallocated RAM while
+the link is down and sends them after the reconnect, oldest first. When
+full the oldest datagram makes room, except a keyframe (KIND_FRAME) with
+deltas stored behind it: the first of those deltas goes instead, since
+the others refer to the keyframe. While
+it is not empty new frames go through it too, so the host sees them in
+seq order and counts them as late rather than lost (receivers with
+max_age_ms=None, tof_aggregate.py or tof_capture.py, keep them):
+
+    if not wifi.up or backlog.count:
+        backlog.store(buf)
+        if wifi.up:
+            backlog.flush(send)         # transport.send() + failure counters
+    else:
+        transport.send(buf)
+"""
+
+import time
+
+import uasyncio as asyncio
+
+from tof_proto import KIND_FRAME, KIND_DELTA
+
+LINK_DOWN = 0
+LINK_CONNECTING = 1
+LINK_UP = 2
+
+CHECK_MS = 500              # isconnected() poll while the link is up
+POLL_MS = 100               # while connecting
+CONNECT_TIMEOUT_MS = 10_000
+BACKOFF_MIN_MS = 500
+BACKOFF_MAX_MS = 30_000
+RSSI_EVERY_MS = 2000
+
+BACKLOG_FRAMES = 20         # 1 s at 20 Hz
+FLUSH_PER_LOOP = 4          # backlog frames sent per ranging loop pass
+
+
+class WifiSupervisor:
+    """Keeps the station connected, see the module docstring."""
+
+    def __init__(self, wlan, ssid, key, connect_timeout_ms=CONNECT_TIMEOUT_MS,
+                 backoff_min_ms=BACKOFF_MIN_MS, backoff_max_ms=BACKOFF_MAX_MS, on_up=None):
+        self.wlan = wlan
+        self.ssid = ssid
+        self.key = key
+        self.connect_timeout_ms = connect_timeout_ms
+        self.backoff_min_ms = backoff_min_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.on_up = on_up
+        self.state = LINK_UP if wlan.isconnected() else LINK_DOWN
+        self.rssi = 0
+        self.outages = 0
+        self.attempts = 0           # reconnects tried in the current outage
+        self._down_ms = time.ticks_ms()
+        self._rssi_due = self._down_ms
+
+    @property
+    def up(self):
+        return self.state == LINK_UP
+
+    def _sample_rssi(self, now):
+        if time.ticks_diff(now, self._rssi_due) < 0:
+            return
+        self._rssi_due = time.ticks_add(now, RSSI_EVERY_MS)
+        try:
+            self.rssi = self.wlan.status("rssi")
+        except (OSError, ValueError):
+            pass
+
+    def _went_up(self):
+        self.state = LINK_UP
+        if self.attempts or self.outages:
+            print("[WIFI] link up after %d ms, %d attempt(s), ip %s" % (
+                time.ticks_diff(time.ticks_ms(), self._down_ms), self.attempts,
+                self.wlan.ifconfig()[0]))
+        self.attempts = 0
+        self._rssi_due = time.ticks_ms()
+        if self.on_up is not None:
+            self.on_up()
+
+    def _went_down(self):
+        self.state = LINK_DOWN
+        self.outages += 1
+        self._down_ms = time.ticks_ms()
+        print("[WIFI] link down, status %s" % self.wlan.status())
+
+    async def _connect(self):
+        self.state = LINK_CONNECTING
+        self.attempts += 1
+        try:
+            self.wlan.disconnect()
+            self.wlan.connect(self.ssid, self.key)
+        except OSError as e:
+            print("[WIFI] connect failed: %s" % e)
+            return False
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < self.connect_timeout_ms:
+            await asyncio.sleep_ms(POLL_MS)
+            if self.wlan.isconnected():
+                return True
+        return False
+
+    async def run(self):
+        backoff = self.backoff_min_ms
+        while True:
+            if self.wlan.isconnected():
+                if self.state != LINK_UP:
+                    self._went_up()
+                    backoff = self.backoff_min_ms
+                self._sample_rssi(time.ticks_ms())
+                await asyncio.sleep_ms(CHECK_MS)
+                continue
+
+            if self.state == LINK_UP:
+                self._went_down()
+            if await self._connect():
+                continue
+            self.state = LINK_DOWN
+            # jitter so bricks behind the same AP do not retry in lockstep
+            await asyncio.sleep_ms(backoff + time.ticks_us() % (backoff >> 2 or 1))
+            backoff = min(backoff * 2, self.backoff_max_ms)
+
+
+class FrameBacklog:
+    """Ring of the last `frames` datagrams, oldest overwritten first."""
+
+    def __init__(self, frames=BACKLOG_FRAMES, slot_size=512):
+        self.slot_size = slot_size
+        self.buf = bytearray(frames * slot_size)
+        self._mv = memoryview(self.buf)
+        self.lengths = [0] * frames
+        self.head = 0               # oldest stored frame
+        self.count = 0
+        self.dropped = 0            # overwritten or too large, never sent
+
+    def store(self, data):
+        n = len(data)
+        frames = len(self.lengths)
+        if n > self.slot_size:
+            self.dropped += 1
+            return
+        if self.count == frames:
+            # full: the oldest frame makes room ...
+            head = self.head
+            nxt = (head + 1) % frames
+            o, k = head * self.slot_size, nxt * self.slot_size
+            buf = self.buf
+            if buf[o + 3] == KIND_FRAME and buf[k + 3] == KIND_DELTA:
+                # ... unless deltas behind it need it: the keyframe takes
+                # the place of the oldest delta instead
+                n_key = self.lengths[head]
+                self._mv[k:k + n_key] = self._mv[o:o + n_key]
+                self.lengths[nxt] = n_key
+            self.head = nxt
+            self.count -= 1
+            self.dropped += 1
+        i = (self.head + self.count) % frames
+        o = i * self.slot_size
+        self._mv[o:o + n] = data
+        self.lengths[i] = n
+        self.count += 1
+
+    def flush(self, send, max_frames=FLUSH_PER_LOOP):
+        """
+        Sends up to `max_frames` stored frames with send(datagram) -> bool,
+        stops at the first failure (the frame stays). Returns frames sent.
+        """
+        sent = 0
+        frames = len(self.lengths)
+        while self.count and sent < max_frames:
+            o = self.head * self.slot_size
+            if not send(self._mv[o:o + self.lengths[self.head]]):
+                break
+            self.head = (self.head + 1) % frames
+            self.count -= 1
+            sent += 1
+        return sent
@@ -0,0 +1,33 @@
+"""
+Await UDP socket readiness from uasyncio.
+
+uasyncio has no datagram streams, but its scheduler already polls sockets
+for StreamReader: parking the task in that poll queue wakes it as soon as
+a datagram is pending, with no fixed sleep in between.
+
+    await readable(sock)
+    data, addr = sock.recvfrom(...)     # will not raise EAGAIN now
+"""
+
+import sys
+
+if sys.implementation.name == "micropython":
+    from uasyncio import core
+
+    async def readable(sock):
+        """Returns once `sock` has data to read."""
+        yield core._io_queue.queue_read(sock)
+
+else:
+    # CPython (host tests, sim/): same contract on top of asyncio
+    import asyncio
+
+    async def readable(sock):
+        """Returns once `sock` has data to read."""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(sock, ready.set_result, None)
+        try:
+            await ready
+        finally:
+            loop.remove_reader(sock)
@@ -1,57 +1,127 @@
-import socket, struct
+import time
+
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D  # needed for 3D
 
+from tof_receiver import FrameReceiver
+from tof_ring import FrameRing
+from tof_points import ray_table, to_points
+
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5005
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind((UDP_IP, UDP_PORT))
-
 near, far = 10, 2500  # mm range for display
 N = 5                # frames in rolling buffer
-buffer = []
+MAX_AGE_MS = 250     # late frames are skipped instead of rendered
+RENDER_HZ = 10       # display rate, independent of the packet rate (None = every frame)
 
-# --- prepare 3D plot ---
+# recv + decode run on their own thread, a slow redraw no longer lets the
+# socket backlog grow; every frame is recv_into'd and copied into the
+# preallocated ring, which keeps a running sum for the average
+buffer = FrameRing(N)
+rx = FrameReceiver(UDP_PORT, UDP_IP, max_age_ms=MAX_AGE_MS, queue_size=0, ring=buffer).start()
+frame = None
+
+# --- prepare 3D plot, artists are created once and updated in place ---
 plt.ion()
 fig = plt.figure()
 ax = fig.add_subplot(111, projection='3d')
-X, Y = np.meshgrid(np.arange(8), np.arange(8))
-surf = None
-
-while True:
-    data, addr = sock.recvfrom(128)  # 64 uint16 values
-    if len(data) == 128:
-        dist = struct.unpack("<64H", data)
-        matrix = np.array(dist, dtype=np.float32).reshape((8, 8))
-
-        # --- update rolling buffer ---
-        buffer.append(matrix)
-        if len(buffer) > N:
-            buffer.pop(0)
-
-        # --- smoothing ---
-        smooth = np.mean(buffer, axis=0)
-
-        # --- OpenCV visualization (colormap) ---
-        norm = (np.clip(smooth - near, 0, far - near) / (far - near) * 255).astype(np.uint8)
-        img = cv2.resize(norm, (400, 400), interpolation=cv2.INTER_NEAREST)
-        img_color = cv2.applyColorMap(img, cv2.COLORMAP_JET)
-        cv2.imshow("TOF 8x8 filtered", img_color)
-
-        # --- 3D mesh plot ---
-        ax.clear()
-        surf = ax.plot_surface(X, Y, smooth, cmap='viridis')
-        ax.set_zlim(near, far)
-        ax.set_title("TOF 8x8 Surface")
-        plt.pause(0.01)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-sock.close()
+smooth = np.zeros((8, 8), dtype=np.float32)
+rays = ray_table(8)     # zone -> unit ray in the sensor FOV, points in metres
+points = to_points(smooth, rays)
+xy = np.empty((len(points), 2), dtype=points.dtype)   # scatter offsets, reused
+
+cloud = ax.scatter(points[:, 0], points[:, 2], -points[:, 1], c=points[:, 2], cmap='viridis',
+                   vmin=near / 1000, vmax=far / 1000)
+ax.set_xlim(-far / 2000, far / 2000)
+ax.set_ylim(0, far / 1000)
+ax.set_zlim(-far / 2000, far / 2000)
+ax.set_xlabel("x [m]")
+ax.set_ylabel("z [m]")
+ax.set_title("TOF 8x8 Point cloud")
+status = fig.text(0.02, 0.02, "waiting for frames...", family="monospace")
+plt.show(block=False)
+
+
+def quit_requested():
+    # also pumps the OpenCV window, call it on every pass, frame or not
+    return cv2.waitKey(1) & 0xFF == ord('q')
+
+
+period = 1.0 / RENDER_HZ if RENDER_HZ else 0.0
+next_render = time.monotonic()
+renders = 0
+fps_t0 = next_render
+fps = 0.0
+
+while plt.fignum_exists(fig.number):
+    if RENDER_HZ:
+        # keep the GUI responsive until the next display tick
+        remaining = next_render - time.monotonic()
+        if remaining > 0:
+            fig.canvas.start_event_loop(remaining)
+        next_render = max(next_render + period, time.monotonic())
+        latest = rx.latest(buffer.source)     # the brick the ring averages
+        if latest is None or latest is frame:
+            fig.canvas.flush_events()
+            if quit_requested():
+                break
+            continue
+        # intermediate frames only went into the ring average
+        frame = latest
+    else:
+        frame = rx.wait(timeout=0.5, newer_than=frame)
+        if frame is None:
+            fig.canvas.flush_events()
+            if quit_requested():
+                break
+            continue
+
+    # --- smoothing (running mean of the last N frames, O(64)) ---
+    with rx.lock:
+        if buffer.side != smooth.shape[0]:
+            # resolution changed (4x4 <-> 8x8)
+            rays = ray_table(buffer.side)
+            smooth = np.zeros((buffer.side, buffer.side), dtype=np.float32)
+        np.copyto(smooth, buffer.mean())
+
+    # --- OpenCV visualization (colormap) ---
+    norm = (np.clip(smooth - near, 0, far - near) / (far - near) * 255).astype(np.uint8)
+    img = cv2.resize(norm, (400, 400), interpolation=cv2.INTER_NEAREST)
+    img_color = cv2.applyColorMap(img, cv2.COLORMAP_JET)
+    cv2.imshow("TOF 8x8 filtered", img_color)
+
+    # --- 3D point cloud (x right, y down, z away from the sensor) ---
+    points = to_points(smooth, rays, out=points if len(points) == smooth.size else None)
+    if len(xy) != len(points):
+        xy = np.empty((len(points), 2), dtype=points.dtype)
+    xy[:, 0] = points[:, 0]
+    xy[:, 1] = points[:, 2]
+    # public 3D scatter update: 2D offsets, then the third axis
+    cloud.set_offsets(xy)
+    cloud.set_3d_properties(-points[:, 1], "z")
+    cloud.set_array(points[:, 2])
+
+    renders += 1
+    now = time.monotonic()
+    if now - fps_t0 >= 1.0:
+        fps = renders / (now - fps_t0)
+        renders = 0
+        fps_t0 = now
+    # receive -> display delay, plus the link delay the decoder estimated
+    age_ms = (now - frame.recv_time) * 1000 + frame.age_ms
+    status.set_text("render %4.1f fps   frame age %4.0f ms   seq %s" % (fps, age_ms, frame.seq))
+
+    fig.canvas.draw_idle()
+    fig.canvas.flush_events()
+
+    if quit_requested():
+        break
+
+print(rx.stats())
+rx.stop()
 cv2.destroyAllWindows()
 plt.ioff()
 plt.show()
@@ -1,9 +1,10 @@
-import socket
-import struct
 import numpy as np
 import cv2
 import time
 
+from tof_filter import FilterBank
+from tof_receiver import FrameReceiver
+
 # -------------------- CONFIG --------------------
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5005
@@ -12,42 +13,46 @@ UDP_PORT = 5005
 NEAR_MM = 100         # Objects closer than this are RED (Hot)
 FAR_MM = 2000         # Objects further than this are BLUE (Cold)
 
-FRAME_SIZE = 8        # 8x8 TOF
+FRAME_SIZE = 8        # 8x8 TOF (4x4 frames are upscaled by the filter)
 SMOOTH_ALPHA = 0.3    # Lower = smoother but more lag (0.0 to 1.0)
+HAMPEL_K = 3.0        # single-frame spikes further than this many MADs are replaced, None = off
+HOLD_FRAMES = 5       # zones without a target keep their last distance this many frames
 DISPLAY_SIZE = 600    # Window size in pixels
+MAX_AGE_MS = 250      # Frames delayed more than this are dropped, not drawn
+SOURCE_IP = None      # Brick to show, None = the first one heard (tof_aggregate.py for all)
 
-# -------------------- SETUP SOCKET --------------------
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-# Allow rebinding immediately if script restarts
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-sock.bind((UDP_IP, UDP_PORT))
-sock.setblocking(False)
+# -------------------- SETUP RECEIVER --------------------
+# Socket is read + decoded on a background thread (SO_REUSEADDR, big SO_RCVBUF)
+rx = FrameReceiver(UDP_PORT, UDP_IP, max_age_ms=MAX_AGE_MS).start()
 
 print(f"Listening on port {UDP_PORT}...")
 
 # -------------------- INITIALIZATION --------------------
+# Validity mask + Hampel outlier rejection + EMA + hold-last-valid, in place
+bank = FilterBank(1, alpha=SMOOTH_ALPHA, hampel_k=HAMPEL_K, hold=HOLD_FRAMES)
 # Initialize 'smooth' grid to FAR_MM so the screen starts empty (blue)
 smooth_grid = np.full((FRAME_SIZE, FRAME_SIZE), FAR_MM, dtype=np.float32)
+frames = []
+source = None
 
 try:
     while True:
-        data_found = False
-        
-        # --- 1. DRAIN THE SOCKET ---
-        # Loop until error to ensure we get the absolute LATEST packet
-        try:
-            while True:
-                data, addr = sock.recvfrom(4096) # Request more than 128 to be safe
-                if len(data) == 128:
-                    # We have a valid packet
-                    raw = struct.unpack("<64H", data)
-                    new_grid = np.array(raw, dtype=np.float32).reshape((FRAME_SIZE, FRAME_SIZE))
-                    
-                    # Exponential smoothing
-                    smooth_grid = (SMOOTH_ALPHA * new_grid) + ((1 - SMOOTH_ALPHA) * smooth_grid)
-                    data_found = True
-        except BlockingIOError:
-            pass # Buffer is empty, move on
+        # --- 1. DRAIN THE RECEIVER ---
+        # Every frame that arrived since the last pass, oldest first
+        frames.clear()
+        for frame in rx.drain():
+            # Several bricks share the port, never blend them into one grid
+            if source is None and SOURCE_IP in (None, frame.source[0]):
+                source = frame.source
+                print(f"Showing {source[0]}:{source[1]}")
+            if frame.source == source:
+                frames.append(frame)
+
+        # Filter the whole batch at once, zones with no target read as far away
+        data_found = bank.push_frames(frames) > 0
+        if data_found:
+            np.copyto(smooth_grid, FAR_MM)
+            np.copyto(smooth_grid, bank.grids()[0], where=bank.valid[0].reshape(FRAME_SIZE, FRAME_SIZE))
         
         # --- 2. VISUALIZATION ---
         # Update visualization even if no new data came (to keep window responsive)
@@ -74,6 +79,7 @@ try:
         time.sleep(0.001)
 
 finally:
-    sock.close()
+    print(rx.stats())
+    rx.stop()
     cv2.destroyAllWindows()
     print("Socket closed.")
\ No newline at end of file